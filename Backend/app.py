@@ -1,22 +1,36 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from database import init_db, SessionLocal
 from models import (FundBasicInfo, FundTrend, FundEstimate, FundPortfolio, 
                     FundExtraData, FundWatchlist, FundWatchlistGroup, 
-                    FundRiskMetrics, FundScreeningRank)
-from fund_api import FundAPI
-from fund_list_cache import get_fund_list_cache
+                    FundRiskMetrics, FundScreeningRank, FundFetchState)
+from fund_api import FundAPI, NOT_MODIFIED
+from fund_list_cache import get_fund_list_cache, FundRankingFetcher
 from ai_service import get_ai_service
 from fund_master_routes import fund_master_bp
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, and_, or_, func
+from http_client import get_http_client
+from fund_detail_cache import FundDetailCache
+from watchlist_snapshot import WatchlistSnapshot, watchlist_etag
+from singleflight import get_singleflight
+from risk_metrics import RISK_METRIC_FIELDS, calculate_risk_metrics
+from cached_fund import CachedFund, load_cached_fund, load_nav_trend
+from fund_store import upsert_fund_payloads, upsert_fetch_states, upsert_estimates, touch_trends
+from estimate_refresh import refresh_estimates, is_estimate_fresh
+from estimate_poller import get_estimate_poller
+from market_prefetch import get_market_prefetcher
+from swr_cache import get_cache_stats
+from screening_rankings import SAME_TYPE_RANKING_SQL, ranking_params, parse_return_columns
+from crawler import FundCrawler, HostRateLimiter, DEFAULT_WORKERS as DEFAULT_CRAWL_WORKERS
+import screening_jobs
+from sqlalchemy.orm import Session, defer
+from sqlalchemy import desc, asc, and_, or_, func, text
 from datetime import datetime, timedelta
 import json
 import math
+import os
 import threading
 import time
 import re
-import requests
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -37,6 +51,11 @@ def teardown_db(exception):
 
 # 初始化数据库
 init_db()
+# 上次进程中未结束的批量更新任务标记为中断，可从断点继续
+with SessionLocal() as _db:
+    _interrupted = screening_jobs.recover_interrupted_jobs(_db)
+    if _interrupted:
+        print(f"[批量更新] 发现 {_interrupted} 个中断的任务，可从断点继续")
 fund_api = FundAPI()
 fund_list_cache = get_fund_list_cache()
 
@@ -51,59 +70,22 @@ def _json_loads(data, default):
     except Exception:
         return default
 
-def _build_cached_response(db: Session, fund_code: str):
-    basic = db.query(FundBasicInfo).filter(FundBasicInfo.fund_code == fund_code).first()
-    trend = db.query(FundTrend).filter(FundTrend.fund_code == fund_code).first()
-    estimate = db.query(FundEstimate).filter(FundEstimate.fund_code == fund_code).first()
-    portfolio = db.query(FundPortfolio).filter(FundPortfolio.fund_code == fund_code).first()
-    extra = db.query(FundExtraData).filter(FundExtraData.fund_code == fund_code).first()
-
-    if not any([basic, trend, estimate, portfolio, extra]):
-        return None
-
-    data = {}
+def _load_nav_trend(trend):
+    """读取 FundTrend 记录的单位净值走势"""
+    return load_nav_trend(trend.fund_code, trend.net_worth_trend_blob, trend.net_worth_trend_json)
 
-    if basic:
-        data['basic_info'] = _json_loads(basic.basic_json, {})
-        data['performance'] = _json_loads(basic.performance_json, {})
-
-    if trend:
-        data['net_worth_trend'] = _json_loads(trend.net_worth_trend_json, [])
-        data['accumulated_net_worth'] = _json_loads(trend.accumulated_net_worth_json, [])
-        data['position_trend'] = _json_loads(trend.position_trend_json, [])
-        data['total_return_trend'] = _json_loads(trend.total_return_trend_json, [])
-        data['ranking_trend'] = _json_loads(trend.ranking_trend_json, [])
-        data['ranking_percentage'] = _json_loads(trend.ranking_percentage_json, [])
-        data['scale_fluctuation'] = _json_loads(trend.scale_fluctuation_json, {})
-
-    if estimate:
-        data['realtime_estimate'] = {
-            'name': estimate.name,
-            'fund_code': fund_code,
-            'net_worth': estimate.net_worth,
-            'net_worth_date': estimate.net_worth_date,
-            'estimate_value': estimate.estimate_value,
-            'estimate_change': estimate.estimate_change,
-            'estimate_time': estimate.estimate_time
-        }
-
-    if portfolio:
-        data['portfolio'] = {
-            'stock_codes': _json_loads(portfolio.stock_codes_json, []),
-            'bond_codes': _json_loads(portfolio.bond_codes_json, []),
-            'stock_codes_new': _json_loads(portfolio.stock_codes_new_json, []),
-            'bond_codes_new': _json_loads(portfolio.bond_codes_new_json, [])
-        }
-
-    if extra:
-        data['holder_structure'] = _json_loads(extra.holder_structure_json, {})
-        data['asset_allocation'] = _json_loads(extra.asset_allocation_json, {})
-        data['performance_evaluation'] = _json_loads(extra.performance_evaluation_json, {})
-        data['fund_managers'] = _json_loads(extra.fund_managers_json, [])
-        data['subscription_redemption'] = _json_loads(extra.subscription_redemption_json, {})
-        data['same_type_funds'] = _json_loads(extra.same_type_funds_json, [])
+def _build_cached_response(db: Session, fund_code: str):
+    """
+    读取数据库中缓存的基金详情（一条联表查询，见 cached_fund.py），没有数据时返回 None
+    返回的 CachedFund 按需解码各数据段，响应时用 _fund_json_response 直接拼接原始 JSON
+    """
+    return load_cached_fund(db, fund_code)
 
-    return data
+def _fund_json_response(data, **extra):
+    """基金详情响应：CachedFund 直接拼接库中的 JSON 文本，普通字典走 jsonify"""
+    if isinstance(data, CachedFund):
+        return app.response_class(data.to_json(extra), mimetype='application/json')
+    return jsonify({**data, **extra})
 
 @app.route('/')
 def hello():
@@ -136,181 +118,123 @@ def update_search_database():
     else:
         return jsonify(result), 500
 
+# 基金详情新鲜度策略（秒）：
+# - 未超过 FRESH 直接返回缓存
+# - 超过 FRESH 但未超过 MAX_STALE 先返回缓存，后台重新获取
+# - 超过 MAX_STALE 或无缓存时同步请求上游
+FUND_DETAIL_FRESH_SECONDS = int(os.environ.get('FUND_DETAIL_FRESH_SECONDS', 300))
+FUND_DETAIL_MAX_STALE_SECONDS = int(os.environ.get('FUND_DETAIL_MAX_STALE_SECONDS', 86400))
+fund_detail_cache = FundDetailCache(max_size=256)
+watchlist_snapshot = WatchlistSnapshot()
+
+
+def _risk_metrics_from_record(risk_record):
+    """风险指标记录（CachedFund.risk_record）-> 接口返回的风险指标字典"""
+    return {field: risk_record[field] for field in RISK_METRIC_FIELDS}
+
+
+def _save_fund_detail_to_db(db: Session, fund_code: str, fund_data: dict):
+    """
+    保存详情接口获取的完整数据（基本信息、走势、估值、持仓、扩展数据、风险指标）
+    风险指标会附加到 fund_data['risk_metrics']
+    """
+    # 【数据一致性】同时更新风险指标，确保详情/对比/筛选数据统一
+    risk_metrics = None
+    net_worth_trend = fund_data.get('net_worth_trend', [])
+    if net_worth_trend and len(net_worth_trend) >= 30:
+        risk_metrics = calculate_risk_metrics(net_worth_trend)
+        if risk_metrics:
+            # 将风险指标也附加到返回数据中
+            fund_data['risk_metrics'] = risk_metrics
+
+    try:
+        upsert_fund_payloads(db, [(fund_code, fund_data, risk_metrics)])
+        db.commit()
+    except Exception as e:
+        print(f"Error saving to database: {e}")
+        db.rollback()
+
+
+def _fetch_and_save_fund_detail(db: Session, fund_code: str):
+    fund_data = fund_api.get_fund_data(fund_code)
+    if not fund_data:
+        return None
+    _save_fund_detail_to_db(db, fund_code, fund_data)
+    fund_detail_cache.set(fund_code, fund_data)
+    return fund_data
+
+
+def _fetch_fund_detail(db: Session, fund_code: str):
+    """
+    从上游获取基金详情，写入数据库并更新详情缓存，失败返回 None
+    详情、对比、AI 分析共用；同一基金的并发调用只请求与写库一次，共享同一结果（调用方不要修改返回的字典）
+    """
+    return get_singleflight().do(('detail', fund_code), _fetch_and_save_fund_detail, db, fund_code)
+
+
+def _load_fund_detail_from_db(db: Session, fund_code: str):
+    """从数据库读取基金详情，返回 (数据, 数据时间)；没有走势数据时视为未缓存"""
+    data = _build_cached_response(db, fund_code)
+    if data is None or data.trend_time is None:
+        return None, None
+    risk_record = data.risk_record
+    if risk_record and risk_record['sharpe_ratio_1y'] is not None:
+        data.set_extra('risk_metrics', _risk_metrics_from_record(risk_record))
+    return data, data.trend_time
+
+
+def _revalidate_fund_detail(fund_code):
+    """后台重新验证（在详情缓存的线程池中执行）"""
+    db = SessionLocal()
+    try:
+        _fetch_fund_detail(db, fund_code)
+    finally:
+        db.close()
+
+
 @app.route('/api/fund/<fund_code>', methods=['GET'])
 def get_fund_detail(fund_code):
     """
     获取基金详细信息
     
-    数据一致性策略：
-    - 每次访问都从API获取最新数据
-    - 同时更新所有相关表（FundBasicInfo, FundTrend, FundRiskMetrics等）
-    - 确保详情、对比、筛选三个模块的数据源统一
+    读穿透缓存策略（stale-while-revalidate）：
+    - 依次查找内存缓存、数据库，数据足够新时直接返回（毫秒级）
+    - 数据过期但在最大容忍时间内时先返回旧数据，后台重新获取并更新所有相关表
+    - 无缓存、超过最大容忍时间或 ?refresh=true 时同步请求上游
+    - 上游失败时回退到数据库中的旧数据
+    返回数据中 data_source 为 memory / cache / api / stale_cache
     """
     if not fund_code:
         return jsonify({"error": "Fund code is required"}), 400    
     db = get_db() # 获取数据库会话
+    force_refresh = request.args.get('refresh', 'false').lower() == 'true'
     
-    # 使用新的 get_fund_data 方法获取清洗后的完整数据
-    fund_data = fund_api.get_fund_data(fund_code)
-    
+    if not force_refresh:
+        data, fetched_at = fund_detail_cache.get(fund_code)
+        source = 'memory'
+        if data is None:
+            data, fetched_at = _load_fund_detail_from_db(db, fund_code)
+            source = 'cache'
+            if data is not None:
+                fund_detail_cache.set(fund_code, data, fetched_at)
+        
+        if data is not None:
+            age = (datetime.now() - fetched_at).total_seconds()
+            if age < FUND_DETAIL_MAX_STALE_SECONDS:
+                fund_detail_cache.record('memory_hits' if source == 'memory' else 'db_hits')
+                if age >= FUND_DETAIL_FRESH_SECONDS:
+                    fund_detail_cache.revalidate(fund_code, _revalidate_fund_detail)
+                return _fund_json_response(data, data_source=source, cache_time=fetched_at.isoformat())
+    
+    fund_detail_cache.record('misses')
+    fund_data = _fetch_fund_detail(db, fund_code)
     if fund_data:
-        basic_info = fund_data.get('basic_info', {})
-        performance = fund_data.get('performance', {})
-        trend = {
-            'net_worth_trend': fund_data.get('net_worth_trend', []),
-            'accumulated_net_worth': fund_data.get('accumulated_net_worth', []),
-            'position_trend': fund_data.get('position_trend', []),
-            'total_return_trend': fund_data.get('total_return_trend', []),
-            'ranking_trend': fund_data.get('ranking_trend', []),
-            'ranking_percentage': fund_data.get('ranking_percentage', []),
-            'scale_fluctuation': fund_data.get('scale_fluctuation', {})
-        }
-        estimate = fund_data.get('realtime_estimate', {})
-        portfolio = fund_data.get('portfolio', {})
-        extra = {
-            'holder_structure': fund_data.get('holder_structure', {}),
-            'asset_allocation': fund_data.get('asset_allocation', {}),
-            'performance_evaluation': fund_data.get('performance_evaluation', {}),
-            'fund_managers': fund_data.get('fund_managers', []),
-            'subscription_redemption': fund_data.get('subscription_redemption', {}),
-            'same_type_funds': fund_data.get('same_type_funds', [])
-        }
-
-        basic_record = db.query(FundBasicInfo).filter(FundBasicInfo.fund_code == fund_code).first()
-        if basic_record:
-            basic_record.fund_name = basic_info.get('fund_name')
-            basic_record.fund_type = basic_info.get('fund_type')
-            basic_record.original_rate = basic_info.get('original_rate')
-            basic_record.current_rate = basic_info.get('current_rate')
-            basic_record.min_subscription_amount = basic_info.get('min_subscription_amount')
-            basic_record.is_hb = basic_info.get('is_hb')
-            basic_record.basic_json = _json_dumps(basic_info)
-            basic_record.performance_json = _json_dumps(performance)
-            # 设置可排序的收益率字段
-            try:
-                basic_record.return_1y = float(performance.get('1_year_return')) if performance.get('1_year_return') else None
-            except (ValueError, TypeError):
-                basic_record.return_1y = None
-        else:
-            # 解析收益率用于排序
-            return_1y_val = None
-            try:
-                return_1y_val = float(performance.get('1_year_return')) if performance.get('1_year_return') else None
-            except (ValueError, TypeError):
-                pass
-            basic_record = FundBasicInfo(
-                fund_code=fund_code,
-                fund_name=basic_info.get('fund_name') or fund_code,
-                fund_type=basic_info.get('fund_type'),
-                original_rate=basic_info.get('original_rate'),
-                current_rate=basic_info.get('current_rate'),
-                min_subscription_amount=basic_info.get('min_subscription_amount'),
-                is_hb=basic_info.get('is_hb'),
-                return_1y=return_1y_val,
-                basic_json=_json_dumps(basic_info),
-                performance_json=_json_dumps(performance)
-            )
-            db.add(basic_record)
-
-        trend_record = db.query(FundTrend).filter(FundTrend.fund_code == fund_code).first()
-        if trend_record:
-            trend_record.net_worth_trend_json = _json_dumps(trend['net_worth_trend'])
-            trend_record.accumulated_net_worth_json = _json_dumps(trend['accumulated_net_worth'])
-            trend_record.position_trend_json = _json_dumps(trend['position_trend'])
-            trend_record.total_return_trend_json = _json_dumps(trend['total_return_trend'])
-            trend_record.ranking_trend_json = _json_dumps(trend['ranking_trend'])
-            trend_record.ranking_percentage_json = _json_dumps(trend['ranking_percentage'])
-            trend_record.scale_fluctuation_json = _json_dumps(trend['scale_fluctuation'])
-        else:
-            trend_record = FundTrend(
-                fund_code=fund_code,
-                net_worth_trend_json=_json_dumps(trend['net_worth_trend']),
-                accumulated_net_worth_json=_json_dumps(trend['accumulated_net_worth']),
-                position_trend_json=_json_dumps(trend['position_trend']),
-                total_return_trend_json=_json_dumps(trend['total_return_trend']),
-                ranking_trend_json=_json_dumps(trend['ranking_trend']),
-                ranking_percentage_json=_json_dumps(trend['ranking_percentage']),
-                scale_fluctuation_json=_json_dumps(trend['scale_fluctuation'])
-            )
-            db.add(trend_record)
-
-        estimate_record = db.query(FundEstimate).filter(FundEstimate.fund_code == fund_code).first()
-        if estimate_record:
-            estimate_record.name = estimate.get('name')
-            estimate_record.net_worth = estimate.get('net_worth')
-            estimate_record.net_worth_date = estimate.get('net_worth_date')
-            estimate_record.estimate_value = estimate.get('estimate_value')
-            estimate_record.estimate_change = estimate.get('estimate_change')
-            estimate_record.estimate_time = estimate.get('estimate_time')
-        else:
-            estimate_record = FundEstimate(
-                fund_code=fund_code,
-                name=estimate.get('name'),
-                net_worth=estimate.get('net_worth'),
-                net_worth_date=estimate.get('net_worth_date'),
-                estimate_value=estimate.get('estimate_value'),
-                estimate_change=estimate.get('estimate_change'),
-                estimate_time=estimate.get('estimate_time')
-            )
-            db.add(estimate_record)
-
-        portfolio_record = db.query(FundPortfolio).filter(FundPortfolio.fund_code == fund_code).first()
-        if portfolio_record:
-            portfolio_record.stock_codes_json = _json_dumps(portfolio.get('stock_codes', []))
-            portfolio_record.bond_codes_json = _json_dumps(portfolio.get('bond_codes', []))
-            portfolio_record.stock_codes_new_json = _json_dumps(portfolio.get('stock_codes_new', []))
-            portfolio_record.bond_codes_new_json = _json_dumps(portfolio.get('bond_codes_new', []))
-        else:
-            portfolio_record = FundPortfolio(
-                fund_code=fund_code,
-                stock_codes_json=_json_dumps(portfolio.get('stock_codes', [])),
-                bond_codes_json=_json_dumps(portfolio.get('bond_codes', [])),
-                stock_codes_new_json=_json_dumps(portfolio.get('stock_codes_new', [])),
-                bond_codes_new_json=_json_dumps(portfolio.get('bond_codes_new', []))
-            )
-            db.add(portfolio_record)
-
-        extra_record = db.query(FundExtraData).filter(FundExtraData.fund_code == fund_code).first()
-        if extra_record:
-            extra_record.holder_structure_json = _json_dumps(extra['holder_structure'])
-            extra_record.asset_allocation_json = _json_dumps(extra['asset_allocation'])
-            extra_record.performance_evaluation_json = _json_dumps(extra['performance_evaluation'])
-            extra_record.fund_managers_json = _json_dumps(extra['fund_managers'])
-            extra_record.subscription_redemption_json = _json_dumps(extra['subscription_redemption'])
-            extra_record.same_type_funds_json = _json_dumps(extra['same_type_funds'])
-        else:
-            extra_record = FundExtraData(
-                fund_code=fund_code,
-                holder_structure_json=_json_dumps(extra['holder_structure']),
-                asset_allocation_json=_json_dumps(extra['asset_allocation']),
-                performance_evaluation_json=_json_dumps(extra['performance_evaluation']),
-                fund_managers_json=_json_dumps(extra['fund_managers']),
-                subscription_redemption_json=_json_dumps(extra['subscription_redemption']),
-                same_type_funds_json=_json_dumps(extra['same_type_funds'])
-            )
-            db.add(extra_record)
-
-        # 【数据一致性】同时更新风险指标，确保详情/对比/筛选数据统一
-        net_worth_trend = fund_data.get('net_worth_trend', [])
-        if net_worth_trend and len(net_worth_trend) >= 30:
-            risk_metrics = calculate_risk_metrics(net_worth_trend)
-            if risk_metrics:
-                _save_risk_metrics(db, fund_code, risk_metrics)
-                # 将风险指标也附加到返回数据中
-                fund_data['risk_metrics'] = risk_metrics
-
-        try:
-            db.commit()
-        except Exception as e:
-            print(f"Error saving to database: {e}")
-            db.rollback()
-
-        return jsonify(fund_data)
+        return jsonify({**fund_data, 'data_source': 'api'})
     
     # 如果API获取失败，尝试从数据库获取缓存数据作为兜底
     cached_data = _build_cached_response(db, fund_code)
     if cached_data:
-        return jsonify(cached_data)
+        return _fund_json_response(cached_data, data_source='stale_cache')
 
     return jsonify({"error": "Fund not found"}), 404
 
@@ -364,10 +288,11 @@ def analyze_fund(fund_code):
     if not fund_code:
         return jsonify({"error": "Fund code is required"}), 400
     
-    # 1. 获取基金数据
-    fund_data = fund_api.get_fund_data(fund_code)
+    # 1. 获取基金数据（与详情接口合并并发请求，并顺带更新数据库）
+    fund_data = _fetch_fund_detail(get_db(), fund_code)
     if not fund_data:
         return jsonify({"error": "Fund data not found"}), 404
+    fund_data = dict(fund_data)
         
     # 2. 调用 AI 服务进行分析
     try:
@@ -387,7 +312,7 @@ def get_fund_basic(fund_code):
     """获取基金基础信息 实时调用API"""
     if not fund_code:
         return jsonify({"error": "Fund code is required"}), 400
-    fund_data = fund_api.get_fund_data(fund_code)
+    fund_data = fund_api.get_fund_data(fund_code, sections=['basic_info', 'performance'])
     if fund_data and fund_data.get('basic_info'):
         result = {
             **fund_data.get('basic_info', {}),
@@ -410,7 +335,7 @@ def get_fund_trend(fund_code):
     if not fund_code:
         return jsonify({"error": "Fund code is required"}), 400
     
-    fund_data = fund_api.get_fund_data(fund_code)
+    fund_data = fund_api.get_fund_data(fund_code, sections=['net_worth_trend', 'accumulated_net_worth'])
     if fund_data and 'net_worth_trend' in fund_data:
         return jsonify({
             "net_worth_trend": fund_data['net_worth_trend'],
@@ -421,7 +346,7 @@ def get_fund_trend(fund_code):
     trend = db.query(FundTrend).filter(FundTrend.fund_code == fund_code).first()
     if trend:
         return jsonify({
-            "net_worth_trend": _json_loads(trend.net_worth_trend_json, []),
+            "net_worth_trend": _load_nav_trend(trend),
             "accumulated_net_worth": _json_loads(trend.accumulated_net_worth_json, [])
         })
 
@@ -432,48 +357,22 @@ def get_fund_trend(fund_code):
 
 @app.route('/api/watchlist', methods=['GET'])
 def get_watchlist():
-    """获取自选基金列表（按分组和排序顺序）"""
+    """
+    获取自选基金列表（按分组和排序顺序）
+    响应带 ETag（自选数据版本），客户端携带 If-None-Match 且数据未变化时返回 304
+    """
     db = get_db()
+    etag = watchlist_etag(db)
     
-    # 获取所有分组
-    groups = db.query(FundWatchlistGroup).order_by(FundWatchlistGroup.sort_order).all()
-    
-    # 获取所有基金
-    watchlist = db.query(FundWatchlist).order_by(FundWatchlist.sort_order).all()
-    
-    # 构建分组数据
-    groups_data = []
-    for group in groups:
-        groups_data.append({
-            'id': group.id,
-            'name': group.name,
-            'sort_order': group.sort_order
-        })
-    
-    # 构建基金数据
-    funds_data = []
-    for item in watchlist:
-        estimate = db.query(FundEstimate).filter(FundEstimate.fund_code == item.fund_code).first()
-        
-        fund_data = {
-            'fund_code': item.fund_code,
-            'fund_name': item.fund_name,
-            'fund_type': item.fund_type,
-            'group_id': item.group_id,
-            'sort_order': item.sort_order,
-            'created_time': item.created_time.isoformat() if item.created_time else None,
-            'net_worth': estimate.net_worth if estimate else None,
-            'net_worth_date': estimate.net_worth_date if estimate else None,
-            'estimate_value': estimate.estimate_value if estimate else None,
-            'estimate_change': estimate.estimate_change if estimate else None,
-            'estimate_time': estimate.estimate_time if estimate else None
-        }
-        funds_data.append(fund_data)
-    
-    return jsonify({
-        'groups': groups_data,
-        'data': funds_data
-    })
+    if request.if_none_match.contains(etag):
+        watchlist_snapshot.record('not_modified')
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(watchlist_snapshot.get_body(db, etag), mimetype='application/json')
+    response.set_etag(etag)
+    # 允许浏览器缓存，但每次使用前都要重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @app.route('/api/watchlist/<fund_code>', methods=['GET'])
@@ -754,242 +653,80 @@ def refresh_watchlist_estimates():
     """
     批量刷新自选基金的实时估值数据
     此接口专门用于快速获取实时估值，不涉及完整基金数据更新
+    并发请求上游，超过截止时间返回部分结果（timed_out 为未完成的基金）
+    仍在缓存时间内的估值（按交易日历，休市时缓存到下一次开盘）直接返回库中数据，?refresh=true 强制请求上游
     """
     db = get_db()
+    force_refresh = request.args.get('refresh', 'false').lower() == 'true'
     
-    # 获取所有自选基金代码
-    watchlist = db.query(FundWatchlist).all()
-    if not watchlist:
+    # 获取所有自选基金代码及库中的估值
+    rows = db.query(
+        FundWatchlist.fund_code, FundEstimate.net_worth, FundEstimate.net_worth_date,
+        FundEstimate.estimate_value, FundEstimate.estimate_change, FundEstimate.estimate_time,
+        FundEstimate.updated_time
+    ).outerjoin(FundEstimate, FundEstimate.fund_code == FundWatchlist.fund_code).all()
+    if not rows:
         return jsonify({'message': 'Watchlist is empty', 'updated': 0})
     
-    fund_codes = [item.fund_code for item in watchlist]
-    updated_count = 0
-    results = []
-    
-    for fund_code in fund_codes:
-        try:
-            # 只获取实时估值数据（轻量级请求）
-            real_time_url = f"http://fundgz.1234567.com.cn/js/{fund_code}.js"
-            response = requests.get(real_time_url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }, timeout=3)
-            
-            if response.status_code == 200:
-                match = re.search(r"jsonpgz\((.*?)\);", response.text)
-                if match:
-                    rt_data = json.loads(match.group(1))
-                    if rt_data:
-                        # 更新数据库中的估值信息
-                        estimate_record = db.query(FundEstimate).filter(
-                            FundEstimate.fund_code == fund_code
-                        ).first()
-                        
-                        if estimate_record:
-                            estimate_record.name = rt_data.get('name')
-                            estimate_record.net_worth = rt_data.get('dwjz')
-                            estimate_record.net_worth_date = rt_data.get('jzrq')
-                            estimate_record.estimate_value = rt_data.get('gsz')
-                            estimate_record.estimate_change = rt_data.get('gszzl')
-                            estimate_record.estimate_time = rt_data.get('gztime')
-                        else:
-                            estimate_record = FundEstimate(
-                                fund_code=fund_code,
-                                name=rt_data.get('name'),
-                                net_worth=rt_data.get('dwjz'),
-                                net_worth_date=rt_data.get('jzrq'),
-                                estimate_value=rt_data.get('gsz'),
-                                estimate_change=rt_data.get('gszzl'),
-                                estimate_time=rt_data.get('gztime')
-                            )
-                            db.add(estimate_record)
-                        
-                        updated_count += 1
-                        results.append({
-                            'fund_code': fund_code,
-                            'estimate_value': rt_data.get('gsz'),
-                            'estimate_change': rt_data.get('gszzl'),
-                            'estimate_time': rt_data.get('gztime'),
-                            'net_worth': rt_data.get('dwjz'),
-                            'net_worth_date': rt_data.get('jzrq')
-                        })
-        except Exception as e:
-            # 单个基金失败不影响其他
-            print(f"刷新 {fund_code} 估值失败: {e}")
-            continue
+    fund_codes = [row.fund_code for row in rows]
+    cached = {} if force_refresh else {
+        row.fund_code: row._asdict() for row in rows if is_estimate_fresh(row.updated_time)
+    }
+    refresh = refresh_estimates(code for code in fund_codes if code not in cached)
     
     try:
+        updated_count = upsert_estimates(db, refresh.estimates)
         db.commit()
     except Exception as e:
         db.rollback()
         return jsonify({'error': str(e)}), 500
     
+    results = [
+        {
+            'fund_code': fund_code,
+            'estimate_value': estimate.get('estimate_value'),
+            'estimate_change': estimate.get('estimate_change'),
+            'estimate_time': estimate.get('estimate_time'),
+            'net_worth': estimate.get('net_worth'),
+            'net_worth_date': estimate.get('net_worth_date')
+        }
+        for fund_code, estimate in {**cached, **refresh.estimates}.items()
+    ]
+    
     return jsonify({
         'message': f'Updated {updated_count} funds',
         'updated': updated_count,
+        'cached': len(cached),
         'total': len(fund_codes),
+        'failed': refresh.failed,
+        'timed_out': refresh.timed_out,
+        'elapsed_ms': round(refresh.elapsed * 1000, 1),
         'data': results
     })
 
 
-# ==================== 风险指标计算 ====================
-
-def calculate_risk_metrics(net_worth_trend):
+@app.route('/api/estimates/stream', methods=['GET'])
+def stream_estimates():
     """
-    计算基金风险指标：最大回撤、夏普比率、年化波动率、年化收益率
-    net_worth_trend: [{'date': '2024-01-01', 'net_worth': 1.0}, ...]
+    实时估值推送（Server-Sent Events）
+    参数: codes=000001,110022 关注的基金代码；watchlist=1 同时关注全部自选基金
+    连接建立时先推送已有估值，之后由服务端轮询线程推送有变化的估值
     """
-    if not net_worth_trend or len(net_worth_trend) < 30:
-        return None
-    
-    # 按日期排序
-    sorted_data = sorted(net_worth_trend, key=lambda x: x.get('date', ''))
-    
-    # 转换为净值数组和日期数组
-    dates = []
-    values = []
-    for item in sorted_data:
-        if item.get('net_worth') is not None:
-            dates.append(item.get('date'))
-            values.append(float(item.get('net_worth')))
-    
-    # 过滤首日异常数据（如面值1.0与实际净值100+差异巨大）
-    # 这种情况会导致波动率和回撤计算极其离谱
-    if len(values) >= 2:
-        v0 = values[0]
-        v1 = values[1]
-        if v0 > 0 and abs((v1 - v0) / v0) > 0.5:
-            values.pop(0)
-            dates.pop(0)
-    
-    if len(values) < 30:
-        return None
-    
-    now = datetime.now()
-    
-    def get_period_data(months):
-        """获取指定时间段的数据"""
-        if months == 'all':
-            return values, dates
-        
-        cutoff_date = (now - timedelta(days=months * 30)).strftime('%Y-%m-%d')
-        period_values = []
-        period_dates = []
-        for i, d in enumerate(dates):
-            if d >= cutoff_date:
-                period_values.append(values[i])
-                period_dates.append(d)
-        return period_values, period_dates
-    
-    def calc_max_drawdown(period_values):
-        """计算最大回撤"""
-        if len(period_values) < 2:
-            return None
-        
-        peak = period_values[0]
-        max_dd = 0
-        
-        for value in period_values:
-            if value > peak:
-                peak = value
-            drawdown = (peak - value) / peak * 100
-            if drawdown > max_dd:
-                max_dd = drawdown
-        
-        return round(max_dd, 2)
-    
-    def calc_daily_returns(period_values):
-        """计算日收益率序列"""
-        if len(period_values) < 2:
-            return []
-        returns = []
-        for i in range(1, len(period_values)):
-            if period_values[i-1] != 0:
-                ret = (period_values[i] - period_values[i-1]) / period_values[i-1]
-                returns.append(ret)
-        return returns
-    
-    def calc_annual_return(period_values, trading_days):
-        """计算年化收益率"""
-        if len(period_values) < 2 or period_values[0] == 0:
-            return None
-        total_return = (period_values[-1] - period_values[0]) / period_values[0]
-        if trading_days <= 0:
-            return None
-        annual_return = ((1 + total_return) ** (252 / trading_days) - 1) * 100
-        return round(annual_return, 2)
-    
-    def calc_volatility(daily_returns):
-        """计算年化波动率"""
-        if len(daily_returns) < 10:
-            return None
-        mean_return = sum(daily_returns) / len(daily_returns)
-        variance = sum((r - mean_return) ** 2 for r in daily_returns) / len(daily_returns)
-        daily_vol = math.sqrt(variance)
-        annual_vol = daily_vol * math.sqrt(252) * 100
-        return round(annual_vol, 2)
-    
-    def calc_sharpe_ratio(annual_return, volatility, risk_free_rate=2.0):
-        """计算夏普比率，假设无风险利率为2%"""
-        if volatility is None or volatility == 0 or annual_return is None:
-            return None
-        sharpe = (annual_return - risk_free_rate) / volatility
-        return round(sharpe, 2)
-    
-    result = {}
-    
-    # 计算不同时间段的最大回撤
-    for period, months in [('3m', 3), ('6m', 6), ('1y', 12), ('3y', 36), ('all', 'all')]:
-        period_values, _ = get_period_data(months)
-        result[f'max_drawdown_{period}'] = calc_max_drawdown(period_values)
-    
-    # 计算1年和3年的年化收益率、波动率、夏普比率
-    # 重要：对于数据不足的周期，不计算指标（返回None），避免年化放大产生误导性数据
-    min_trading_days = {
-        '1y': 200,  # 至少200个交易日才计算1年期指标（约10个月）
-        '3y': 600,  # 至少600个交易日才计算3年期指标（约2.5年）
-    }
-    
-    for period, months in [('1y', 12), ('3y', 36)]:
-        period_values, period_dates = get_period_data(months)
-        trading_days = len(period_values)
-        
-        # 检查数据是否充足
-        min_days = min_trading_days.get(period, 30)
-        if trading_days < min_days:
-            # 数据不足，不计算该周期的指标
-            result[f'annual_return_{period}'] = None
-            result[f'volatility_{period}'] = None
-            result[f'sharpe_ratio_{period}'] = None
-            result[f'calmar_ratio_{period}'] = None
-            continue
-        
-        daily_returns = calc_daily_returns(period_values)
-        annual_return = calc_annual_return(period_values, trading_days)
-        volatility = calc_volatility(daily_returns)
-        sharpe = calc_sharpe_ratio(annual_return, volatility)
-        
-        # 额外检查：如果波动率异常大（>500%），说明数据有问题，放弃该计算结果
-        if volatility is not None and volatility > 500:
-            result[f'annual_return_{period}'] = None
-            result[f'volatility_{period}'] = None
-            result[f'sharpe_ratio_{period}'] = None
-            result[f'calmar_ratio_{period}'] = None
-            continue
-        
-        result[f'annual_return_{period}'] = annual_return
-        result[f'volatility_{period}'] = volatility
-        result[f'sharpe_ratio_{period}'] = sharpe
-        
-        # 计算卡玛比率
-        max_dd = result.get(f'max_drawdown_{period}')
-        if annual_return is not None and max_dd is not None and max_dd > 0:
-            result[f'calmar_ratio_{period}'] = round(annual_return / max_dd, 2)
-        else:
-            result[f'calmar_ratio_{period}'] = None
-    
-    return result
+    codes = [code for code in request.args.get('codes', '').split(',') if re.fullmatch(r'\d{6}', code)]
+    watchlist = request.args.get('watchlist', '0') == '1'
+    if not codes and not watchlist:
+        return jsonify({'error': 'codes or watchlist is required'}), 400
+    
+    poller = get_estimate_poller()
+    subscriber = poller.subscribe(codes, watchlist)
+    return Response(poller.stream(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 
+# ==================== 风险指标计算 ====================
+
 def is_data_fresh(updated_time, days=7):
     """检查数据是否在指定天数内"""
     if not updated_time:
@@ -1013,112 +750,67 @@ def get_fund_compare_data(fund_code):
     force_refresh = request.args.get('refresh', 'false').lower() == 'true'
     
     try:
-        # 检查缓存数据是否新鲜（1周内）
-        trend_record = db.query(FundTrend).filter(FundTrend.fund_code == fund_code).first()
-        risk_record = db.query(FundRiskMetrics).filter(FundRiskMetrics.fund_code == fund_code).first()
+        # 一次联表查询读取缓存数据与风险指标，检查是否新鲜（1周内）
+        data = _build_cached_response(db, fund_code)
+        trend_time = data.trend_time if data else None
+        risk_record = data.risk_record if data else None
         
         use_cache = (
             not force_refresh and 
-            trend_record and 
-            is_data_fresh(trend_record.updated_time, days=7)
+            trend_time and 
+            is_data_fresh(trend_time, days=7)
         )
         
         if use_cache:
-            # 使用缓存数据
-            data = _build_cached_response(db, fund_code)
-            if data:
-                # 检查风险指标是否存在且新鲜
-                risk_data_valid = (
-                    risk_record and 
-                    is_data_fresh(risk_record.updated_time, days=7) and
-                    risk_record.sharpe_ratio_1y is not None
-                )
-
-                # 额外检查：如果波动率异常大（>1000%），说明之前计算时受到了脏数据影响，需要重算
-                if risk_data_valid and risk_record.volatility_1y and risk_record.volatility_1y > 1000:
-                    risk_data_valid = False
-                
-                if risk_data_valid:
-                    data['risk_metrics'] = {
-                        'max_drawdown_3m': risk_record.max_drawdown_3m,
-                        'max_drawdown_6m': risk_record.max_drawdown_6m,
-                        'max_drawdown_1y': risk_record.max_drawdown_1y,
-                        'max_drawdown_3y': risk_record.max_drawdown_3y,
-                        'max_drawdown_all': risk_record.max_drawdown_all,
-                        'sharpe_ratio_1y': risk_record.sharpe_ratio_1y,
-                        'sharpe_ratio_3y': risk_record.sharpe_ratio_3y,
-                        'volatility_1y': risk_record.volatility_1y,
-                        'volatility_3y': risk_record.volatility_3y,
-                        'annual_return_1y': risk_record.annual_return_1y,
-                        'annual_return_3y': risk_record.annual_return_3y,
-                        'calmar_ratio_1y': risk_record.calmar_ratio_1y,
-                        'calmar_ratio_3y': risk_record.calmar_ratio_3y,
-                    }
+            # 检查风险指标是否存在且新鲜
+            risk_data_valid = (
+                risk_record and 
+                is_data_fresh(risk_record['updated_time'], days=7) and
+                risk_record['sharpe_ratio_1y'] is not None
+            )
+
+            # 额外检查：如果波动率异常大（>1000%），说明之前计算时受到了脏数据影响，需要重算
+            if risk_data_valid and risk_record['volatility_1y'] and risk_record['volatility_1y'] > 1000:
+                risk_data_valid = False
+            
+            if risk_data_valid:
+                risk_metrics = _risk_metrics_from_record(risk_record)
+            else:
+                # 风险指标缺失，从缓存的净值数据计算
+                risk_metrics = calculate_risk_metrics(data.get('net_worth_trend', []))
+                if risk_metrics:
+                    # 保存到 FundRiskMetrics
+                    _save_risk_metrics(db, fund_code, risk_metrics)
+                    db.commit()
+            
+            return _fund_json_response(
+                data,
+                risk_metrics=risk_metrics or {},
+                data_source='cache',
+                cache_time=trend_time.isoformat()
+            )
+        
+        # 从API获取新数据（与详情接口合并并发请求，写入所有相关表）
+        api_data = _fetch_fund_detail(db, fund_code)
+        if not api_data:
+            # 如果API失败，尝试返回缓存数据
+            if trend_time:
+                if risk_record and risk_record['sharpe_ratio_1y'] is not None:
+                    risk_metrics = _risk_metrics_from_record(risk_record)
                 else:
-                    # 风险指标缺失，从缓存的净值数据计算
-                    net_worth_trend = data.get('net_worth_trend', [])
-                    risk_metrics = calculate_risk_metrics(net_worth_trend)
-                    
+                    risk_metrics = calculate_risk_metrics(data.get('net_worth_trend', []))
                     if risk_metrics:
-                        # 保存到 FundRiskMetrics
                         _save_risk_metrics(db, fund_code, risk_metrics)
                         db.commit()
-                        data['risk_metrics'] = risk_metrics
-                    else:
-                        data['risk_metrics'] = {}
-                
-                data['data_source'] = 'cache'
-                data['cache_time'] = trend_record.updated_time.isoformat() if trend_record.updated_time else None
-                return jsonify(data)
-        
-        # 从API获取新数据
-        api_data = fund_api.get_fund_data(fund_code)
-        if not api_data:
-            # 如果API失败，尝试返回缓存数据
-            if trend_record:
-                data = _build_cached_response(db, fund_code)
-                if data:
-                    if risk_record and risk_record.sharpe_ratio_1y is not None:
-                        data['risk_metrics'] = {
-                            'max_drawdown_3m': risk_record.max_drawdown_3m,
-                            'max_drawdown_6m': risk_record.max_drawdown_6m,
-                            'max_drawdown_1y': risk_record.max_drawdown_1y,
-                            'max_drawdown_3y': risk_record.max_drawdown_3y,
-                            'max_drawdown_all': risk_record.max_drawdown_all,
-                            'sharpe_ratio_1y': risk_record.sharpe_ratio_1y,
-                            'sharpe_ratio_3y': risk_record.sharpe_ratio_3y,
-                            'volatility_1y': risk_record.volatility_1y,
-                            'volatility_3y': risk_record.volatility_3y,
-                            'annual_return_1y': risk_record.annual_return_1y,
-                            'annual_return_3y': risk_record.annual_return_3y,
-                            'calmar_ratio_1y': risk_record.calmar_ratio_1y,
-                            'calmar_ratio_3y': risk_record.calmar_ratio_3y,
-                        }
-                    else:
-                        net_worth_trend = data.get('net_worth_trend', [])
-                        risk_metrics = calculate_risk_metrics(net_worth_trend)
-                        if risk_metrics:
-                            _save_risk_metrics(db, fund_code, risk_metrics)
-                            db.commit()
-                        data['risk_metrics'] = risk_metrics or {}
-                    data['data_source'] = 'stale_cache'
-                    return jsonify(data)
+                return _fund_json_response(data, risk_metrics=risk_metrics or {}, data_source='stale_cache')
             return jsonify({'error': 'Failed to fetch fund data'}), 500
         
-        # 计算风险指标
-        net_worth_trend = api_data.get('net_worth_trend', [])
-        risk_metrics = calculate_risk_metrics(net_worth_trend)
-        
-        # 保存到数据库（所有相关表）
-        _save_fund_data_to_db(db, fund_code, api_data)
-        if risk_metrics:
-            _save_risk_metrics(db, fund_code, risk_metrics)
-        db.commit()
-        
-        # 返回数据
-        api_data['risk_metrics'] = risk_metrics or {}
-        api_data['data_source'] = 'api'
-        return jsonify(api_data)
+        # 返回数据（共享结果，复制后再附加字段）
+        return jsonify({
+            **api_data,
+            'risk_metrics': api_data.get('risk_metrics') or {},
+            'data_source': 'api'
+        })
         
     except Exception as e:
         print(f"Error fetching fund compare data: {e}")
@@ -1146,91 +838,20 @@ def _save_risk_metrics(db: Session, fund_code: str, risk_metrics: dict):
         db.add(risk_record)
 
 
-def _save_fund_data_to_db(db: Session, fund_code: str, data: dict):
-    """保存基金数据到数据库"""
-    try:
-        # 保存基本信息
-        basic_info = data.get('basic_info', {})
-        performance = data.get('performance', {})
-        # 解析收益率用于排序
-        return_1y_val = None
-        try:
-            return_1y_val = float(performance.get('1_year_return')) if performance.get('1_year_return') else None
-        except (ValueError, TypeError):
-            pass
-        
-        basic_record = db.query(FundBasicInfo).filter(FundBasicInfo.fund_code == fund_code).first()
-        if basic_record:
-            basic_record.fund_name = basic_info.get('fund_name', '')
-            basic_record.fund_type = basic_info.get('fund_type', '')
-            basic_record.return_1y = return_1y_val
-            basic_record.basic_json = _json_dumps(basic_info)
-            basic_record.performance_json = _json_dumps(performance)
-            basic_record.updated_time = datetime.now()
-        else:
-            basic_record = FundBasicInfo(
-                fund_code=fund_code,
-                fund_name=basic_info.get('fund_name', ''),
-                fund_type=basic_info.get('fund_type', ''),
-                return_1y=return_1y_val,
-                basic_json=_json_dumps(basic_info),
-                performance_json=_json_dumps(performance)
-            )
-            db.add(basic_record)
-        
-        # 保存走势数据
-        trend_record = db.query(FundTrend).filter(FundTrend.fund_code == fund_code).first()
-        if trend_record:
-            trend_record.net_worth_trend_json = _json_dumps(data.get('net_worth_trend', []))
-            trend_record.accumulated_net_worth_json = _json_dumps(data.get('accumulated_net_worth', []))
-            trend_record.position_trend_json = _json_dumps(data.get('position_trend', []))
-            trend_record.total_return_trend_json = _json_dumps(data.get('total_return_trend', []))
-            trend_record.ranking_trend_json = _json_dumps(data.get('ranking_trend', []))
-            trend_record.ranking_percentage_json = _json_dumps(data.get('ranking_percentage', []))
-            trend_record.scale_fluctuation_json = _json_dumps(data.get('scale_fluctuation', {}))
-            trend_record.updated_time = datetime.now()
-        else:
-            trend_record = FundTrend(
-                fund_code=fund_code,
-                net_worth_trend_json=_json_dumps(data.get('net_worth_trend', [])),
-                accumulated_net_worth_json=_json_dumps(data.get('accumulated_net_worth', [])),
-                position_trend_json=_json_dumps(data.get('position_trend', [])),
-                total_return_trend_json=_json_dumps(data.get('total_return_trend', [])),
-                ranking_trend_json=_json_dumps(data.get('ranking_trend', [])),
-                ranking_percentage_json=_json_dumps(data.get('ranking_percentage', [])),
-                scale_fluctuation_json=_json_dumps(data.get('scale_fluctuation', {}))
-            )
-            db.add(trend_record)
-        
-        # 保存额外数据
-        extra_record = db.query(FundExtraData).filter(FundExtraData.fund_code == fund_code).first()
-        if extra_record:
-            extra_record.holder_structure_json = _json_dumps(data.get('holder_structure', {}))
-            extra_record.asset_allocation_json = _json_dumps(data.get('asset_allocation', {}))
-            extra_record.performance_evaluation_json = _json_dumps(data.get('performance_evaluation', {}))
-            extra_record.fund_managers_json = _json_dumps(data.get('fund_managers', []))
-            extra_record.subscription_redemption_json = _json_dumps(data.get('subscription_redemption', {}))
-            extra_record.same_type_funds_json = _json_dumps(data.get('same_type_funds', []))
-            extra_record.updated_time = datetime.now()
-        else:
-            extra_record = FundExtraData(
-                fund_code=fund_code,
-                holder_structure_json=_json_dumps(data.get('holder_structure', {})),
-                asset_allocation_json=_json_dumps(data.get('asset_allocation', {})),
-                performance_evaluation_json=_json_dumps(data.get('performance_evaluation', {})),
-                fund_managers_json=_json_dumps(data.get('fund_managers', [])),
-                subscription_redemption_json=_json_dumps(data.get('subscription_redemption', {})),
-                same_type_funds_json=_json_dumps(data.get('same_type_funds', []))
-            )
-            db.add(extra_record)
-        
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Error saving fund data to db: {e}")
+# ==================== 基金筛选功能 ====================
 
+def calculate_same_type_rankings(db):
+    """
+    计算同类型基金的排名百分位
+    基于 FundBasicInfo 中的收益数据，用窗口函数一次性完成全部类型的排名与4433判断，
+    并批量写入 FundScreeningRank（见 screening_rankings.py）
+    """
+    start_time = time.time()
+    db.execute(text(SAME_TYPE_RANKING_SQL), ranking_params())
+    ranked_count = db.execute(text("SELECT changes()")).scalar()
+    db.commit()
+    print(f"[同类排名] 同类型排名计算完成: {ranked_count} 只基金，耗时 {time.time() - start_time:.2f} 秒")
 
-# ==================== 基金筛选功能 ====================
 
 # 全局变量：批量更新状态
 screening_update_status = {
@@ -1241,210 +862,66 @@ screening_update_status = {
     'success_count': 0,
     'fail_count': 0,
     'start_time': None,
-    'message': ''
+    'message': '',
+    'job_id': None,
+    'unchanged_count': 0
 }
+screening_stop_event = threading.Event()
 
 
-def calculate_calmar_ratio(annual_return, max_drawdown):
-    """计算卡玛比率"""
-    if max_drawdown is None or max_drawdown == 0 or annual_return is None:
-        return None
-    return round(annual_return / max_drawdown, 2)
-
-
-def check_4433_rule(rank_1y, rank_2y, rank_3y, rank_5y, rank_6m, rank_3m):
+def _fetch_fund_payload(fund_code, api=None, fetch_state=None):
     """
-    检查是否符合4433法则
-    4433法则：
-    - 近1年、2年、3年、5年排名在同类前1/4 (25%)
-    - 近6个月、3个月排名在前1/3 (33.33%)
-    注意：这里的排名应该是同类型基金中的排名百分位
+    抓取单只基金数据并计算风险指标（不写库）
+    单只更新与批量抓取的工作线程共用，返回 (fund_data, risk_metrics, new_fetch_state)，失败返回 None
+    fetch_state: 上次抓取状态，上游内容未变化时 fund_data 为 NOT_MODIFIED，不清洗也不计算指标
     """
-    # 长期排名：1年必须有，2年3年至少有一个
-    if rank_1y is None or rank_1y > 25:
-        return False
-    
-    # 检查2年和3年排名（如果有数据）
-    long_term_available = [r for r in [rank_2y, rank_3y] if r is not None]
-    if long_term_available:
-        for rank in long_term_available:
-            if rank > 25:
-                return False
-    
-    # 如果有5年数据，也需要在前25%
-    if rank_5y is not None and rank_5y > 25:
-        return False
+    fund_data, new_fetch_state = (api or fund_api).get_fund_data_if_changed(fund_code, fetch_state)
+    if fund_data is NOT_MODIFIED:
+        return NOT_MODIFIED, None, new_fetch_state
+    if not fund_data:
+        return None
     
-    # 短期排名：6个月和3个月都必须在前33.33%
-    if rank_6m is None or rank_6m > 33.33:
-        return False
-    if rank_3m is None or rank_3m > 33.33:
-        return False
+    risk_metrics = None
+    net_worth_trend = fund_data.get('net_worth_trend', [])
+    if net_worth_trend and len(net_worth_trend) >= 30:
+        risk_metrics = calculate_risk_metrics(net_worth_trend)
     
-    return True
-
+    return fund_data, risk_metrics, new_fetch_state
 
-# ==================== 基金筛选功能 ====================
 
-def check_4433_rule(rank_1y, rank_2y, rank_3y, rank_5y, rank_6m, rank_3m):
-    """
-    检查是否符合4433法则
-    4433法则：
-    - 近1年、2年、3年排名在同类前1/4 (25%)
-    - 近6个月、3个月排名在前1/3 (33.33%)
-    """
-    # 长期排名：1年必须有，2年3年至少有一个
-    if rank_1y is None or rank_1y > 25:
-        return False
-    
-    # 检查2年和3年排名（如果有数据）
-    long_term_available = [r for r in [rank_2y, rank_3y] if r is not None]
-    if long_term_available:
-        for rank in long_term_available:
-            if rank > 25:
-                return False
-    
-    # 如果有5年数据，也需要在前25%
-    if rank_5y is not None and rank_5y > 25:
-        return False
-    
-    # 短期排名：6个月和3个月都必须在前33.33%
-    if rank_6m is None or rank_6m > 33.33:
-        return False
-    if rank_3m is None or rank_3m > 33.33:
-        return False
-    
-    return True
+def _load_fetch_states(db):
+    """读取全部基金的上游抓取状态 fund_code -> state"""
+    return {
+        row.fund_code: {
+            'content_hash': row.content_hash,
+            'etag': row.etag,
+            'last_modified': row.last_modified,
+        }
+        for row in db.query(
+            FundFetchState.fund_code, FundFetchState.content_hash,
+            FundFetchState.etag, FundFetchState.last_modified
+        ).all()
+    }
 
 
-def calculate_same_type_rankings(db):
+def _store_fund_payloads(db, items):
     """
-    计算同类型基金的排名百分位
-    基于 FundBasicInfo 中的收益数据计算排名，保存到 FundScreeningRank
+    将一批 _fetch_fund_payload 的结果 [(fund_code, payload), ...] 写入所有相关表（不提交）
+    上游内容未变化的基金只更新抓取状态与走势的更新时间（详情缓存据此判断新鲜度）
     """
-    # 获取所有有效的基金类型
-    fund_types = db.query(FundBasicInfo.fund_type).filter(
-        FundBasicInfo.fund_type.isnot(None),
-        FundBasicInfo.fund_type != ''
-    ).distinct().all()
-    
-    fund_types = [ft[0] for ft in fund_types]
-    print(f"[同类排名] 发现 {len(fund_types)} 种基金类型")
-    
-    for fund_type in fund_types:
-        # 获取该类型的所有基金（包含业绩数据）
-        funds = db.query(FundBasicInfo).filter(
-            FundBasicInfo.fund_type == fund_type,
-            FundBasicInfo.performance_json.isnot(None)
-        ).all()
-        
-        if len(funds) < 2:
-            continue
-        
-        print(f"[同类排名] 处理 {fund_type}: {len(funds)} 只基金")
-        
-        # 解析业绩数据
-        fund_performances = []
-        for fund in funds:
-            perf = _json_loads(fund.performance_json, {})
-            fund_performances.append({
-                'fund_code': fund.fund_code,
-                'return_1m': perf.get('1_month_return'),
-                'return_3m': perf.get('3_month_return'),
-                'return_6m': perf.get('6_month_return'),
-                'return_1y': perf.get('1_year_return'),
-                'return_2y': perf.get('2_year_return'),
-                'return_3y': perf.get('3_year_return'),
-            })
-        
-        # 为每个时间段计算排名
-        periods = [
-            ('return_1m', 'rank_pct_1m'),
-            ('return_3m', 'rank_pct_3m'),
-            ('return_6m', 'rank_pct_6m'),
-            ('return_1y', 'rank_pct_1y'),
-            ('return_2y', 'rank_pct_2y'),
-            ('return_3y', 'rank_pct_3y'),
-        ]
-        
-        # 为每只基金创建或更新排名记录
-        fund_ranks = {}  # fund_code -> rank data
-        for fp in fund_performances:
-            fund_ranks[fp['fund_code']] = {}
-        
-        for return_field, rank_field in periods:
-            # 获取有该时段收益数据的基金
-            # 重要：排除收益率为 0、"0.00"、None 的基金
-            # 这些通常是成立时间不足导致的缺失数据，而非真实的0%收益
-            def is_valid_return(val):
-                if val is None:
-                    return False
-                try:
-                    num_val = float(val)
-                    # 真实0%收益极其罕见，0值通常表示数据缺失
-                    # 允许一个很小的误差范围（如 -0.01% ~ 0.01%）视为可能的真实数据
-                    if abs(num_val) < 0.01:
-                        return False
-                    return True
-                except (ValueError, TypeError):
-                    return False
-            
-            funds_with_data = [(fp['fund_code'], float(fp[return_field])) for fp in fund_performances 
-                               if is_valid_return(fp[return_field])]
-            
-            if len(funds_with_data) < 2:
-                continue
-            
-            # 按收益率降序排序（收益高排名靠前）
-            funds_with_data.sort(key=lambda x: x[1], reverse=True)
-            total = len(funds_with_data)
-            
-            # 计算每只基金的排名百分位
-            for rank_idx, (fund_code, _) in enumerate(funds_with_data, 1):
-                rank_pct = round((rank_idx / total) * 100, 2)
-                fund_ranks[fund_code][rank_field] = rank_pct
-        
-        # 更新数据库
-        for fund_code, ranks in fund_ranks.items():
-            rank_record = db.query(FundScreeningRank).filter(
-                FundScreeningRank.fund_code == fund_code
-            ).first()
-            
-            if not rank_record:
-                rank_record = FundScreeningRank(fund_code=fund_code)
-                db.add(rank_record)
-            
-            for field, value in ranks.items():
-                setattr(rank_record, field, value)
-            
-            # 计算4433法则
-            pass_4433 = check_4433_rule(
-                ranks.get('rank_pct_1y'),
-                ranks.get('rank_pct_2y'),
-                ranks.get('rank_pct_3y'),
-                None,
-                ranks.get('rank_pct_6m'),
-                ranks.get('rank_pct_3m')
-            )
-            rank_record.pass_4433 = 1 if pass_4433 else 0
-            rank_record.updated_time = datetime.now()
-    
-    db.commit()
-    print("[同类排名] 同类型排名计算完成")
-
-
-# 全局变量：批量更新状态
-screening_update_status = {
-    'running': False,
-    'progress': 0,
-    'total': 0,
-    'current_fund': '',
-    'success_count': 0,
-    'fail_count': 0,
-    'start_time': None,
-    'message': ''
-}
-screening_stop_flag = False
+    changed = []
+    unchanged = []
+    fetch_states = []
+    for fund_code, (fund_data, risk_metrics, fetch_state) in items:
+        modified = fund_data is not NOT_MODIFIED
+        if modified:
+            changed.append((fund_code, fund_data, risk_metrics))
+        else:
+            unchanged.append(fund_code)
+        fetch_states.append((fund_code, fetch_state, modified))
+    upsert_fund_payloads(db, changed)
+    touch_trends(db, unchanged)
+    upsert_fetch_states(db, fetch_states)
 
 
 def update_single_fund_data(fund_code, db):
@@ -1453,107 +930,297 @@ def update_single_fund_data(fund_code, db):
     直接获取详情数据，更新所有相关表
     """
     try:
-        # 获取完整的基金数据
-        fund_data = fund_api.get_fund_data(fund_code)
-        if not fund_data:
+        payload = _fetch_fund_payload(fund_code)
+        if not payload:
             return False
         
-        # 保存到所有相关表
-        _save_fund_data_to_db(db, fund_code, fund_data)
-        
-        # 计算并保存风险指标
-        net_worth_trend = fund_data.get('net_worth_trend', [])
-        if net_worth_trend and len(net_worth_trend) >= 30:
-            risk_metrics = calculate_risk_metrics(net_worth_trend)
-            if risk_metrics:
-                _save_risk_metrics(db, fund_code, risk_metrics)
-        
+        _store_fund_payloads(db, [(fund_code, payload)])
         return True
     except Exception as e:
+        db.rollback()
         print(f"Error updating data for {fund_code}: {e}")
         return False
 
 
-def batch_update_fund_data(fund_types=None, limit=None):
+def batch_update_fund_data(fund_types=None, limit=None, workers=None, resume=True, retry_failed=False,
+                           force=False):
     """
-    批量更新基金数据（简化版）
-    直接获取每只基金的完整详情数据
+    批量更新基金数据
+    使用 FundCrawler 并发抓取（按域名令牌桶限速、错误率自适应退避），
+    抓取结果由单一写入线程批量落库。
+    任务进度持久化在 screening_job / screening_job_item 表中：
+    - resume: 存在参数相同的未完成任务时从断点继续，只处理未完成的基金
+    - retry_failed: 只重试最近一次任务中失败的基金
+    上游内容未变化（304 或内容哈希相同）的基金跳过清洗、写库与指标计算；force=True 时全部重新写入
     """
-    global screening_update_status, screening_stop_flag
+    global screening_update_status
     
     if screening_update_status['running']:
         return {'error': '更新任务正在进行中'}
     
     screening_update_status['running'] = True
     screening_update_status['start_time'] = datetime.now()
-    screening_update_status['message'] = '正在获取基金列表...'
-    screening_stop_flag = False
+    screening_update_status['message'] = '正在准备更新任务...'
+    screening_stop_event.clear()
     
+    db = None
+    job = None
     try:
-        # 获取基金列表
-        fund_list = fund_list_cache.fund_list
-        
-        # 按类型筛选
-        if fund_types:
-            fund_list = [f for f in fund_list if any(t in f.get('TYPE', '') for t in fund_types)]
-        
-        # 限制数量
-        if limit:
-            fund_list = fund_list[:limit]
-        
-        screening_update_status['total'] = len(fund_list)
-        screening_update_status['progress'] = 0
-        screening_update_status['success_count'] = 0
-        screening_update_status['fail_count'] = 0
-        
         db = SessionLocal()
-        
-        for i, fund in enumerate(fund_list):
-            # 检查停止标志
-            if screening_stop_flag:
-                screening_update_status['message'] = f"已手动停止。成功: {screening_update_status['success_count']}, 失败: {screening_update_status['fail_count']}"
-                break
+        fund_names = {f.get('CODE', ''): f.get('NAME', '') for f in fund_list_cache.fund_list}
+        
+        if retry_failed:
+            job = screening_jobs.get_latest_job(db)
+            if not job:
+                raise ValueError('没有可重试的任务')
+            retried = screening_jobs.reset_failed_items(db, job)
+            message = f"重试任务 #{job.id} 中失败的 {retried} 只基金"
+        elif resume:
+            job = screening_jobs.find_resumable_job(db, fund_types, limit)
+            message = f"从断点继续任务 #{job.id}" if job else None
+        
+        if job is None:
+            # 获取基金列表
+            fund_list = fund_list_cache.fund_list
             
-            fund_code = fund.get('CODE', '')
-            screening_update_status['progress'] = i + 1
-            screening_update_status['current_fund'] = f"{fund_code} - {fund.get('NAME', '')}"
-            screening_update_status['message'] = f"正在处理: {screening_update_status['current_fund']}"
+            # 按类型筛选
+            if fund_types:
+                fund_list = [f for f in fund_list if any(t in f.get('TYPE', '') for t in fund_types)]
             
-            if update_single_fund_data(fund_code, db):
+            # 限制数量
+            if limit:
+                fund_list = fund_list[:limit]
+            
+            job = screening_jobs.create_job(db, [f.get('CODE', '') for f in fund_list], fund_types, limit)
+            message = f"新建任务 #{job.id}"
+        
+        screening_jobs.start_job(db, job, message)
+        pending_items = screening_jobs.get_pending_items(db, job.id)
+        item_index = {code: (item_id, position) for item_id, position, code in pending_items}
+        
+        screening_update_status['job_id'] = job.id
+        screening_update_status['total'] = job.total
+        screening_update_status['success_count'] = job.success_count or 0
+        screening_update_status['fail_count'] = job.fail_count or 0
+        screening_update_status['progress'] = job.total - len(pending_items)
+        screening_update_status['unchanged_count'] = 0
+        screening_update_status['message'] = f"{message}，待处理 {len(pending_items)} 只"
+        
+        # 批量任务使用独立的限速 FundAPI 实例，不影响交互请求
+        crawl_api = FundAPI(rate_limiter=HostRateLimiter())
+        fetch_states = {} if force else _load_fetch_states(db)
+        
+        def fetch(fund_code):
+            payload = _fetch_fund_payload(fund_code, crawl_api, fetch_states.get(fund_code))
+            if not payload:
+                raise ValueError('获取基金数据失败')
+            return payload
+        
+        def write(results):
+            # 仅在写入线程中执行，所有数据库写操作都经过这里
+            try:
+                _store_fund_payloads(db, [(result.fund_code, result.payload) for result in results if result.ok])
+                # 基金数据落库后再记录检查点，保证已标记完成的基金一定已写入
+                screening_jobs.record_results(db, job, results, item_index)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        
+        def on_result(result):
+            screening_update_status['progress'] += 1
+            if result.ok:
                 screening_update_status['success_count'] += 1
+                if result.payload[0] is NOT_MODIFIED:
+                    screening_update_status['unchanged_count'] += 1
             else:
                 screening_update_status['fail_count'] += 1
-            
-            # 每10只基金提交一次
-            if (i + 1) % 10 == 0:
-                db.commit()
-            
-            # 添加延迟，避免请求过于频繁
-            time.sleep(0.3)
+            screening_update_status['current_fund'] = f"{result.fund_code} - {fund_names.get(result.fund_code, '')}"
+            screening_update_status['message'] = f"正在处理: {screening_update_status['current_fund']}"
         
-        db.commit()
+        crawler = FundCrawler(fetch, write, workers=workers or DEFAULT_CRAWL_WORKERS)
+        crawler.run(
+            [code for _, _, code in pending_items],
+            should_stop=screening_stop_event.is_set,
+            on_result=on_result
+        )
         
-        if not screening_stop_flag:
+        # 写入失败的批次未记录检查点，重新读取以获得准确计数
+        db.refresh(job)
+        screening_update_status['success_count'] = job.success_count or 0
+        screening_update_status['fail_count'] = job.fail_count or 0
+        
+        if screening_stop_event.is_set():
+            screening_update_status['message'] = f"已手动停止，可从断点继续。成功: {job.success_count}, 失败: {job.fail_count}"
+            screening_jobs.finish_job(db, job, 'stopped', screening_update_status['message'])
+        else:
             # 计算同类型排名
             screening_update_status['message'] = '正在计算同类型排名...'
             calculate_same_type_rankings(db)
-            screening_update_status['message'] = f"更新完成！成功: {screening_update_status['success_count']}, 失败: {screening_update_status['fail_count']}"
-        
-        db.close()
+            screening_update_status['message'] = (
+                f"更新完成！成功: {job.success_count}, 失败: {job.fail_count}, "
+                f"本次未变化: {screening_update_status['unchanged_count']}"
+            )
+            screening_jobs.finish_job(db, job, 'completed', screening_update_status['message'])
         
     except Exception as e:
         screening_update_status['message'] = f"更新失败: {str(e)}"
+        if job is not None:
+            try:
+                db.rollback()
+                screening_jobs.finish_job(db, job, 'failed', screening_update_status['message'])
+            except Exception as finish_error:
+                print(f"[批量更新] 记录任务状态失败: {finish_error}")
     finally:
+        if db is not None:
+            db.close()
         screening_update_status['running'] = False
     
     return {
         'success': True,
+        'job_id': screening_update_status['job_id'],
         'total': screening_update_status['total'],
         'success_count': screening_update_status['success_count'],
         'fail_count': screening_update_status['fail_count']
     }
 
 
+# 排行榜字段 -> performance_json 中的收益字段
+RANKING_RETURN_FIELDS = {
+    'return_1w': '1_week_return',
+    'return_1m': '1_month_return',
+    'return_3m': '3_month_return',
+    'return_6m': '6_month_return',
+    'return_1y': '1_year_return',
+    'return_2y': '2_year_return',
+    'return_3y': '3_year_return',
+    'return_ytd': 'ytd_return',
+    'return_since_inception': 'since_inception_return',
+}
+
+
+def _upsert_ranking_returns(db, ranking_funds, fund_types_map):
+    """
+    将排行榜收益数据合并写入 FundBasicInfo.performance_json 与 return_* 列
+    已有记录只覆盖收益字段（保留详情接口写入的其他字段），新基金插入基础记录
+    返回 (更新数, 新增数)
+    """
+    existing = {
+        row.fund_code: row
+        for row in db.query(FundBasicInfo.id, FundBasicInfo.fund_code, FundBasicInfo.performance_json).all()
+    }
+    now = datetime.now()
+    updates, inserts = [], []
+    
+    for fund in ranking_funds:
+        fund_code = fund['fund_code']
+        returns = {
+            perf_key: fund[field]
+            for field, perf_key in RANKING_RETURN_FIELDS.items()
+            if fund.get(field) is not None
+        }
+        returns['ranking_date'] = fund.get('date')
+        
+        row = existing.get(fund_code)
+        if row:
+            performance = _json_loads(row.performance_json, {}) or {}
+            performance.update(returns)
+            updates.append({
+                'id': row.id,
+                'performance_json': _json_dumps(performance),
+                **parse_return_columns(performance),
+                'updated_time': now,
+            })
+        else:
+            fund_type = fund_types_map.get(fund_code) or ''
+            basic_info = {'fund_code': fund_code, 'fund_name': fund.get('fund_name'), 'fund_type': fund_type}
+            inserts.append({
+                'fund_code': fund_code,
+                'fund_name': fund.get('fund_name') or fund_code,
+                'fund_type': fund_type,
+                **parse_return_columns(returns),
+                'basic_json': _json_dumps(basic_info),
+                'performance_json': _json_dumps(returns),
+                'created_time': now,
+                'updated_time': now,
+            })
+    
+    if updates:
+        db.bulk_update_mappings(FundBasicInfo, updates)
+    if inserts:
+        db.bulk_insert_mappings(FundBasicInfo, inserts)
+    db.commit()
+    return len(updates), len(inserts)
+
+
+def fast_refresh_fund_returns(fund_types=None, recalc_rankings=True):
+    """
+    快速刷新：通过排行榜接口分页批量获取全部基金的阶段收益，
+    写入 FundBasicInfo 后重新计算同类排名。
+    只更新收益数据，净值历史与风险指标仍由 batch_update_fund_data 逐只抓取。
+    """
+    global screening_update_status
+    
+    if screening_update_status['running']:
+        return {'error': '更新任务正在进行中'}
+    
+    screening_update_status['running'] = True
+    screening_update_status['start_time'] = datetime.now()
+    screening_update_status['job_id'] = None
+    screening_update_status['progress'] = 0
+    screening_update_status['total'] = 0
+    screening_update_status['success_count'] = 0
+    screening_update_status['fail_count'] = 0
+    screening_update_status['current_fund'] = ''
+    screening_update_status['message'] = '正在分页获取排行榜收益数据...'
+    
+    db = None
+    result = {'success': False}
+    try:
+        ranking = FundRankingFetcher().fetch_all_rankings()
+        if not ranking.get('success'):
+            raise ValueError(ranking.get('error') or '获取排行榜失败')
+        
+        fund_types_map = {f.get('CODE'): f.get('TYPE', '') for f in fund_list_cache.fund_list}
+        funds = ranking['funds']
+        if fund_types:
+            funds = [f for f in funds if any(t in fund_types_map.get(f['fund_code'], '') for t in fund_types)]
+        
+        screening_update_status['total'] = len(funds)
+        screening_update_status['message'] = f"获取到 {len(funds)} 只基金收益数据，正在写入..."
+        
+        db = SessionLocal()
+        updated, inserted = _upsert_ranking_returns(db, funds, fund_types_map)
+        screening_update_status['progress'] = len(funds)
+        screening_update_status['success_count'] = updated + inserted
+        screening_update_status['fail_count'] = len(ranking['failed_pages'])
+        
+        if recalc_rankings:
+            screening_update_status['message'] = '正在计算同类型排名...'
+            calculate_same_type_rankings(db)
+        
+        screening_update_status['message'] = (
+            f"快速刷新完成！更新: {updated}, 新增: {inserted}"
+            + (f", 失败页: {ranking['failed_pages']}" if ranking['failed_pages'] else '')
+        )
+        result = {
+            'success': True,
+            'updated': updated,
+            'inserted': inserted,
+            'pages': ranking['pages'],
+            'failed_pages': ranking['failed_pages']
+        }
+    except Exception as e:
+        screening_update_status['message'] = f"快速刷新失败: {str(e)}"
+        result = {'success': False, 'error': str(e)}
+    finally:
+        if db is not None:
+            db.close()
+        screening_update_status['running'] = False
+    
+    return result
+
+
 @app.route('/api/screening/status', methods=['GET'])
 def get_screening_status():
     """获取筛选数据库状态"""
@@ -1596,8 +1263,28 @@ def get_screening_status():
             'progress': screening_update_status['progress'],
             'total': screening_update_status['total'],
             'current_fund': screening_update_status['current_fund'],
+            'success_count': screening_update_status['success_count'],
+            'fail_count': screening_update_status['fail_count'],
+            'job_id': screening_update_status['job_id'],
+            'unchanged_count': screening_update_status['unchanged_count'],
             'message': screening_update_status['message']
-        }
+        },
+        'last_job': screening_jobs.job_summary(db, screening_jobs.get_latest_job(db))
+    })
+
+
+@app.route('/api/screening/jobs/latest', methods=['GET'])
+def get_latest_screening_job():
+    """获取最近一次批量更新任务的概要与失败明细"""
+    db = get_db()
+    job = screening_jobs.get_latest_job(db)
+    if not job:
+        return jsonify({'job': None, 'failed_items': []})
+    
+    limit = request.args.get('limit', 200, type=int)
+    return jsonify({
+        'job': screening_jobs.job_summary(db, job),
+        'failed_items': screening_jobs.get_failed_items(db, job.id, limit)
     })
 
 
@@ -1607,6 +1294,10 @@ def start_screening_update():
     data = request.get_json() or {}
     fund_types = data.get('fund_types', ['混合型-偏股', '混合型-灵活', '股票型'])
     limit = data.get('limit')  # 可选：限制更新数量（测试用）
+    workers = data.get('workers')  # 可选：并发抓取线程数
+    resume = data.get('resume', True)  # 默认从未完成任务的断点继续
+    retry_failed = data.get('retry_failed', False)  # 只重试最近一次任务中失败的基金
+    force = data.get('force', False)  # 忽略内容哈希，全部重新写入
     
     if screening_update_status['running']:
         return jsonify({
@@ -1617,7 +1308,7 @@ def start_screening_update():
     # 在后台线程执行更新
     thread = threading.Thread(
         target=batch_update_fund_data, 
-        args=(fund_types, limit)
+        args=(fund_types, limit, workers, resume, retry_failed, force)
     )
     thread.daemon = True
     thread.start()
@@ -1625,15 +1316,42 @@ def start_screening_update():
     return jsonify({
         'message': '更新任务已启动',
         'fund_types': fund_types,
-        'limit': limit
+        'limit': limit,
+        'workers': workers or DEFAULT_CRAWL_WORKERS,
+        'resume': resume,
+        'retry_failed': retry_failed,
+        'force': force
+    })
+
+
+@app.route('/api/screening/fast-refresh', methods=['POST'])
+def start_screening_fast_refresh():
+    """启动快速刷新（排行榜批量获取阶段收益，不抓取净值历史）"""
+    data = request.get_json() or {}
+    fund_types = data.get('fund_types')  # 可选：只写入指定类型
+    recalc = data.get('recalc_rankings', True)
+    
+    if screening_update_status['running']:
+        return jsonify({
+            'error': '更新任务正在进行中',
+            'status': screening_update_status
+        }), 409
+    
+    thread = threading.Thread(target=fast_refresh_fund_returns, args=(fund_types, recalc))
+    thread.daemon = True
+    thread.start()
+    
+    return jsonify({
+        'message': '快速刷新任务已启动',
+        'fund_types': fund_types,
+        'recalc_rankings': recalc
     })
 
 
 @app.route('/api/screening/stop', methods=['POST'])
 def stop_screening_update():
-    """停止基金数据更新"""
-    global screening_stop_flag
-    screening_stop_flag = True
+    """停止基金数据更新（已完成的基金已记录检查点，可从断点继续）"""
+    screening_stop_event.set()
     return jsonify({'message': '已发送停止信号'})
 
 
@@ -1753,11 +1471,14 @@ def query_screening_funds():
     
     db = get_db()
     
-    # 基础查询：JOIN 三个表
+    # 基础查询：JOIN 三个表（收益率读 return_* 列，不加载大字段 JSON）
     query = db.query(
         FundBasicInfo,
         FundRiskMetrics,
         FundScreeningRank
+    ).options(
+        defer(FundBasicInfo.basic_json),
+        defer(FundBasicInfo.performance_json)
     ).outerjoin(
         FundRiskMetrics, FundBasicInfo.fund_code == FundRiskMetrics.fund_code
     ).outerjoin(
@@ -1821,7 +1542,11 @@ def query_screening_funds():
     sort_map = {
         'sharpe_ratio_1y': FundRiskMetrics.sharpe_ratio_1y,
         'sharpe_ratio_3y': FundRiskMetrics.sharpe_ratio_3y,
+        'return_1m': FundBasicInfo.return_1m,
+        'return_3m': FundBasicInfo.return_3m,
+        'return_6m': FundBasicInfo.return_6m,
         'return_1y': FundBasicInfo.return_1y,
+        'return_3y': FundBasicInfo.return_3y,
         'volatility_1y': FundRiskMetrics.volatility_1y,
         'max_drawdown_1y': FundRiskMetrics.max_drawdown_1y,
         'calmar_ratio_1y': FundRiskMetrics.calmar_ratio_1y,
@@ -1850,9 +1575,6 @@ def query_screening_funds():
     # 脏数据自动清理标记（不立即清理，而是返回NULL，防止展示离谱数据）
     # 如果用户需要修复，可以点击“更新数据”
     for basic, risk, rank in results:
-        # 解析业绩数据
-        perf = _json_loads(basic.performance_json, {}) if basic else {}
-        
         # 脏数据检测：如果波动率 > 1000%，视为无效数据
         is_dirty_risk = risk and risk.volatility_1y and risk.volatility_1y > 1000
         
@@ -1860,13 +1582,13 @@ def query_screening_funds():
             'fund_code': basic.fund_code if basic else None,
             'fund_name': basic.fund_name if basic else None,
             'fund_type': basic.fund_type if basic else None,
-            # 业绩数据（来自 FundBasicInfo.performance_json）
-            'return_1m': perf.get('1_month_return'),
-            'return_3m': perf.get('3_month_return'),
-            'return_6m': perf.get('6_month_return'),
-            # 如果近1年收益率为 "0.00" 且实际上可能是空数据，则转为 None 或 "--"
-            'return_1y': perf.get('1_year_return') if perf.get('1_year_return') not in ['0.00', 0.0, 0, ''] else None,
-            'return_3y': perf.get('3_year_return') if perf.get('3_year_return') not in ['0.00', 0.0, 0, ''] else None,
+            # 业绩数据（来自 FundBasicInfo.return_* 列）
+            'return_1m': basic.return_1m if basic else None,
+            'return_3m': basic.return_3m if basic else None,
+            'return_6m': basic.return_6m if basic else None,
+            # 如果近1年收益率为 0 且实际上可能是空数据，则转为 None 或 "--"
+            'return_1y': (basic.return_1y or None) if basic else None,
+            'return_3y': (basic.return_3y or None) if basic else None,
             # 风险指标（来自 FundRiskMetrics），如果脏数据则隐藏
             'max_drawdown_1y': (risk.max_drawdown_1y if risk else None) if not is_dirty_risk else None,
             'max_drawdown_3y': (risk.max_drawdown_3y if risk else None) if not is_dirty_risk else None,
@@ -1958,19 +1680,18 @@ def get_screening_fund_detail(fund_code):
         return jsonify({'error': 'Fund not found'}), 404
     
     basic, risk, rank, extra = result
-    perf = _json_loads(basic.performance_json, {})
     
     return jsonify({
         'fund_code': basic.fund_code,
         'fund_name': basic.fund_name,
         'fund_type': basic.fund_type,
         'returns': {
-            '1m': perf.get('1_month_return'),
-            '3m': perf.get('3_month_return'),
-            '6m': perf.get('6_month_return'),
-            '1y': perf.get('1_year_return'),
-            '2y': perf.get('2_year_return'),
-            '3y': perf.get('3_year_return'),
+            '1m': basic.return_1m,
+            '3m': basic.return_3m,
+            '6m': basic.return_6m,
+            '1y': basic.return_1y,
+            '2y': basic.return_2y,
+            '3y': basic.return_3y,
         },
         'risk_metrics': {
             'max_drawdown_1y': risk.max_drawdown_1y if risk else None,
@@ -2147,7 +1868,7 @@ def backtest_fixed_investment():
         if not trend:
             return jsonify({'error': f'Fund data not found for code {fund_code}'}), 404
         
-        net_worth_data = _json_loads(trend.net_worth_trend_json, [])
+        net_worth_data = _load_nav_trend(trend)
         if not net_worth_data:
             return jsonify({'error': 'No net worth data available'}), 404
         
@@ -2417,6 +2138,22 @@ def _run_backtest(nav_dict, dates, investment_type, amount, initial_amount, fee_
         'timeline': timeline
     }
 
+# ==================== 运行指标 API ====================
+
+@app.route('/api/system/metrics', methods=['GET'])
+def get_system_metrics():
+    """运行指标：上游连接池复用情况等"""
+    return jsonify({
+        'http': get_http_client().get_stats(),
+        'fund_detail_cache': fund_detail_cache.get_stats(),
+        'watchlist': watchlist_snapshot.get_stats(),
+        'estimate_poller': get_estimate_poller().get_stats(),
+        'market_prefetch': get_market_prefetcher().get_stats(),
+        'market_cache': get_cache_stats(),
+        'singleflight': get_singleflight().get_stats()
+    })
+
+
 def preload_services():
     """
     服务启动时的预加载任务
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+pingzhongdata 解析器基准测试（不被应用导入）
+对比 fund_api.parse_pingzhongdata 的单遍解析与旧版解析（正则查找 var + 逐字符扫描 + 引号替换 + json.loads）
+在示例数据（docs/数据示例.txt）上的耗时，并校验两者结果一致
+用法:
+    python bench_fund_parser.py [轮数]
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict
+
+from fund_api import SECTION_VARS, parse_pingzhongdata
+
+
+def _parse_js_value(js_content: str, start_pos: int) -> tuple:
+    """
+    从指定位置解析 JS 值（数组、对象、字符串、数字等）
+    返回 (解析后的值, 结束位置)
+    """
+    pos = start_pos
+    while pos < len(js_content) and js_content[pos] in ' \t\n\r':
+        pos += 1
+
+    if pos >= len(js_content):
+        return None, pos
+
+    char = js_content[pos]
+
+    # 数组
+    if char == '[':
+        depth = 1
+        end_pos = pos + 1
+        while end_pos < len(js_content) and depth > 0:
+            c = js_content[end_pos]
+            if c == '[':
+                depth += 1
+            elif c == ']':
+                depth -= 1
+            elif c == '"' or c == "'":
+                # 跳过字符串内容
+                quote = c
+                end_pos += 1
+                while end_pos < len(js_content):
+                    if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
+                        break
+                    end_pos += 1
+            end_pos += 1
+        return js_content[pos:end_pos], end_pos
+
+    # 对象
+    elif char == '{':
+        depth = 1
+        end_pos = pos + 1
+        while end_pos < len(js_content) and depth > 0:
+            c = js_content[end_pos]
+            if c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+            elif c == '"' or c == "'":
+                quote = c
+                end_pos += 1
+                while end_pos < len(js_content):
+                    if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
+                        break
+                    end_pos += 1
+            end_pos += 1
+        return js_content[pos:end_pos], end_pos
+
+    # 字符串
+    elif char == '"' or char == "'":
+        quote = char
+        end_pos = pos + 1
+        while end_pos < len(js_content):
+            if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
+                end_pos += 1
+                break
+            end_pos += 1
+        return js_content[pos:end_pos], end_pos
+
+    # 其他（数字、布尔值等）- 读取到分号
+    else:
+        end_pos = pos
+        while end_pos < len(js_content) and js_content[end_pos] != ';':
+            end_pos += 1
+        return js_content[pos:end_pos].strip(), end_pos
+
+
+def parse_pingzhongdata_legacy(js_content: str) -> Dict[str, Any]:
+    """
+    旧版解析流程（正则查找 var + 逐字符扫描 + 引号替换 + json.loads）
+    仅用于基准测试和解析结果一致性校验
+    """
+    data = {}
+    var_pattern = re.compile(r'var\s+(\w+)\s*=\s*')
+    for match in var_pattern.finditer(js_content):
+        var_name = match.group(1)
+        raw_value, _ = _parse_js_value(js_content, match.end())
+        if raw_value:
+            try:
+                if raw_value.startswith('[') or raw_value.startswith('{'):
+                    data[var_name] = json.loads(raw_value.replace("'", '"'))
+                elif raw_value.startswith('"') and raw_value.endswith('"'):
+                    data[var_name] = raw_value[1:-1]
+                elif raw_value.startswith("'") and raw_value.endswith("'"):
+                    data[var_name] = raw_value[1:-1]
+                else:
+                    data[var_name] = raw_value
+            except json.JSONDecodeError:
+                data[var_name] = raw_value
+    return data
+
+
+def benchmark_parser(sample_path: str = None, rounds: int = 200) -> Dict[str, Any]:
+    """
+    pingzhongdata 解析器基准测试：对比单遍解析与旧版解析在示例数据上的耗时，并校验结果一致
+    """
+    if sample_path is None:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sample_path = os.path.join(base_dir, 'docs', '数据示例.txt')
+    with open(sample_path, 'r', encoding='utf-8') as f:
+        js_content = f.read()
+
+    legacy_result = parse_pingzhongdata_legacy(js_content)
+    new_result = parse_pingzhongdata(js_content)
+
+    def timeit(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn(js_content)
+        return (time.perf_counter() - start) / rounds * 1000
+
+    legacy_ms = timeit(parse_pingzhongdata_legacy)
+    new_ms = timeit(parse_pingzhongdata)
+    nav_only_ms = timeit(lambda text: parse_pingzhongdata(text, SECTION_VARS['net_worth_trend']))
+    return {
+        'sample_bytes': len(js_content.encode('utf-8')),
+        'variables': len(new_result),
+        'rounds': rounds,
+        'legacy_ms': round(legacy_ms, 4),
+        'single_pass_ms': round(new_ms, 4),
+        'speedup': round(legacy_ms / new_ms, 2) if new_ms else None,
+        'nav_only_ms': round(nav_only_ms, 4),
+        'identical': legacy_result == new_result,
+    }
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    result = benchmark_parser(rounds=rounds)
+    print(f"示例数据: {result['sample_bytes']} 字节, {result['variables']} 个变量, {result['rounds']} 轮")
+    print(f"旧版解析: {result['legacy_ms']} ms/次")
+    print(f"单遍解析: {result['single_pass_ms']} ms/次 (提速 {result['speedup']}x)")
+    print(f"仅净值走势: {result['nav_only_ms']} ms/次")
+    print(f"结果一致: {result['identical']}")
+    sys.exit(0 if result['identical'] else 1)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+风险指标计算的一致性校验与基准测试（不被应用导入）
+将 risk_metrics 的向量化实现（逐点字典输入与 BLOB 输入）与旧版逐点循环实现逐项比对、计时
+用法:
+    python bench_risk_metrics.py parity [基金数] [数据库路径]   # 与旧版逐点循环实现逐项比对
+    python bench_risk_metrics.py bench [基金数]                 # 批量计算基准测试
+"""
+
+import json
+import math
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from nav_codec import decode_nav_series, encode_nav_series
+from risk_metrics import calculate_risk_metrics_batch, calculate_risk_metrics_from_blob, period_cutoffs
+
+
+def _calculate_risk_metrics_legacy(net_worth_trend, now: Optional[datetime] = None):
+    """旧版逐点循环实现，仅用于一致性校验与基准测试"""
+    if not net_worth_trend or len(net_worth_trend) < 30:
+        return None
+
+    sorted_data = sorted(net_worth_trend, key=lambda x: x.get('date', ''))
+    dates = []
+    values = []
+    for item in sorted_data:
+        if item.get('net_worth') is not None:
+            dates.append(item.get('date'))
+            values.append(float(item.get('net_worth')))
+
+    if len(values) >= 2:
+        v0 = values[0]
+        v1 = values[1]
+        if v0 > 0 and abs((v1 - v0) / v0) > 0.5:
+            values.pop(0)
+            dates.pop(0)
+
+    if len(values) < 30:
+        return None
+
+    now = now or datetime.now()
+
+    def get_period_data(months):
+        if months == 'all':
+            return values, dates
+        cutoff_date = (now - timedelta(days=months * 30)).strftime('%Y-%m-%d')
+        period_values = []
+        period_dates = []
+        for i, d in enumerate(dates):
+            if d >= cutoff_date:
+                period_values.append(values[i])
+                period_dates.append(d)
+        return period_values, period_dates
+
+    def calc_max_drawdown(period_values):
+        if len(period_values) < 2:
+            return None
+        peak = period_values[0]
+        max_dd = 0
+        for value in period_values:
+            if value > peak:
+                peak = value
+            drawdown = (peak - value) / peak * 100
+            if drawdown > max_dd:
+                max_dd = drawdown
+        return round(max_dd, 2)
+
+    def calc_daily_returns(period_values):
+        if len(period_values) < 2:
+            return []
+        returns = []
+        for i in range(1, len(period_values)):
+            if period_values[i-1] != 0:
+                ret = (period_values[i] - period_values[i-1]) / period_values[i-1]
+                returns.append(ret)
+        return returns
+
+    def calc_annual_return(period_values, trading_days):
+        if len(period_values) < 2 or period_values[0] == 0 or trading_days <= 0:
+            return None
+        total_return = (period_values[-1] - period_values[0]) / period_values[0]
+        annual_return = ((1 + total_return) ** (252 / trading_days) - 1) * 100
+        return round(annual_return, 2)
+
+    def calc_volatility(daily_returns):
+        if len(daily_returns) < 10:
+            return None
+        mean_return = sum(daily_returns) / len(daily_returns)
+        variance = sum((r - mean_return) ** 2 for r in daily_returns) / len(daily_returns)
+        daily_vol = math.sqrt(variance)
+        annual_vol = daily_vol * math.sqrt(252) * 100
+        return round(annual_vol, 2)
+
+    def calc_sharpe_ratio(annual_return, volatility, risk_free_rate=2.0):
+        if volatility is None or volatility == 0 or annual_return is None:
+            return None
+        sharpe = (annual_return - risk_free_rate) / volatility
+        return round(sharpe, 2)
+
+    result = {}
+    for period, months in [('3m', 3), ('6m', 6), ('1y', 12), ('3y', 36), ('all', 'all')]:
+        period_values, _ = get_period_data(months)
+        result[f'max_drawdown_{period}'] = calc_max_drawdown(period_values)
+
+    min_trading_days = {'1y': 200, '3y': 600}
+    for period, months in [('1y', 12), ('3y', 36)]:
+        period_values, period_dates = get_period_data(months)
+        trading_days = len(period_values)
+
+        min_days = min_trading_days.get(period, 30)
+        if trading_days < min_days:
+            result[f'annual_return_{period}'] = None
+            result[f'volatility_{period}'] = None
+            result[f'sharpe_ratio_{period}'] = None
+            result[f'calmar_ratio_{period}'] = None
+            continue
+
+        daily_returns = calc_daily_returns(period_values)
+        annual_return = calc_annual_return(period_values, trading_days)
+        volatility = calc_volatility(daily_returns)
+        sharpe = calc_sharpe_ratio(annual_return, volatility)
+
+        if volatility is not None and volatility > 500:
+            result[f'annual_return_{period}'] = None
+            result[f'volatility_{period}'] = None
+            result[f'sharpe_ratio_{period}'] = None
+            result[f'calmar_ratio_{period}'] = None
+            continue
+
+        result[f'annual_return_{period}'] = annual_return
+        result[f'volatility_{period}'] = volatility
+        result[f'sharpe_ratio_{period}'] = sharpe
+
+        max_dd = result.get(f'max_drawdown_{period}')
+        if annual_return is not None and max_dd is not None and max_dd > 0:
+            result[f'calmar_ratio_{period}'] = round(annual_return / max_dd, 2)
+        else:
+            result[f'calmar_ratio_{period}'] = None
+
+    return result
+
+
+def synthetic_trends(count: int, seed: int = 7, now: Optional[datetime] = None) -> Dict[str, list]:
+    """生成随机净值走势（长度、起始日期、异常首日、空净值各不相同），用于校验与基准测试"""
+    rng = np.random.default_rng(seed)
+    now = now or datetime.now()
+    trends = {}
+    for i in range(count):
+        length = int(rng.integers(20, 2500))
+        start = now - timedelta(days=int(length * 1.45) + int(rng.integers(0, 60)))
+        step_vol = float(rng.choice([0.002, 0.01, 0.02, 0.04]))
+        values = np.cumprod(1 + rng.normal(0.0003, step_vol, length)) * float(rng.uniform(0.5, 3))
+        trend = []
+        day = start
+        for value in values:
+            day += timedelta(days=1 if day.weekday() < 4 else 3)
+            trend.append({'date': day.strftime('%Y-%m-%d'), 'net_worth': max(round(float(value), 4), 0.0001),
+                          'equity_return': None, 'dividend': ''})
+        if i % 7 == 0 and trend:
+            trend[0]['net_worth'] = 1.0 if trend[0]['net_worth'] > 2 else 100.0
+        if i % 11 == 0:
+            for item in trend[::37]:
+                item['net_worth'] = None
+        if i % 5 == 0:
+            rng.shuffle(trend)
+        trends[f'{i:06d}'] = trend
+    return trends
+
+
+def _load_db_trends(db_path: str, limit: int) -> Dict[str, list]:
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(fund_trend)")]
+        blob_column = 'net_worth_trend_blob' if 'net_worth_trend_blob' in columns else 'NULL'
+        rows = conn.execute(
+            f"SELECT fund_code, {blob_column}, net_worth_trend_json FROM fund_trend "
+            f"WHERE {blob_column} IS NOT NULL OR net_worth_trend_json IS NOT NULL LIMIT ?",
+            (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    trends = {}
+    for code, blob, trend_json in rows:
+        if blob:
+            trends[code] = decode_nav_series(blob)
+        elif trend_json:
+            trends[code] = json.loads(trend_json)
+    return trends
+
+
+def check_parity(trends: Dict[str, list], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """逐只基金、逐项比对向量化实现（含 BLOB 输入）与旧版实现的结果"""
+    now = now or datetime.now()
+    cutoffs = period_cutoffs(now)
+    vectorized = calculate_risk_metrics_batch(trends, now=now)
+    mismatches = []
+    computed = 0
+    for fund_code, trend in trends.items():
+        expected = _calculate_risk_metrics_legacy(trend, now=now)
+        actual = vectorized.get(fund_code)
+        if expected is not None:
+            computed += 1
+        if expected != actual:
+            mismatches.append({'fund_code': fund_code, 'expected': expected, 'actual': actual})
+            continue
+        blob = encode_nav_series(trend)
+        if blob is not None:
+            from_blob = calculate_risk_metrics_from_blob(blob, cutoffs=cutoffs)
+            if expected != from_blob:
+                mismatches.append({'fund_code': f'{fund_code} (blob)', 'expected': expected, 'actual': from_blob})
+    return {'funds': len(trends), 'computed': computed, 'mismatches': mismatches}
+
+
+def benchmark(count: int = 2000) -> Dict[str, Any]:
+    now = datetime.now()
+    cutoffs = period_cutoffs(now)
+    trends = synthetic_trends(count, now=now)
+    blobs = [blob for blob in (encode_nav_series(trend) for trend in trends.values()) if blob is not None]
+
+    start = time.perf_counter()
+    for trend in trends.values():
+        _calculate_risk_metrics_legacy(trend, now=now)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_risk_metrics_batch(trends, now=now)
+    vectorized_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for blob in blobs:
+        calculate_risk_metrics_from_blob(blob, cutoffs=cutoffs)
+    blob_s = time.perf_counter() - start
+
+    return {
+        'funds': count,
+        'points': sum(len(trend) for trend in trends.values()),
+        'legacy_s': round(legacy_s, 3),
+        'vectorized_s': round(vectorized_s, 3),
+        'speedup': round(legacy_s / vectorized_s, 2) if vectorized_s else None,
+        'blob_funds': len(blobs),
+        'blob_s': round(blob_s, 3),
+        'blob_speedup': round(legacy_s / blob_s * len(blobs) / count, 2) if blob_s else None,
+    }
+
+
+if __name__ == '__main__':
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'parity'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    if command == 'parity':
+        trends = synthetic_trends(count)
+        if len(sys.argv) > 3:
+            trends.update(_load_db_trends(sys.argv[3], count))
+        report = check_parity(trends)
+        print(f"校验基金: {report['funds']} 只（可计算 {report['computed']} 只），不一致: {len(report['mismatches'])}")
+        for item in report['mismatches'][:5]:
+            print(f"  {item['fund_code']}: 旧版 {item['expected']}\n           新版 {item['actual']}")
+        sys.exit(1 if report['mismatches'] else 0)
+    elif command == 'bench':
+        result = benchmark(count)
+        print(f"基金: {result['funds']} 只, 净值点: {result['points']}")
+        print(f"旧版逐点循环: {result['legacy_s']} s")
+        print(f"向量化（逐点字典输入）: {result['vectorized_s']} s (提速 {result['speedup']}x)")
+        print(f"向量化（BLOB 输入 {result['blob_funds']} 只）: {result['blob_s']} s (提速 {result['blob_speedup']}x)")
+    else:
+        print(f"未知命令: {command}")
+        print("可用命令: parity [基金数] [数据库路径] | bench [基金数]")
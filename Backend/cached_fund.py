@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+数据库缓存的基金详情读取
+- 一条 LEFT JOIN 语句读取基本信息、走势、估值、持仓、扩展数据与风险指标（一次数据库往返）
+- 各数据段按需解码：只有被访问的字段才 json.loads，未访问的保持库中的 JSON 文本
+- 返回接口时直接拼接库中已序列化的 JSON 文本，不再 解码 -> 重新编码
+库中的 JSON 均由写库时的 json.dumps 生成，可直接作为响应片段使用
+"""
+
+import json
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import String, bindparam, select
+from sqlalchemy.orm import Session
+
+from models import FundBasicInfo, FundTrend, FundEstimate, FundPortfolio, FundExtraData, FundRiskMetrics
+from nav_codec import decode_nav_json, decode_nav_series
+from risk_metrics import RISK_METRIC_FIELDS
+
+# 响应字段 -> (表, JSON 列, 缺省值)
+JSON_SECTIONS = {
+    'basic_info': (FundBasicInfo, 'basic_json', {}),
+    'performance': (FundBasicInfo, 'performance_json', {}),
+    'accumulated_net_worth': (FundTrend, 'accumulated_net_worth_json', []),
+    'position_trend': (FundTrend, 'position_trend_json', []),
+    'total_return_trend': (FundTrend, 'total_return_trend_json', []),
+    'ranking_trend': (FundTrend, 'ranking_trend_json', []),
+    'ranking_percentage': (FundTrend, 'ranking_percentage_json', []),
+    'scale_fluctuation': (FundTrend, 'scale_fluctuation_json', {}),
+    'holder_structure': (FundExtraData, 'holder_structure_json', {}),
+    'asset_allocation': (FundExtraData, 'asset_allocation_json', {}),
+    'performance_evaluation': (FundExtraData, 'performance_evaluation_json', {}),
+    'fund_managers': (FundExtraData, 'fund_managers_json', []),
+    'subscription_redemption': (FundExtraData, 'subscription_redemption_json', {}),
+    'same_type_funds': (FundExtraData, 'same_type_funds_json', []),
+}
+
+# portfolio 字段 -> FundPortfolio 的 JSON 列
+PORTFOLIO_SECTIONS = {
+    'stock_codes': 'stock_codes_json',
+    'bond_codes': 'bond_codes_json',
+    'stock_codes_new': 'stock_codes_new_json',
+    'bond_codes_new': 'bond_codes_new_json',
+}
+
+ESTIMATE_FIELDS = ('name', 'net_worth', 'net_worth_date', 'estimate_value', 'estimate_change', 'estimate_time')
+
+# 查询列名前缀
+TABLE_PREFIXES = {
+    FundBasicInfo: 'basic',
+    FundTrend: 'trend',
+    FundEstimate: 'estimate',
+    FundPortfolio: 'portfolio',
+    FundExtraData: 'extra',
+    FundRiskMetrics: 'risk',
+}
+
+DATA_TABLES = (FundBasicInfo, FundTrend, FundEstimate, FundPortfolio, FundExtraData)
+
+
+def _json_loads(text, default):
+    if not text:
+        return default
+    try:
+        return json.loads(text)
+    except Exception:
+        return default
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _valid_json(text) -> bool:
+    """
+    库中文本能否直接作为 JSON 片段（空值按缺省值处理）
+    完整解析校验：截断或损坏的文本拼接进响应会使整个响应体无法解析
+    """
+    if not text:
+        return False
+    try:
+        json.loads(text)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+class CachedFund(Mapping):
+    """
+    数据库中缓存的基金详情（只读映射，字段与 fund_api.get_fund_data 一致）
+    data[key] 时才解码对应数据段；to_json() 直接拼接原始 JSON 文本
+    附加字段（如 risk_metrics）通过 set_extra 设置
+    """
+
+    def __init__(self, fund_code: str, texts: Dict[str, str], defaults: Dict[str, Any],
+                 loaders: Dict[str, Callable[[], Any]], trend_time: Optional[datetime] = None,
+                 risk_record: Optional[Dict[str, Any]] = None,
+                 fragment_loaders: Optional[Dict[str, Callable[[], str]]] = None):
+        self.fund_code = fund_code
+        self.trend_time = trend_time            # FundTrend.updated_time，没有走势数据时为 None
+        self.risk_record = risk_record          # FundRiskMetrics 各字段 + updated_time，没有记录时为 None
+        self._texts = texts                     # 字段 -> 已序列化的 JSON 文本
+        self._defaults = defaults               # 字段 -> 文本无法解析时的缺省值
+        self._loaders = loaders                 # 字段 -> 生成值的函数（非 JSON 存储的字段）
+        self._fragment_loaders = fragment_loaders or {}  # 字段 -> 直接生成 JSON 文本的函数（可选）
+        self._values: Dict[str, Any] = {}
+        self._fragments: Dict[str, str] = {}
+        self._extra: Dict[str, Any] = {}
+
+    def __getitem__(self, key):
+        if key in self._extra:
+            return self._extra[key]
+        if key not in self._values:
+            if key in self._texts:
+                self._values[key] = _json_loads(self._texts[key], self._defaults.get(key))
+            elif key in self._loaders:
+                self._values[key] = self._loaders[key]()
+            else:
+                raise KeyError(key)
+        return self._values[key]
+
+    def __iter__(self):
+        yield from self._texts
+        yield from self._loaders
+        yield from (key for key in self._extra if key not in self._texts and key not in self._loaders)
+
+    def __len__(self):
+        return len(set(self._texts) | set(self._loaders) | set(self._extra))
+
+    def set_extra(self, key: str, value: Any):
+        """设置附加字段（覆盖同名数据段）"""
+        self._extra[key] = value
+
+    def _fragment(self, key: str) -> str:
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            if key in self._texts:
+                # 库中文本首次拼接前校验一次（对象缓存在内存中，之后的请求直接复用），无法解析时使用缺省值
+                text = self._texts[key]
+                fragment = text if _valid_json(text) else _dumps(self._defaults.get(key))
+            else:
+                # 非 JSON 存储的字段（净值走势等）序列化一次后复用
+                loader = self._fragment_loaders.get(key)
+                fragment = loader() if loader else _dumps(self[key])
+            self._fragments[key] = fragment
+        return fragment
+
+    def to_json(self, extra: Optional[Dict[str, Any]] = None) -> str:
+        """序列化为响应 JSON；extra 中的字段覆盖同名字段"""
+        overrides = {**self._extra, **(extra or {})}
+        parts = [f'{_dumps(key)}: {self._fragment(key)}' for key in self if key not in overrides]
+        parts.extend(f'{_dumps(key)}: {_dumps(value)}' for key, value in overrides.items())
+        return '{' + ', '.join(parts) + '}'
+
+
+def _columns():
+    """查询列：各表 id（判断记录是否存在）与各数据段所需的列，统一加表前缀命名"""
+    columns = [model.id.label(f'{prefix}_id') for model, prefix in TABLE_PREFIXES.items()]
+    columns.extend(getattr(model, column).label(f'{TABLE_PREFIXES[model]}_{column}')
+                   for model, column, _ in JSON_SECTIONS.values())
+    columns.extend(getattr(FundPortfolio, column).label(f'portfolio_{column}') for column in PORTFOLIO_SECTIONS.values())
+    columns.extend(getattr(FundEstimate, field).label(f'estimate_{field}') for field in ESTIMATE_FIELDS)
+    columns.extend([
+        FundTrend.net_worth_trend_blob.label('trend_net_worth_trend_blob'),
+        FundTrend.net_worth_trend_json.label('trend_net_worth_trend_json'),
+        FundTrend.updated_time.label('trend_updated_time'),
+        FundRiskMetrics.updated_time.label('risk_updated_time'),
+    ])
+    columns.extend(getattr(FundRiskMetrics, field).label(f'risk_{field}') for field in RISK_METRIC_FIELDS)
+    return columns
+
+
+def _build_statement():
+    """SELECT ... FROM (SELECT :fund_code) k LEFT JOIN 各表 ON fund_code，任一表没有记录时对应列为 NULL"""
+    key = select(bindparam('fund_code', type_=String(6)).label('fund_code')).subquery('k')
+    statement = select(*_columns()).select_from(key)
+    for model in TABLE_PREFIXES:
+        statement = statement.outerjoin(model, model.fund_code == key.c.fund_code)
+    return statement
+
+
+CACHED_FUND_STATEMENT = _build_statement()
+
+
+def load_nav_trend_json(fund_code: str, blob, trend_json) -> str:
+    """单位净值走势的 JSON 文本：二进制列直接生成文本，旧数据使用库中的 JSON"""
+    if blob:
+        try:
+            return decode_nav_json(blob)
+        except Exception as e:
+            print(f"Error decoding net worth blob for {fund_code}: {e}")
+    return trend_json if _valid_json(trend_json) else '[]'
+
+
+def load_nav_trend(fund_code: str, blob, trend_json):
+    """读取单位净值走势：优先二进制列，未迁移的旧数据回退 JSON"""
+    if blob:
+        try:
+            return decode_nav_series(blob)
+        except Exception as e:
+            print(f"Error decoding net worth blob for {fund_code}: {e}")
+    return _json_loads(trend_json, [])
+
+
+def load_cached_fund(db: Session, fund_code: str) -> Optional[CachedFund]:
+    """读取数据库中缓存的基金详情，五张数据表都没有记录时返回 None"""
+    row = db.execute(CACHED_FUND_STATEMENT, {'fund_code': fund_code}).mappings().first()
+    present = {model: row[f'{prefix}_id'] is not None for model, prefix in TABLE_PREFIXES.items()}
+    if not any(present[model] for model in DATA_TABLES):
+        return None
+
+    texts = {}
+    defaults = {}
+    loaders = {}
+    fragment_loaders = {}
+    for key, (model, column, default) in JSON_SECTIONS.items():
+        if present[model]:
+            text = row[f'{TABLE_PREFIXES[model]}_{column}']
+            texts[key] = text or _dumps(default)
+            defaults[key] = default
+
+    if present[FundTrend]:
+        blob, trend_json = row['trend_net_worth_trend_blob'], row['trend_net_worth_trend_json']
+        loaders['net_worth_trend'] = lambda: load_nav_trend(fund_code, blob, trend_json)
+        fragment_loaders['net_worth_trend'] = lambda: load_nav_trend_json(fund_code, blob, trend_json)
+
+    if present[FundEstimate]:
+        estimate = {field: row[f'estimate_{field}'] for field in ESTIMATE_FIELDS}
+        estimate['fund_code'] = fund_code
+        loaders['realtime_estimate'] = lambda: dict(estimate)
+
+    if present[FundPortfolio]:
+        parts = []
+        for key, column in PORTFOLIO_SECTIONS.items():
+            text = row[f'portfolio_{column}']
+            parts.append(f'{_dumps(key)}: {text if _valid_json(text) else "[]"}')
+        texts['portfolio'] = '{' + ', '.join(parts) + '}'
+        defaults['portfolio'] = {}
+
+    risk_record = None
+    if present[FundRiskMetrics]:
+        risk_record = {field: row[f'risk_{field}'] for field in RISK_METRIC_FIELDS}
+        risk_record['updated_time'] = row['risk_updated_time']
+
+    trend_time = row['trend_updated_time'] if present[FundTrend] else None
+    return CachedFund(fund_code, texts, defaults, loaders, trend_time, risk_record, fragment_loaders)
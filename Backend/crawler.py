@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+基金数据批量抓取引擎
+为筛选数据的全量更新提供：
+- 有界并发的抓取工作线程
+- 按域名的令牌桶限速（天天基金 / 实时估值接口分别限速）
+- 错误率升高时自适应退避（速率减半 + 指数暂停）
+- 单一数据库写入线程，工作线程只负责抓取与计算
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+
+# 默认并发工作线程数
+DEFAULT_WORKERS = 8
+
+# 各上游域名的限速配置（请求/秒）
+DEFAULT_HOST_RATES = {
+    'fund.eastmoney.com': 8.0,          # pingzhongdata 详情
+    'fundgz.1234567.com.cn': 10.0,      # 实时估值
+}
+
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，允许不超过容量的突发"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+class HostRateLimiter:
+    """
+    按域名限速器
+    - 每个域名一个令牌桶
+    - 统计最近 window 次请求的错误率，超过阈值时速率减半并暂停该域名（指数退避）
+    - 恢复正常后速率逐步回升到配置值
+    """
+
+    def __init__(self, host_rates: Optional[Dict[str, float]] = None, window: int = 50,
+                 error_threshold: float = 0.2, min_rate_factor: float = 0.1,
+                 max_backoff: float = 60.0):
+        host_rates = host_rates or DEFAULT_HOST_RATES
+        self._base_rates = dict(host_rates)
+        self._buckets = {host: TokenBucket(rate) for host, rate in host_rates.items()}
+        self._results = {host: deque(maxlen=window) for host in host_rates}
+        self._pause_until = {host: 0.0 for host in host_rates}
+        self._backoff = {host: 0.0 for host in host_rates}
+        self._window = window
+        self._error_threshold = error_threshold
+        self._min_rate_factor = min_rate_factor
+        self._max_backoff = max_backoff
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).hostname or ''
+
+    def acquire(self, url: str):
+        """请求前调用：等待退避结束并取得令牌（未配置的域名不限速）"""
+        host = self._host(url)
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            return
+        pause = self._pause_until[host] - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        bucket.acquire()
+
+    def report(self, url: str, ok: bool):
+        """请求后调用：记录结果并按错误率调整速率"""
+        host = self._host(url)
+        if host not in self._buckets:
+            return
+
+        with self._lock:
+            results = self._results[host]
+            results.append(ok)
+            if len(results) < min(10, self._window):
+                return
+
+            error_rate = results.count(False) / len(results)
+            bucket = self._buckets[host]
+            base_rate = self._base_rates[host]
+
+            if error_rate > self._error_threshold:
+                # 乘性减速 + 指数退避暂停
+                bucket.set_rate(max(base_rate * self._min_rate_factor, bucket.rate / 2))
+                self._backoff[host] = min(self._max_backoff, max(1.0, self._backoff[host] * 2))
+                self._pause_until[host] = time.monotonic() + self._backoff[host]
+                results.clear()
+                print(f"[Crawler] {host} 错误率 {error_rate:.0%}，降速至 {bucket.rate:.2f}/s，暂停 {self._backoff[host]:.0f}s")
+            elif ok and bucket.rate < base_rate:
+                # 加性恢复
+                bucket.set_rate(min(base_rate, bucket.rate + base_rate * 0.02))
+                if error_rate == 0:
+                    self._backoff[host] = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                host: {
+                    'rate': round(bucket.rate, 2),
+                    'base_rate': self._base_rates[host],
+                    'backoff': self._backoff[host],
+                }
+                for host, bucket in self._buckets.items()
+            }
+
+
+@dataclass
+class CrawlResult:
+    """单只基金的抓取结果"""
+    fund_code: str
+    payload: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class FundCrawler:
+    """
+    批量抓取引擎
+    fetch(fund_code) 在工作线程中执行，返回待写入的数据，失败时抛出异常；
+    write(results) 只在唯一的写入线程中执行，按批次接收 CrawlResult 列表。
+    """
+
+    _STOP = object()
+
+    def __init__(self, fetch: Callable[[str], Any], write: Callable[[List[CrawlResult]], None],
+                 workers: int = DEFAULT_WORKERS, batch_size: int = 20, flush_interval: float = 1.0):
+        self.fetch = fetch
+        self.write = write
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.success_count = 0
+        self.fail_count = 0
+
+    def _fetch_one(self, fund_code: str, results: queue.Queue, slots: threading.Semaphore):
+        try:
+            payload = self.fetch(fund_code)
+            results.put(CrawlResult(fund_code, payload=payload))
+        except Exception as e:
+            results.put(CrawlResult(fund_code, error=str(e) or e.__class__.__name__))
+        finally:
+            slots.release()
+
+    def _writer_loop(self, results: queue.Queue, on_result: Optional[Callable[[CrawlResult], None]]):
+        batch: List[CrawlResult] = []
+        last_flush = time.monotonic()
+
+        def flush():
+            nonlocal batch, last_flush
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    print(f"[Crawler] 批量写入失败: {e}")
+                    batch = [CrawlResult(r.fund_code, error=f"写入失败: {e}") if r.ok else r for r in batch]
+                for r in batch:
+                    if r.ok:
+                        self.success_count += 1
+                    else:
+                        self.fail_count += 1
+                    if on_result:
+                        on_result(r)
+                batch = []
+            last_flush = time.monotonic()
+
+        while True:
+            try:
+                item = results.get(timeout=self.flush_interval)
+            except queue.Empty:
+                flush()
+                continue
+            if item is self._STOP:
+                flush()
+                return
+            batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                flush()
+
+    def run(self, fund_codes: Iterable[str], should_stop: Optional[Callable[[], bool]] = None,
+            on_result: Optional[Callable[[CrawlResult], None]] = None) -> Dict[str, int]:
+        """
+        抓取全部基金，阻塞直到完成或被停止
+        should_stop: 每次派发任务前检查，返回 True 时不再派发新任务（已在途的任务会写完）
+        on_result: 每条结果写入后在写入线程中回调
+        """
+        results: queue.Queue = queue.Queue(maxsize=self.workers * 4)
+        # 在途任务上限，避免一次性提交上万个任务
+        slots = threading.Semaphore(self.workers * 2)
+
+        writer = threading.Thread(target=self._writer_loop, args=(results, on_result), daemon=True)
+        writer.start()
+
+        dispatched = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fund-crawler') as executor:
+            for fund_code in fund_codes:
+                if should_stop and should_stop():
+                    break
+                slots.acquire()
+                executor.submit(self._fetch_one, fund_code, results, slots)
+                dispatched += 1
+
+        results.put(self._STOP)
+        writer.join()
+
+        return {
+            'dispatched': dispatched,
+            'success_count': self.success_count,
+            'fail_count': self.fail_count,
+        }
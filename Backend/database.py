@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine, text
+import json
+import os
+
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
-from models import Base
+from models import Base, FundBasicInfo
+from screening_rankings import RETURN_COLUMNS, parse_return_columns
 from pathlib import Path
 
 # 获取当前文件所在目录（Backend/）
@@ -13,7 +17,56 @@ DATABASE_PATH = PROJECT_ROOT / "Data" / "funds.db"
 # 构造 SQLite URL
 DATABASE_URL = f"sqlite:///{DATABASE_PATH.as_posix()}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite 连接配置
+# performance（默认）：WAL 模式，批量写入提交时不阻塞读请求；synchronous=NORMAL 在 WAL 下仍保证一致性，
+#                     断电时最多丢失最后几个已提交事务
+# default：SQLite 默认配置（回滚日志 + synchronous=FULL），用于排查问题或对比
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'performance').lower()
+# 等待写锁的超时时间（秒），超时后抛出 database is locked
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '30'))
+# 连接池：批量更新的写入线程 + 交互请求各占一个连接
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '10'))
+SQLITE_MAX_OVERFLOW = int(os.getenv('SQLITE_MAX_OVERFLOW', '20'))
+
+SQLITE_PRAGMAS = {
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': int(os.getenv('SQLITE_CACHE_KB', '65536')) * -1,  # 负数表示 KB
+        'mmap_size': int(os.getenv('SQLITE_MMAP_MB', '256')) * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'journal_size_limit': 64 * 1024 * 1024,  # checkpoint 后截断 WAL 文件
+    },
+    'default': {},
+}
+
+
+def _set_sqlite_pragmas(pragmas, busy_timeout):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def create_db_engine(database_url=DATABASE_URL, profile=SQLITE_PROFILE):
+    """按连接配置创建引擎，每个新连接建立时设置 PRAGMA"""
+    pragmas = SQLITE_PRAGMAS.get(profile, SQLITE_PRAGMAS['performance'])
+    new_engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+    )
+    event.listen(new_engine, 'connect', _set_sqlite_pragmas(pragmas, SQLITE_BUSY_TIMEOUT))
+    return new_engine
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def migrate_db():
@@ -44,6 +97,55 @@ def migrate_db():
                 print("Migration: Added step_message column to daily_market_summary table")
         except Exception as e:
             print(f"Migration check for daily_market_summary: {e}")
+        
+        # 检查并添加 fund_trend.net_worth_trend_blob 列（存量 JSON 通过 migrate_db.py pack-nav 离线转换）
+        try:
+            result = conn.execute(text("PRAGMA table_info(fund_trend)"))
+            columns = [row[1] for row in result.fetchall()]
+            if 'net_worth_trend_blob' not in columns:
+                conn.execute(text("ALTER TABLE fund_trend ADD COLUMN net_worth_trend_blob BLOB"))
+                conn.commit()
+                print("Migration: Added net_worth_trend_blob column to fund_trend table")
+        except Exception as e:
+            print(f"Migration check for fund_trend: {e}")
+        
+        # 检查并添加 fund_basic_info 的阶段收益列，并从 performance_json 回填
+        try:
+            result = conn.execute(text("PRAGMA table_info(fund_basic_info)"))
+            columns = [row[1] for row in result.fetchall()]
+            missing = [column for column in RETURN_COLUMNS if column not in columns]
+            for column in missing:
+                conn.execute(text(f"ALTER TABLE fund_basic_info ADD COLUMN {column} FLOAT"))
+            if missing:
+                count = backfill_return_columns(conn)
+                print(f"Migration: Added {', '.join(missing)} to fund_basic_info, backfilled {count} rows")
+            for index in FundBasicInfo.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+            conn.commit()
+        except Exception as e:
+            print(f"Migration check for fund_basic_info returns: {e}")
+
+
+def backfill_return_columns(conn, batch_size=2000):
+    """从 performance_json 解析阶段收益并写入 return_* 列（不提交）"""
+    rows = conn.execute(text(
+        "SELECT id, performance_json FROM fund_basic_info WHERE performance_json IS NOT NULL"
+    )).fetchall()
+    assignments = ', '.join(f"{column} = :{column}" for column in RETURN_COLUMNS)
+    statement = text(f"UPDATE fund_basic_info SET {assignments} WHERE id = :id")
+    params = []
+    for row_id, performance_json in rows:
+        try:
+            performance = json.loads(performance_json) if performance_json else {}
+        except (json.JSONDecodeError, TypeError):
+            performance = {}
+        params.append({'id': row_id, **parse_return_columns(performance)})
+        if len(params) >= batch_size:
+            conn.execute(statement, params)
+            params = []
+    if params:
+        conn.execute(statement, params)
+    return len(rows)
 
 def init_db():
     # 确保 Data 目录存在
@@ -58,4 +160,101 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def benchmark_concurrent_reads(profile, seconds=5.0, funds=5000, batch_size=200):
+    """
+    模拟批量更新期间的筛选查询：写线程按批更新基本信息与净值数据并提交（与 batch_update_fund_data 的写入方式相同），
+    读线程持续执行筛选查询，统计查询延迟与锁等待失败次数
+    """
+    import random
+    import shutil
+    import tempfile
+    import threading
+    import time
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        bench_engine = create_db_engine(f"sqlite:///{Path(temp_dir, 'bench.db').as_posix()}", profile)
+        Base.metadata.create_all(bind=bench_engine)
+        rng = random.Random(1)
+        fund_types = ['股票型', '混合型', '债券型', '指数型']
+        with bench_engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO fund_basic_info (fund_code, fund_name, fund_type, return_1y) VALUES (:code, :name, :type, :ret)"
+            ), [{'code': f'{i:06d}', 'name': f'基金{i}', 'type': fund_types[i % 4], 'ret': rng.uniform(-30, 60)}
+                for i in range(funds)])
+            conn.execute(text("INSERT INTO fund_trend (fund_code, net_worth_trend_blob) VALUES (:code, :blob)"),
+                         [{'code': f'{i:06d}', 'blob': rng.randbytes(20000)} for i in range(funds)])
+
+        stop = threading.Event()
+        latencies = []
+        errors = []
+        commits = [0]
+
+        def writer():
+            offset = 0
+            while not stop.is_set():
+                codes = [f'{(offset + i) % funds:06d}' for i in range(batch_size)]
+                offset += batch_size
+                try:
+                    with bench_engine.begin() as conn:
+                        conn.execute(text("UPDATE fund_basic_info SET return_1y = :ret, performance_json = :perf WHERE fund_code = :code"),
+                                     [{'code': code, 'ret': rng.uniform(-30, 60), 'perf': '{}'} for code in codes])
+                        conn.execute(text("UPDATE fund_trend SET net_worth_trend_blob = :blob WHERE fund_code = :code"),
+                                     [{'code': code, 'blob': rng.randbytes(20000)} for code in codes])
+                    commits[0] += 1
+                except Exception as e:
+                    errors.append(f'write: {e}')
+
+        def reader():
+            query = text(
+                "SELECT b.fund_code, b.fund_name, b.return_1y, t.updated_time FROM fund_basic_info b "
+                "LEFT JOIN fund_trend t ON t.fund_code = b.fund_code "
+                "WHERE b.fund_type = :type ORDER BY b.return_1y DESC LIMIT 20"
+            )
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with bench_engine.connect() as conn:
+                        conn.execute(query, {'type': rng.choice(fund_types)}).fetchall()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors.append(f'read: {e}')
+
+        threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        bench_engine.dispose()
+
+        latencies.sort()
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+        return {
+            'profile': profile,
+            'reads': len(latencies),
+            'commits': commits[0],
+            'p50_ms': round(percentile(0.5), 2),
+            'p99_ms': round(percentile(0.99), 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0,
+            'errors': len(errors),
+        }
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+        for bench_profile in ('default', 'performance'):
+            result = benchmark_concurrent_reads(bench_profile, seconds)
+            print(f"[{result['profile']}] 查询 {result['reads']} 次，写入提交 {result['commits']} 次，"
+                  f"延迟 p50 {result['p50_ms']} ms / p99 {result['p99_ms']} ms / max {result['max_ms']} ms，"
+                  f"错误 {result['errors']} 次")
+    else:
+        print("用法: python database.py bench [秒数] - 对比默认配置与性能配置下批量写入期间的查询延迟")
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+自定义数据库列类型
+CompressedJSONText: 大字段 JSON 文本透明压缩
+- 写入时超过 MIN_COMPRESS_SIZE 的文本压缩为 BLOB（带 2 字节前缀标记编码方式），读取时自动解压为 str
+- 旧数据（未压缩的 TEXT）原样读取，新旧数据可以混存，无需修改表结构
+- 压缩方式由环境变量 JSON_COMPRESSION 指定：zlib（默认）/ zstd / none
+  zstd 为可选依赖（pip install zstandard），可配合共享字典（JSON_ZSTD_DICT，默认 Data/json_zstd.dict）
+  对大量结构相似的小 JSON 进一步提高压缩率；字典由 migrate_db.py train-zstd-dict 生成
+  字典有版本：zstd 帧头记录字典 ID，重新训练时旧字典归档为 json_zstd.<字典ID>.dict，
+  解压时按帧头的字典 ID 选用对应字典，旧字典压缩的数据在重新训练后仍可读取
+存量数据通过 migrate_db.py compress-json 离线转换
+"""
+
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    zstandard = None
+
+# 小于该长度的文本不压缩（压缩头开销与 CPU 不划算）
+MIN_COMPRESS_SIZE = 512
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# 压缩数据前缀：JSON 文本不会以 \x00 开头，可与未压缩数据区分
+PREFIX_ZLIB = b'\x00z'
+PREFIX_ZSTD = b'\x00s'
+PREFIX_ZSTD_DICT = b'\x00d'
+
+JSON_COMPRESSION = os.getenv('JSON_COMPRESSION', 'zlib').lower()
+JSON_ZSTD_DICT_PATH = Path(os.getenv(
+    'JSON_ZSTD_DICT',
+    Path(__file__).resolve().parent.parent / 'Data' / 'json_zstd.dict'
+))
+
+_local = threading.local()
+_dict_lock = threading.Lock()
+_zstd_dict = None
+_zstd_dicts = None           # 字典 ID -> 字典（当前字典与归档的旧字典）
+_zstd_dict_generation = 0    # 字典重新加载后递增，各线程据此重建压缩/解压对象
+
+
+def _archived_dict_path(dict_id: int) -> Path:
+    return JSON_ZSTD_DICT_PATH.with_name(f'{JSON_ZSTD_DICT_PATH.stem}.{dict_id}{JSON_ZSTD_DICT_PATH.suffix}')
+
+
+def _load_zstd_dicts():
+    """加载当前字典与归档字典（只加载一次），返回 (当前字典或 None, {字典 ID: 字典})"""
+    global _zstd_dict, _zstd_dicts
+    if _zstd_dicts is None:
+        with _dict_lock:
+            if _zstd_dicts is None:
+                current = None
+                dicts = {}
+                if ZSTD_AVAILABLE:
+                    pattern = f'{JSON_ZSTD_DICT_PATH.stem}.*{JSON_ZSTD_DICT_PATH.suffix}'
+                    for path in sorted(JSON_ZSTD_DICT_PATH.parent.glob(pattern)):
+                        archived = zstandard.ZstdCompressionDict(path.read_bytes())
+                        dicts[archived.dict_id()] = archived
+                    if JSON_ZSTD_DICT_PATH.exists():
+                        current = zstandard.ZstdCompressionDict(JSON_ZSTD_DICT_PATH.read_bytes())
+                        dicts[current.dict_id()] = current
+                _zstd_dict = current
+                _zstd_dicts = dicts
+    return _zstd_dict, _zstd_dicts
+
+
+def _load_zstd_dict():
+    """当前共享字典（压缩使用），文件不存在时返回 None"""
+    return _load_zstd_dicts()[0]
+
+
+def save_zstd_dictionary(dictionary: bytes) -> Path:
+    """
+    写入新的共享字典：已有字典先归档为 json_zstd.<字典ID>.dict（用其压缩的存量数据仍可解压），
+    之后写入的数据使用新字典；返回字典路径
+    """
+    global _zstd_dict, _zstd_dicts, _zstd_dict_generation
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError('zstandard is not installed')
+    new_id = zstandard.ZstdCompressionDict(dictionary).dict_id()
+    JSON_ZSTD_DICT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _dict_lock:
+        if JSON_ZSTD_DICT_PATH.exists():
+            current = JSON_ZSTD_DICT_PATH.read_bytes()
+            current_id = zstandard.ZstdCompressionDict(current).dict_id()
+            if current_id == new_id and current != dictionary:
+                raise RuntimeError(f'zstd dictionary id {new_id} collides with the current dictionary, retrain')
+            archived = _archived_dict_path(current_id)
+            if not archived.exists():
+                archived.write_bytes(current)
+        JSON_ZSTD_DICT_PATH.write_bytes(dictionary)
+        _zstd_dict = None
+        _zstd_dicts = None
+        _zstd_dict_generation += 1
+    return JSON_ZSTD_DICT_PATH
+
+
+def _thread_codecs() -> dict:
+    # zstandard 的压缩/解压对象不能跨线程并发使用，每个线程各自持有；字典更新后重建
+    if getattr(_local, 'generation', None) != _zstd_dict_generation:
+        _local.codecs = {}
+        _local.generation = _zstd_dict_generation
+    return _local.codecs
+
+
+def _zstd_compressor(with_dict: bool):
+    codecs = _thread_codecs()
+    key = 'cdict' if with_dict else 'c'
+    compressor = codecs.get(key)
+    if compressor is None:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_load_zstd_dict() if with_dict else None,
+                                              write_dict_id=True)
+        codecs[key] = compressor
+    return compressor
+
+
+def _zstd_decompressor(dict_id: int = 0):
+    """dict_id 为帧头记录的字典 ID，0 表示不使用字典"""
+    codecs = _thread_codecs()
+    key = ('d', dict_id)
+    decompressor = codecs.get(key)
+    if decompressor is None:
+        zstd_dict = None
+        if dict_id:
+            zstd_dict = _load_zstd_dicts()[1].get(dict_id)
+            if zstd_dict is None:
+                raise RuntimeError(f'zstd dictionary {dict_id} not found (current: {JSON_ZSTD_DICT_PATH})')
+        decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+        codecs[key] = decompressor
+    return decompressor
+
+
+def compression_method() -> str:
+    """当前生效的压缩方式；zstd 未安装时回退为 zlib"""
+    if JSON_COMPRESSION == 'zstd' and not ZSTD_AVAILABLE:
+        return 'zlib'
+    return JSON_COMPRESSION if JSON_COMPRESSION in ('zlib', 'zstd', 'none') else 'zlib'
+
+
+def compress_text(value: str, min_size: int = MIN_COMPRESS_SIZE) -> Union[str, bytes]:
+    """压缩文本；过短或关闭压缩时原样返回 str"""
+    method = compression_method()
+    if method == 'none':
+        return value
+    data = value.encode('utf-8')
+    if len(data) < min_size:
+        return value
+    if method == 'zstd':
+        with_dict = _load_zstd_dict() is not None
+        prefix = PREFIX_ZSTD_DICT if with_dict else PREFIX_ZSTD
+        return prefix + _zstd_compressor(with_dict).compress(data)
+    return PREFIX_ZLIB + zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress_value(value) -> Optional[str]:
+    """还原为 JSON 文本；兼容未压缩的旧数据"""
+    if value is None or isinstance(value, str):
+        return value
+    data = bytes(value)
+    prefix, payload = data[:2], data[2:]
+    if prefix == PREFIX_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if prefix in (PREFIX_ZSTD, PREFIX_ZSTD_DICT):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError('zstandard is required to read zstd-compressed columns')
+        dict_id = zstandard.get_frame_parameters(payload).dict_id if prefix == PREFIX_ZSTD_DICT else 0
+        return _zstd_decompressor(dict_id).decompress(payload).decode('utf-8')
+    return data.decode('utf-8')
+
+
+def train_zstd_dictionary(samples, dict_size: int = 112 * 1024) -> bytes:
+    """用样本 JSON 文本训练 zstd 共享字典"""
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError('zstandard is not installed')
+    encoded = [sample.encode('utf-8') for sample in samples if sample]
+    return zstandard.train_dictionary(dict_size, encoded).as_bytes()
+
+
+class CompressedJSONText(TypeDecorator):
+    """
+    透明压缩的 JSON 文本列：应用层读写的仍是 str（配合 _json_dumps / _json_loads 使用）
+    底层列类型保持 TEXT，压缩后的值以 BLOB 存储（SQLite 按值区分存储类型）
+    """
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, min_size: int = MIN_COMPRESS_SIZE, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            return compress_text(value, self.min_size)
+        return value
+
+    def process_result_value(self, value, dialect):
+        return decompress_value(value)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+服务端实时估值轮询与推送（Server-Sent Events）
+- 后台线程在交易时段（见 trading_calendar，含午休与节假日）每隔 ESTIMATE_POLL_INTERVAL 秒刷新一次所有关注基金的估值：
+  自选基金 + 当前各订阅连接关注的基金（取并集，同一基金只请求一次）
+- 估值有变化的基金推送给关注它的订阅连接；本轮获取到的自选基金估值全部写库（刷新缓存时间）
+- 没有订阅连接时不轮询；新连接关注的基金若尚无估值，先使用库中仍在缓存时间内的估值，
+  没有时立即补抓一次（不受交易时段限制）
+上游请求量只与不同基金的数量有关，与打开的页面数无关
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from estimate_refresh import refresh_estimates, is_estimate_fresh
+from fund_store import upsert_estimates
+from models import FundEstimate, FundWatchlist
+from trading_calendar import is_trading_time
+
+# 交易时段的轮询间隔（秒）
+ESTIMATE_POLL_INTERVAL = float(os.getenv('ESTIMATE_POLL_INTERVAL', '60'))
+
+# SSE 心跳间隔（秒），用于保持连接并及时发现已断开的客户端
+SSE_HEARTBEAT_INTERVAL = 15
+
+# 每个订阅连接最多积压的推送条数，客户端过慢时丢弃最旧的推送
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# 推送与比较的估值字段
+ESTIMATE_EVENT_FIELDS = ('name', 'net_worth', 'net_worth_date', 'estimate_value', 'estimate_change', 'estimate_time')
+
+
+class EstimateSubscriber:
+    """一个 SSE 订阅连接：关注的基金代码（可选包含全部自选基金）与待发送的推送队列"""
+
+    def __init__(self, codes: Iterable[str], watchlist: bool):
+        self.codes = set(codes)
+        self.watchlist = watchlist
+        self.queue: 'queue.Queue[str]' = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, fund_code: str, watchlist_codes: Set[str]) -> bool:
+        return fund_code in self.codes or (self.watchlist and fund_code in watchlist_codes)
+
+    def push(self, message: str):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+def _estimate_event(estimates: Dict[str, Dict[str, Any]]) -> str:
+    """SSE 消息：data 为 {"type": "estimates", "estimates": {fund_code: 估值}, "time": ...}"""
+    payload = {
+        'type': 'estimates',
+        'estimates': estimates,
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class EstimatePoller:
+    """进程内唯一的估值轮询线程与订阅表"""
+
+    def __init__(self, session_factory: Callable, interval: float = ESTIMATE_POLL_INTERVAL,
+                 session_checker: Callable[[], bool] = is_trading_time):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.session_checker = session_checker
+        self._subscribers: Set[EstimateSubscriber] = set()
+        self._latest: Dict[str, Dict[str, Any]] = {}     # fund_code -> 最近一次估值
+        self._pending: Set[str] = set()                   # 尚无估值、需要立即补抓的基金
+        self._watchlist_codes: Set[str] = set()
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'polls': 0, 'fetched': 0, 'changed': 0, 'pushed': 0, 'timed_out': 0}
+
+    # ---------- 订阅 ----------
+
+    def _ensure_started(self):
+        # 首个订阅时才启动线程（调试模式的重载父进程不会启动轮询）
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='estimate-poller', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, codes: Iterable[str] = (), watchlist: bool = False) -> EstimateSubscriber:
+        """注册订阅连接；尚无估值的基金加入补抓队列"""
+        self._ensure_started()
+        subscriber = EstimateSubscriber(codes, watchlist)
+        if watchlist:
+            self._refresh_watchlist_codes()
+        with self._lock:
+            self._subscribers.add(subscriber)
+            wanted = subscriber.codes | (self._watchlist_codes if watchlist else set())
+            missing = {code for code in wanted if code not in self._latest}
+        if missing:
+            missing -= self._load_cached(missing)
+        if missing:
+            with self._lock:
+                self._pending.update(missing)
+            self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: EstimateSubscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self, subscriber: EstimateSubscriber) -> Dict[str, Dict[str, Any]]:
+        """订阅连接关注的基金中已有估值的部分（连接建立时先发送一次）"""
+        with self._lock:
+            return {code: estimate for code, estimate in self._latest.items()
+                    if subscriber.wants(code, self._watchlist_codes)}
+
+    def stream(self, subscriber: EstimateSubscriber):
+        """SSE 响应体生成器：先发送快照，之后发送变化与心跳；客户端断开时取消订阅"""
+        try:
+            snapshot = self.snapshot(subscriber)
+            yield _estimate_event(snapshot) if snapshot else ': connected\n\n'
+            while True:
+                try:
+                    yield subscriber.queue.get(timeout=SSE_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': ping\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    # ---------- 轮询 ----------
+
+    def _load_cached(self, codes: Set[str]) -> Set[str]:
+        """读取库中仍在缓存时间内的估值，返回已载入的基金代码"""
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                FundEstimate.fund_code, FundEstimate.updated_time,
+                *(getattr(FundEstimate, field) for field in ESTIMATE_EVENT_FIELDS)
+            ).filter(FundEstimate.fund_code.in_(codes)).all()
+        finally:
+            db.close()
+        loaded = {
+            row.fund_code: {'fund_code': row.fund_code, **{field: getattr(row, field) for field in ESTIMATE_EVENT_FIELDS}}
+            for row in rows if is_estimate_fresh(row.updated_time)
+        }
+        with self._lock:
+            for code, estimate in loaded.items():
+                self._latest.setdefault(code, estimate)
+        return set(loaded)
+
+    def _refresh_watchlist_codes(self) -> Set[str]:
+        db = self.session_factory()
+        try:
+            codes = {row.fund_code for row in db.query(FundWatchlist.fund_code).all()}
+        finally:
+            db.close()
+        with self._lock:
+            self._watchlist_codes = codes
+        return codes
+
+    def _due_codes(self) -> Set[str]:
+        """本轮需要请求的基金：交易时段到达间隔时为全部关注基金，否则只补抓新增基金"""
+        with self._lock:
+            if not self._subscribers:
+                return set()
+            pending, self._pending = self._pending, set()
+            subscribed = set().union(*(subscriber.codes for subscriber in self._subscribers))
+        now = time.monotonic()
+        if now - self._last_poll < self.interval:
+            return pending
+        self._last_poll = now
+        if not self.session_checker():
+            return pending
+        return pending | subscribed | self._refresh_watchlist_codes()
+
+    def poll(self, codes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """请求一组基金的估值，写库并推送有变化的部分，返回变化的估值"""
+        refresh = refresh_estimates(codes)
+        estimates = {code: {'fund_code': code, **{field: estimate.get(field) for field in ESTIMATE_EVENT_FIELDS}}
+                     for code, estimate in refresh.estimates.items()}
+        with self._lock:
+            changed = {code: estimate for code, estimate in estimates.items() if self._latest.get(code) != estimate}
+            self._latest.update(changed)
+            # 超时未完成的基金下一轮（或下一次订阅）再补抓
+            self._pending.update(code for code in refresh.timed_out if code not in self._latest)
+            watchlist_codes = set(self._watchlist_codes)
+            self.stats['polls'] += 1
+            self.stats['fetched'] += len(estimates)
+            self.stats['changed'] += len(changed)
+            self.stats['timed_out'] += len(refresh.timed_out)
+
+        # 本轮获取到的自选基金估值全部写库（未变化的也刷新 updated_time），
+        # 否则刷新接口按缓存时间判断会把刚轮询过的基金当作过期而重复请求上游
+        self._save({code: estimate for code, estimate in estimates.items() if code in watchlist_codes})
+        if changed:
+            self._publish(changed, watchlist_codes)
+        return changed
+
+    def _save(self, estimates: Dict[str, Dict[str, Any]]):
+        """自选基金的估值写库（自选列表接口、刷新接口与详情缓存读取）"""
+        if not estimates:
+            return
+        db = self.session_factory()
+        try:
+            upsert_estimates(db, estimates)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"保存估值失败: {e}")
+        finally:
+            db.close()
+
+    def _publish(self, changed: Dict[str, Dict[str, Any]], watchlist_codes: Set[str]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            estimates = {code: estimate for code, estimate in changed.items()
+                         if subscriber.wants(code, watchlist_codes)}
+            if estimates:
+                subscriber.push(_estimate_event(estimates))
+                with self._lock:
+                    self.stats['pushed'] += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=max(1.0, self._last_poll + self.interval - time.monotonic()))
+            self._wake.clear()
+            try:
+                codes = self._due_codes()
+                if codes:
+                    self.poll(codes)
+            except Exception as e:
+                print(f"估值轮询失败: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                'subscribers': len(self._subscribers),
+                'tracked_funds': len(self._latest),
+                'interval': self.interval,
+                'running': self._thread is not None,
+            }
+
+
+_estimate_poller: Optional[EstimatePoller] = None
+_estimate_poller_lock = threading.Lock()
+
+
+def get_estimate_poller() -> EstimatePoller:
+    """获取估值轮询单例"""
+    global _estimate_poller
+    if _estimate_poller is None:
+        with _estimate_poller_lock:
+            if _estimate_poller is None:
+                from database import SessionLocal
+                _estimate_poller = EstimatePoller(SessionLocal)
+    return _estimate_poller
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+自选基金实时估值并发刷新
+- fundgz 请求在有界线程池中并发执行，整体刷新耗时约为一次上游往返，而不是 N 次
+- 整体截止时间（deadline）到达时返回已完成的部分结果，未完成的请求在后台自然结束
+- 同一基金的并发请求经 singleflight 合并（多个页面同时刷新时只请求一次上游）
+- 结果由调用方通过 fund_store.upsert_estimates 一条语句批量写库
+- 估值缓存时间由交易日历推导（is_estimate_fresh）：交易时段内 ESTIMATE_TTL 秒，
+  休市时缓存到下一次开盘，但不超过 ESTIMATE_OFF_HOURS_MAX_TTL（收盘后晚间会公布当日净值）
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from http_client import get_http_client
+from singleflight import get_singleflight
+from trading_calendar import expires_at
+
+# 并发请求数（线程池大小，需不大于 http_client 的每域名连接池大小）
+ESTIMATE_REFRESH_WORKERS = int(os.getenv('ESTIMATE_REFRESH_WORKERS', '16'))
+
+# 一次刷新的整体截止时间（秒），到期返回部分结果
+ESTIMATE_REFRESH_DEADLINE = float(os.getenv('ESTIMATE_REFRESH_DEADLINE', '5'))
+
+# 单个 fundgz 请求的超时（秒）
+FUNDGZ_TIMEOUT = 3
+
+# 交易时段内估值的缓存时间（秒）
+ESTIMATE_TTL = int(os.getenv('ESTIMATE_TTL', '60'))
+
+# 休市时估值缓存时间上限（秒），晚间公布的当日净值（dwjz / jzrq）在此时间内更新
+ESTIMATE_OFF_HOURS_MAX_TTL = int(os.getenv('ESTIMATE_OFF_HOURS_MAX_TTL', '3600'))
+
+FUNDGZ_URL = 'http://fundgz.1234567.com.cn/js/{fund_code}.js'
+FUNDGZ_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+FUNDGZ_PATTERN = re.compile(r"jsonpgz\((.*?)\);")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """进程内共享的刷新线程池（多个刷新请求共用，总并发有上限）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ESTIMATE_REFRESH_WORKERS,
+                                               thread_name_prefix='estimate-refresh')
+    return _executor
+
+
+def is_estimate_fresh(updated_time: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    """updated_time 时获取的估值此刻是否仍在缓存时间内（按交易日历）"""
+    if updated_time is None:
+        return False
+    return (now or datetime.now()) < expires_at(updated_time, ESTIMATE_TTL, ESTIMATE_OFF_HOURS_MAX_TTL)
+
+
+def parse_fundgz(text: str) -> Optional[Dict[str, Any]]:
+    """解析 fundgz 的 JSONP 响应为实时估值（字段与 fund_api 的 realtime_estimate 一致）"""
+    match = FUNDGZ_PATTERN.search(text)
+    if not match:
+        return None
+    rt_data = json.loads(match.group(1))
+    if not rt_data:
+        return None
+    return {
+        'name': rt_data.get('name'),
+        'fund_code': rt_data.get('fundcode'),
+        'net_worth': rt_data.get('dwjz'),
+        'net_worth_date': rt_data.get('jzrq'),
+        'estimate_value': rt_data.get('gsz'),
+        'estimate_change': rt_data.get('gszzl'),
+        'estimate_time': rt_data.get('gztime'),
+    }
+
+
+def fetch_estimate(fund_code: str, timeout: float = FUNDGZ_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """请求单只基金的实时估值；上游无数据时返回 None，请求失败抛出异常"""
+    url = FUNDGZ_URL.format(fund_code=fund_code)
+
+    def _get():
+        response = get_http_client().get(url, headers=FUNDGZ_HEADERS, timeout=timeout)
+        response.content
+        return response
+
+    response = get_singleflight().do(('fundgz', url), _get)
+    if response.status_code != 200:
+        return None
+    return parse_fundgz(response.text)
+
+
+@dataclass
+class EstimateRefreshResult:
+    estimates: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # fund_code -> 实时估值
+    failed: List[str] = field(default_factory=list)                     # 请求失败或上游无数据
+    timed_out: List[str] = field(default_factory=list)                  # 截止时间内未完成
+    elapsed: float = 0.0
+
+
+def refresh_estimates(fund_codes: Iterable[str], deadline: float = ESTIMATE_REFRESH_DEADLINE) -> EstimateRefreshResult:
+    """并发请求一组基金的实时估值，最多等待 deadline 秒，返回截止时已完成的结果"""
+    start = time.monotonic()
+    executor = _get_executor()
+    futures = {executor.submit(fetch_estimate, fund_code): fund_code for fund_code in dict.fromkeys(fund_codes)}
+    done, not_done = wait(futures, timeout=deadline)
+
+    result = EstimateRefreshResult()
+    for future in futures:
+        fund_code = futures[future]
+        if future in not_done:
+            # 尚未开始的请求直接取消，已在执行的由单请求超时兜底
+            future.cancel()
+            result.timed_out.append(fund_code)
+            continue
+        try:
+            estimate = future.result()
+        except Exception as e:
+            print(f"刷新 {fund_code} 估值失败: {e}")
+            estimate = None
+        if estimate:
+            result.estimates[fund_code] = estimate
+        else:
+            result.failed.append(fund_code)
+    result.elapsed = time.monotonic() - start
+    return result
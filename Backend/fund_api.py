@@ -1,9 +1,11 @@
-import requests
+import hashlib
 import json
 import re
 from datetime import datetime
 from typing import Dict, List, Any, Union
 from stock_service import StockService
+from http_client import get_http_client
+from singleflight import get_singleflight
 
 # --- 数据清洗器 (原 api_handler.py) ---
 
@@ -283,14 +285,17 @@ class FundDataCleaner:
         
         return cleaned_categories
     
-    def clean_all_data(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
-        """清洗所有数据"""
-        cleaned_data = {
-            'basic_info': self.clean_fund_info(raw_data),
-            'performance': self.clean_performance_data(raw_data),
-            'portfolio': self.clean_portfolio_data(raw_data),
+    def clean_all_data(self, raw_data: Dict[str, Any], sections=None) -> Dict[str, Any]:
+        """
+        清洗所有数据
+        sections: 只清洗指定的数据段（见 SECTION_VARS），为 None 时清洗全部
+        """
+        builders = {
+            'basic_info': lambda: self.clean_fund_info(raw_data),
+            'performance': lambda: self.clean_performance_data(raw_data),
+            'portfolio': lambda: self.clean_portfolio_data(raw_data),
             # 实时估值数据（来自 fundgz 接口）
-            'realtime_estimate': {
+            'realtime_estimate': lambda: {
                 'name': raw_data.get('name'),           # 基金名称
                 'fund_code': raw_data.get('fundcode'),  # 基金代码
                 'net_worth': raw_data.get('dwjz'),      # 单位净值
@@ -299,45 +304,252 @@ class FundDataCleaner:
                 'estimate_change': raw_data.get('gszzl'), # 估算涨跌幅
                 'estimate_time': raw_data.get('gztime'),  # 估值时间
             },
-            'net_worth_trend': self.clean_array_data(
+            'net_worth_trend': lambda: self.clean_array_data(
                 raw_data.get('Data_netWorthTrend'), 'net_worth'
             ),
-            'accumulated_net_worth': self.clean_array_data(
+            'accumulated_net_worth': lambda: self.clean_array_data(
                 raw_data.get('Data_ACWorthTrend'), 'position'
             ),
-            'position_trend': self.clean_array_data(
+            'position_trend': lambda: self.clean_array_data(
                 raw_data.get('Data_fundSharesPositions'), 'position'
             ),
-            'total_return_trend': self.clean_array_data(
+            'total_return_trend': lambda: self.clean_array_data(
                 raw_data.get('Data_grandTotal'), 'performance'
             ),
-            'ranking_trend': self.clean_array_data(
+            'ranking_trend': lambda: self.clean_array_data(
                 raw_data.get('Data_rateInSimilarType'), 'ranking'
             ),
-            'ranking_percentage': self.clean_array_data(
+            'ranking_percentage': lambda: self.clean_array_data(
                 raw_data.get('Data_rateInSimilarPersent'), 'position'
             ),
-            'scale_fluctuation': raw_data.get('Data_fluctuationScale', {}),
-            'holder_structure': self.clean_holder_structure(raw_data),
-            'asset_allocation': self.clean_asset_allocation(raw_data),
-            'performance_evaluation': raw_data.get('Data_performanceEvaluation', {}),
-            'fund_managers': self.clean_fund_manager(raw_data),
-            'subscription_redemption': raw_data.get('Data_buySedemption', {}),
-            'same_type_funds': self.clean_same_type_funds(raw_data),
-            'cleaning_timestamp': datetime.now().isoformat()
+            'scale_fluctuation': lambda: raw_data.get('Data_fluctuationScale', {}),
+            'holder_structure': lambda: self.clean_holder_structure(raw_data),
+            'asset_allocation': lambda: self.clean_asset_allocation(raw_data),
+            'performance_evaluation': lambda: raw_data.get('Data_performanceEvaluation', {}),
+            'fund_managers': lambda: self.clean_fund_manager(raw_data),
+            'subscription_redemption': lambda: raw_data.get('Data_buySedemption', {}),
+            'same_type_funds': lambda: self.clean_same_type_funds(raw_data),
+        }
+        
+        cleaned_data = {
+            name: build()
+            for name, build in builders.items()
+            if sections is None or name in sections
         }
+        cleaned_data['cleaning_timestamp'] = datetime.now().isoformat()
         
         return cleaned_data
 
+# --- pingzhongdata 解析器 ---
+
+# 条件抓取时表示上游内容未变化
+NOT_MODIFIED = object()
+
+# 文件头部的生成时间注释（如 /*2026-01-13 15:45:53*/），每次生成都会变化，不参与内容哈希
+_TIMESTAMP_COMMENT = re.compile(r'/\*\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\*/')
+
+
+def pingzhongdata_hash(js_content: str) -> str:
+    """pingzhongdata 内容哈希（忽略生成时间注释）"""
+    return hashlib.sha256(_TIMESTAMP_COMMENT.sub('', js_content, count=1).encode('utf-8')).hexdigest()
+
+# 清洗后的数据段 -> 所需的 pingzhongdata 变量
+# realtime_estimate 来自 fundgz 接口，不依赖 pingzhongdata 变量
+SECTION_VARS = {
+    'basic_info': ('fS_name', 'fS_code', 'fund_sourceRate', 'fund_Rate', 'fund_minsg', 'ishb'),
+    'performance': ('syl_1n', 'syl_6y', 'syl_3y', 'syl_1y'),
+    'portfolio': ('stockCodes', 'zqCodes', 'zqCodesNew'),
+    'realtime_estimate': (),
+    'net_worth_trend': ('Data_netWorthTrend',),
+    'accumulated_net_worth': ('Data_ACWorthTrend',),
+    'position_trend': ('Data_fundSharesPositions',),
+    'total_return_trend': ('Data_grandTotal',),
+    'ranking_trend': ('Data_rateInSimilarType',),
+    'ranking_percentage': ('Data_rateInSimilarPersent',),
+    'scale_fluctuation': ('Data_fluctuationScale',),
+    'holder_structure': ('Data_holderStructure',),
+    'asset_allocation': ('Data_assetAllocation',),
+    'performance_evaluation': ('Data_performanceEvaluation',),
+    'fund_managers': ('Data_currentFundManager',),
+    'subscription_redemption': ('Data_buySedemption',),
+    'same_type_funds': ('swithSameType',),
+}
+
+_VAR_PATTERN = re.compile(r'var\s+(\w+)\s*=\s*')
+# 变量边界：分号后（可夹注释）紧跟下一个 var 声明，用于跳过不需要解码的变量
+_NEXT_VAR_PATTERN = re.compile(r';\s*(?:/\*.*?\*/\s*)*(var\s+\w+\s*=)', re.DOTALL)
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _scan_js_value(js_content: str, pos: int) -> int:
+    """从 pos 处的 [ 或 { 开始按括号深度扫描，返回值结束位置（仅用于非标准 JSON 的回退路径）"""
+    opener = js_content[pos]
+    closer = ']' if opener == '[' else '}'
+    depth = 0
+    end_pos = pos
+    length = len(js_content)
+    while end_pos < length:
+        c = js_content[end_pos]
+        if c == opener:
+            depth += 1
+        elif c == closer:
+            depth -= 1
+            if depth == 0:
+                return end_pos + 1
+        elif c == '"' or c == "'":
+            # 跳过字符串内容
+            end_pos = js_content.find(c, end_pos + 1)
+            while end_pos > 0 and js_content[end_pos - 1] == '\\':
+                end_pos = js_content.find(c, end_pos + 1)
+            if end_pos < 0:
+                return length
+        end_pos += 1
+    return length
+
+
+def _decode_js_value(js_content: str, pos: int) -> tuple:
+    """
+    解码 pos 处的单个 JS 值，返回 (值, 后续查找起点)
+    - 数组/对象/双引号字符串直接用 json raw_decode 在原文上按偏移解码（C 实现，无中间拷贝）
+    - 含单引号的非标准 JSON（如 swithSameType）回退为括号扫描 + 引号替换
+    - 其他字面量（true/false/数字）保留原始文本，与旧解析结果一致，由 cleaner 统一处理
+    """
+    char = js_content[pos]
+    if char in '[{"':
+        try:
+            return _JSON_DECODER.raw_decode(js_content, pos)
+        except json.JSONDecodeError:
+            if char == '"':
+                end_pos = js_content.find('"', pos + 1)
+                return js_content[pos + 1:end_pos], end_pos + 1
+        end_pos = _scan_js_value(js_content, pos)
+        raw_value = js_content[pos:end_pos]
+        try:
+            # JS 中可能使用单引号，需要转换为双引号才能解析 JSON
+            return json.loads(raw_value.replace("'", '"')), end_pos
+        except json.JSONDecodeError:
+            # 值不完整（如被截断），保留原始文本，并从值起点继续查找后续变量
+            return raw_value, pos
+    if char == "'":
+        end_pos = js_content.find("'", pos + 1)
+        return js_content[pos + 1:end_pos], end_pos + 1
+    end_pos = js_content.find(';', pos)
+    if end_pos < 0:
+        end_pos = len(js_content)
+    return js_content[pos:end_pos].strip(), end_pos
+
+
+class PingzhongVars(dict):
+    """
+    pingzhongdata 变量字典
+    未请求的变量不解码，只记录其在原文中的起始位置，首次访问时再解码
+    """
+
+    def __init__(self, js_content: str = ''):
+        super().__init__()
+        self._js_content = js_content
+        self._lazy: Dict[str, int] = {}
+
+    def __missing__(self, key):
+        pos = self._lazy.pop(key, None)
+        if pos is None:
+            raise KeyError(key)
+        value, _ = _decode_js_value(self._js_content, pos)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._lazy
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def lazy_names(self) -> List[str]:
+        """尚未解码的变量名"""
+        return list(self._lazy)
+
+
+def parse_pingzhongdata(js_content: str, variables=None) -> PingzhongVars:
+    """
+    单遍解析 pingzhongdata.js 中所有顶层 var 声明
+    解码后从值的结束位置继续查找下一个 var，不会重复扫描已解析的文本。
+    variables: 需要解码的变量名集合，为 None 时全部解码；
+               其余变量跳到下一个 `;var` 边界，保留为原文切片，访问时才解码
+    """
+    data = PingzhongVars(js_content)
+    pos = 0
+    length = len(js_content)
+    search = _VAR_PATTERN.search
+
+    match = search(js_content, pos)
+    while match:
+        var_name = match.group(1)
+        pos = match.end()
+        if pos >= length:
+            break
+
+        if variables is None or var_name in variables:
+            data[var_name], pos = _decode_js_value(js_content, pos)
+            match = search(js_content, pos)
+        else:
+            data._lazy[var_name] = pos
+            match = _NEXT_VAR_PATTERN.search(js_content, pos)
+            if match is None:
+                break
+            # 对齐到 var 声明本身，交给下一轮处理
+            match = search(js_content, match.start(1))
+
+    return data
+
+
 # --- 基金 API 客户端 ---
 
 class FundAPI:
-    def __init__(self):
+    def __init__(self, rate_limiter=None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         self.cleaner = FundDataCleaner()
+        self.http = get_http_client()  # 共享的按域名连接池
         self._fund_type_cache = None  # 基金类型缓存
+        # 可选的按域名限速器（批量抓取时由 crawler.HostRateLimiter 提供）
+        self.rate_limiter = rate_limiter
+
+    def _http_get(self, url: str, timeout: float, headers: Dict[str, str] = None):
+        """发起 GET 请求，配置了限速器时先取令牌并回报请求结果"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url)
+        try:
+            response = self.http.get(url, headers=headers or self.headers, timeout=timeout)
+        except Exception:
+            if self.rate_limiter:
+                self.rate_limiter.report(url, False)
+            raise
+        if self.rate_limiter:
+            self.rate_limiter.report(url, response.status_code < 500 and response.status_code != 429)
+        return response
+
+    def _shared_get(self, namespace: str, url: str, timeout: float, headers: Dict[str, str] = None):
+        """
+        合并同一 URL 的并发请求：同时请求同一基金的调用者共享一次上游请求
+        先读取完整响应体再共享，避免多个线程同时读取同一响应流
+        """
+        def _get():
+            response = self._http_get(url, timeout=timeout, headers=headers)
+            response.content
+            return response
+
+        response = get_singleflight().do((namespace, url), _get)
+        if response.status_code == 304:
+            # 304 只对发出相同校验头的请求有效，否则需要自己重新获取
+            sent = response.request.headers
+            own = headers or {}
+            if any(sent.get(name) != own.get(name) for name in ('If-None-Match', 'If-Modified-Since')):
+                response = self._http_get(url, timeout=timeout, headers=headers)
+        return response
     
     def _load_fund_type_cache(self):
         """加载基金类型缓存"""
@@ -363,28 +575,88 @@ class FundAPI:
         
         return self._fund_type_cache
 
-    def get_fund_data(self, fund_code: str) -> Union[Dict[str, Any], None]:
-        """
-        获取单只基金的完整清洗后数据。
-        包括基本信息、业绩、持仓、净值走势等。
-        """
-        raw_data = self._fetch_raw_data(fund_code)
+    @staticmethod
+    def _resolve_sections(sections) -> tuple:
+        """数据段 -> (需要解码的变量集合, 是否请求实时估值)"""
+        if sections is None:
+            return None, True
+        unknown = [name for name in sections if name not in SECTION_VARS]
+        if unknown:
+            raise ValueError(f"未知的数据段: {unknown}")
+        variables = {'fS_code'}
+        for name in sections:
+            variables.update(SECTION_VARS[name])
+        return variables, 'realtime_estimate' in sections
+
+    def _clean_raw_data(self, fund_code: str, raw_data, sections=None) -> Union[Dict[str, Any], None]:
         if not raw_data:
             return None
         
         # 从本地缓存获取基金类型
-        fund_type_cache = self._load_fund_type_cache()
-        fund_type = fund_type_cache.get(fund_code, '')
-        if fund_type:
-            raw_data['fund_type_from_cache'] = fund_type
+        if sections is None or 'basic_info' in sections:
+            fund_type_cache = self._load_fund_type_cache()
+            fund_type = fund_type_cache.get(fund_code, '')
+            if fund_type:
+                raw_data['fund_type_from_cache'] = fund_type
         
         # 使用 cleaner 清洗数据
         try:
-            return self.cleaner.clean_all_data(raw_data)
+            return self.cleaner.clean_all_data(raw_data, sections)
         except Exception as e:
             print(f"Error cleaning data for {fund_code}: {e}")
             return None
 
+    def get_fund_data(self, fund_code: str, sections=None) -> Union[Dict[str, Any], None]:
+        """
+        获取单只基金的完整清洗后数据。
+        包括基本信息、业绩、持仓、净值走势等。
+        sections: 只返回指定的数据段（见 SECTION_VARS），未请求的变量不解码也不清洗；
+                  未包含 realtime_estimate 时不请求实时估值接口
+        """
+        variables, include_realtime = self._resolve_sections(sections)
+        raw_data = self._fetch_raw_data(fund_code, variables, include_realtime)
+        return self._clean_raw_data(fund_code, raw_data, sections)
+
+    def get_fund_data_if_changed(self, fund_code: str, fetch_state: Dict[str, Any] = None,
+                                 sections=None) -> tuple:
+        """
+        条件抓取：带上次的 ETag / Last-Modified 请求 pingzhongdata，并比较内容哈希
+        fetch_state: 上次抓取状态 {'content_hash', 'etag', 'last_modified'}，为空时总是返回完整数据
+        返回 (fund_data, new_state)：
+        - 内容未变化（304 或哈希相同）时 fund_data 为 NOT_MODIFIED，跳过解析与清洗
+        - 请求失败时 fund_data 为 None，new_state 为原状态
+        """
+        variables, include_realtime = self._resolve_sections(sections)
+        headers = dict(self.headers)
+        if fetch_state:
+            if fetch_state.get('etag'):
+                headers['If-None-Match'] = fetch_state['etag']
+            if fetch_state.get('last_modified'):
+                headers['If-Modified-Since'] = fetch_state['last_modified']
+        
+        url = f"https://fund.eastmoney.com/pingzhongdata/{fund_code}.js"
+        try:
+            response = self._shared_get('pingzhongdata', url, timeout=10, headers=headers)
+        except Exception as e:
+            print(f"Error fetching detail for {fund_code}: {e}")
+            return None, fetch_state
+        
+        if response.status_code == 304 and fetch_state:
+            return NOT_MODIFIED, dict(fetch_state)
+        if response.status_code != 200:
+            return None, fetch_state
+        
+        new_state = {
+            'content_hash': pingzhongdata_hash(response.text),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if fetch_state and fetch_state.get('content_hash') == new_state['content_hash']:
+            return NOT_MODIFIED, new_state
+        
+        raw_data = self._finish_raw_data(fund_code, parse_pingzhongdata(response.text, variables), include_realtime)
+        return self._clean_raw_data(fund_code, raw_data, sections), new_state
+
     def search_funds(self, keyword: str) -> List[Dict[str, Any]]:
         """
         搜索基金（返回列表）
@@ -395,7 +667,7 @@ class FundAPI:
             'key': keyword
         }
         try:
-            response = requests.get(url, params=params, headers=self.headers, timeout=5)
+            response = self.http.get(url, params=params, headers=self.headers, timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 if 'Datas' in data:
@@ -407,126 +679,47 @@ class FundAPI:
             print(f"Search error: {e}")
             return []
 
-    def _parse_js_value(self, js_content: str, start_pos: int) -> tuple:
-        """
-        从指定位置解析 JS 值（数组、对象、字符串、数字等）
-        返回 (解析后的值, 结束位置)
-        """
-        pos = start_pos
-        while pos < len(js_content) and js_content[pos] in ' \t\n\r':
-            pos += 1
-        
-        if pos >= len(js_content):
-            return None, pos
-        
-        char = js_content[pos]
-        
-        # 数组
-        if char == '[':
-            depth = 1
-            end_pos = pos + 1
-            while end_pos < len(js_content) and depth > 0:
-                c = js_content[end_pos]
-                if c == '[':
-                    depth += 1
-                elif c == ']':
-                    depth -= 1
-                elif c == '"' or c == "'":
-                    # 跳过字符串内容
-                    quote = c
-                    end_pos += 1
-                    while end_pos < len(js_content):
-                        if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
-                            break
-                        end_pos += 1
-                end_pos += 1
-            return js_content[pos:end_pos], end_pos
-        
-        # 对象
-        elif char == '{':
-            depth = 1
-            end_pos = pos + 1
-            while end_pos < len(js_content) and depth > 0:
-                c = js_content[end_pos]
-                if c == '{':
-                    depth += 1
-                elif c == '}':
-                    depth -= 1
-                elif c == '"' or c == "'":
-                    quote = c
-                    end_pos += 1
-                    while end_pos < len(js_content):
-                        if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
-                            break
-                        end_pos += 1
-                end_pos += 1
-            return js_content[pos:end_pos], end_pos
-        
-        # 字符串
-        elif char == '"' or char == "'":
-            quote = char
-            end_pos = pos + 1
-            while end_pos < len(js_content):
-                if js_content[end_pos] == quote and js_content[end_pos-1] != '\\':
-                    end_pos += 1
-                    break
-                end_pos += 1
-            return js_content[pos:end_pos], end_pos
-        
-        # 其他（数字、布尔值等）- 读取到分号
-        else:
-            end_pos = pos
-            while end_pos < len(js_content) and js_content[end_pos] != ';':
-                end_pos += 1
-            return js_content[pos:end_pos].strip(), end_pos
-    
-    def _fetch_raw_data(self, fund_code: str) -> Union[Dict[str, Any], None]:
+    def _fetch_raw_data(self, fund_code: str, variables=None,
+                        include_realtime: bool = True) -> Union[Dict[str, Any], None]:
         """
         获取原始基金数据（字典形式），包含所有JS变量。
+        variables: 需要立即解码的变量名，其余变量保留为原文切片（见 parse_pingzhongdata）
+        include_realtime: 是否同时请求 fundgz 实时估值
         """
-        data = {}
+        data = PingzhongVars()
         
         # 1. 抓取 pingzhongdata 详细数据
         url = f"https://fund.eastmoney.com/pingzhongdata/{fund_code}.js"
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self._shared_get('pingzhongdata', url, timeout=10)
             if response.status_code == 200:
-                js_content = response.text
-                
-                # 查找所有 var xxx = 声明
-                var_pattern = re.compile(r'var\s+(\w+)\s*=\s*')
-                for match in var_pattern.finditer(js_content):
-                    var_name = match.group(1)
-                    value_start = match.end()
-                    
-                    # 解析值
-                    raw_value, _ = self._parse_js_value(js_content, value_start)
-                    
-                    if raw_value:
-                        try:
-                            # 尝试 JSON 解析
-                            if raw_value.startswith('[') or raw_value.startswith('{'):
-                                # JS 中可能使用单引号，需要转换为双引号才能解析 JSON
-                                json_value = raw_value.replace("'", '"')
-                                data[var_name] = json.loads(json_value)
-                            elif raw_value.startswith('"') and raw_value.endswith('"'):
-                                data[var_name] = raw_value[1:-1]
-                            elif raw_value.startswith("'") and raw_value.endswith("'"):
-                                data[var_name] = raw_value[1:-1]
-                            else:
-                                data[var_name] = raw_value
-                        except json.JSONDecodeError:
-                            # 如果 JSON 解析失败，保留原始字符串
-                            data[var_name] = raw_value
-                        
+                data = parse_pingzhongdata(response.text, variables)
         except Exception as e:
             print(f"Error fetching detail for {fund_code}: {e}")
             return None
 
+        return self._finish_raw_data(fund_code, data, include_realtime)
+
+    def _finish_raw_data(self, fund_code: str, data: PingzhongVars, include_realtime: bool):
+        """合并实时估值并补全 fS_code，数据为空时返回 None"""
         # 2. 抓取实时估值数据 (可选，用于补充实时信息)
+        if include_realtime:
+            self._merge_realtime_estimate(fund_code, data)
+            
+        if not data and not data.lazy_names():
+            return None
+
+        # 确保 fS_code 存在
+        if 'fS_code' not in data:
+            data['fS_code'] = fund_code
+            
+        return data
+
+    def _merge_realtime_estimate(self, fund_code: str, data: Dict[str, Any]):
+        """抓取 fundgz 实时估值并合并到原始数据中，失败时忽略"""
         try:
             real_time_url = f"http://fundgz.1234567.com.cn/js/{fund_code}.js"
-            response = requests.get(real_time_url, headers=self.headers, timeout=3)
+            response = self._shared_get('fundgz', real_time_url, timeout=3)
             if response.status_code == 200:
                 match = re.search(r"jsonpgz\((.*?)\);", response.text)
                 if match:
@@ -537,15 +730,7 @@ class FundAPI:
                         data.update(rt_data)
         except Exception:
             pass # 实时数据获取失败不影响整体
-            
-        if not data:
-            return None
 
-        # 确保 fS_code 存在
-        if 'fS_code' not in data:
-            data['fS_code'] = fund_code
-            
-        return data
 
 if __name__ == "__main__":
     # 测试代码
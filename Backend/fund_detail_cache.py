@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+基金详情读穿透缓存
+- 进程内 LRU 缓存最近访问的基金详情，记录数据获取时间
+- 数据过期但未超过最大容忍时间时先返回旧数据，同时在后台重新验证（stale-while-revalidate）
+- 同一基金同一时间只有一个后台重新验证任务
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class FundDetailCache:
+    """基金详情内存缓存（LRU）+ 后台重新验证"""
+
+    def __init__(self, max_size: int = 256, revalidate_workers: int = 2):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], datetime]]" = OrderedDict()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=revalidate_workers, thread_name_prefix='fund-revalidate')
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'revalidations': 0, 'revalidate_errors': 0}
+
+    def get(self, fund_code: str) -> Tuple[Optional[Dict[str, Any]], Optional[datetime]]:
+        """返回 (数据, 获取时间)，不存在时返回 (None, None)"""
+        with self._lock:
+            entry = self._entries.get(fund_code)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(fund_code)
+            return entry
+
+    def set(self, fund_code: str, data: Dict[str, Any], fetched_at: Optional[datetime] = None):
+        with self._lock:
+            self._entries[fund_code] = (data, fetched_at or datetime.now())
+            self._entries.move_to_end(fund_code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, fund_code: str):
+        with self._lock:
+            self._entries.pop(fund_code, None)
+
+    def record(self, key: str):
+        """累加命中统计"""
+        with self._lock:
+            self.stats[key] += 1
+
+    def revalidate(self, fund_code: str, refresh: Callable[[str], Any]) -> bool:
+        """
+        在后台重新获取数据，同一基金已有任务在执行时直接返回 False
+        refresh(fund_code) 负责获取并写入数据库与本缓存
+        """
+        with self._lock:
+            if fund_code in self._revalidating:
+                return False
+            self._revalidating.add(fund_code)
+            self.stats['revalidations'] += 1
+
+        def _run():
+            try:
+                refresh(fund_code)
+            except Exception as e:
+                print(f"[详情缓存] 后台刷新 {fund_code} 失败: {e}")
+                self.record('revalidate_errors')
+            finally:
+                with self._lock:
+                    self._revalidating.discard(fund_code)
+
+        self._executor.submit(_run)
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries), 'revalidating': len(self._revalidating)}
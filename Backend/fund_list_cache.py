@@ -2,13 +2,16 @@
 基金列表本地缓存服务
 从天天基金获取全部基金列表并存储到本地，支持快速本地搜索
 """
-import requests
 import json
 import os
 import re
+import math
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from http_client import get_http_client
+
 # 获取项目根目录下的 Data 文件夹路径
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'Data')
@@ -64,7 +67,7 @@ class FundRankingFetcher:
         }
         
         try:
-            response = requests.get(url, params=params, headers=self.headers, timeout=30)
+            response = get_http_client().get(url, params=params, headers=self.headers, timeout=30)
             if response.status_code != 200:
                 return {'success': False, 'error': f'请求失败: {response.status_code}'}
             
@@ -125,6 +128,45 @@ class FundRankingFetcher:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    def fetch_all_rankings(self, fund_type: str = 'all', page_size: int = 200, workers: int = 4) -> Dict[str, Any]:
+        """
+        分页并发获取整个排行榜（全部开放式基金约百余次请求）
+        先取第一页得到总数，其余页面并发获取；失败的页面记录在 failed_pages 中
+        """
+        first = self.fetch_fund_ranking(fund_type, 1, page_size)
+        if not first.get('success'):
+            return first
+        
+        total = int(first.get('total') or 0)
+        pages = max(1, math.ceil(total / page_size))
+        funds = list(first['funds'])
+        failed_pages = []
+        
+        if pages > 1:
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='rank-fetch') as executor:
+                page_results = executor.map(
+                    lambda page: (page, self.fetch_fund_ranking(fund_type, page, page_size)),
+                    range(2, pages + 1)
+                )
+                for page, result in page_results:
+                    if result.get('success'):
+                        funds.extend(result['funds'])
+                    else:
+                        failed_pages.append(page)
+        
+        # 分页期间排行变化可能导致同一基金出现在相邻两页，按代码去重
+        unique = {}
+        for fund in funds:
+            unique[fund['fund_code']] = fund
+        
+        return {
+            'success': True,
+            'total': total,
+            'pages': pages,
+            'failed_pages': failed_pages,
+            'funds': list(unique.values())
+        }
+    
     def _parse_float(self, value: str) -> Optional[float]:
         """解析浮点数"""
         if not value or value in ['', '--', '-']:
@@ -199,7 +241,7 @@ class FundListCache:
         try:
             # 天天基金全部基金列表API
             url = "http://fund.eastmoney.com/js/fundcode_search.js"
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = get_http_client().get(url, headers=self.headers, timeout=30)
             
             if response.status_code != 200:
                 return {"success": False, "error": f"API请求失败: {response.status_code}"}
@@ -6,11 +6,18 @@ Fund-Master API 路由模块
 
 from flask import Blueprint, jsonify, request
 from fund_master_service import get_fund_master_service
+from market_prefetch import get_market_prefetcher
 
 # 创建 Blueprint
 fund_master_bp = Blueprint('fund_master', __name__, url_prefix='/api/market')
 
 
+@fund_master_bp.before_request
+def _touch_market_prefetch():
+    """看板有人访问时保持后台预取（首个请求时启动预取线程）"""
+    get_market_prefetcher().touch()
+
+
 @fund_master_bp.route('/overview', methods=['GET'])
 def get_market_overview():
     """
@@ -3,14 +3,18 @@
 Fund-Master 核心功能服务模块
 移植自 fund-master/fund.py，提供实时市场数据获取能力
 包含：7x24快讯、行业板块排行、实时金价、历史金价、A股成交量、上证指数、市场指数汇总
+市场概览与多指数分时中互不依赖的数据源并发请求，每个数据源单独超时，失败时降级为空数据
 """
 
 import datetime
 import json
 import time
-import threading
-import requests
 import urllib3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from http_client import get_http_client
+from trading_calendar import cache_ttl
+from swr_cache import SWRCache
 
 try:
     from curl_cffi import requests as curl_requests
@@ -21,14 +25,17 @@ except ImportError:
 
 urllib3.disable_warnings()
 
+# 并发请求数据源的线程池：概览的各数据源与分时的各指数分开，避免嵌套提交时互相等待
+_SOURCE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='market-source')
+_INTRADAY_EXECUTOR = ThreadPoolExecutor(max_workers=6, thread_name_prefix='market-intraday')
+
 class FundMasterService:
     """Fund-Master 核心数据服务"""
     
-    # 内存缓存（带过期时间）
-    _cache = {}
-    _cache_lock = threading.Lock()
+    # 内存缓存（过期后在限定时间内先返回旧数据并后台刷新，见 swr_cache）
+    _cache = SWRCache('fund_master')
     
-    # 缓存过期时间配置（秒）
+    # 缓存过期时间配置（秒）：A 股数据为交易时段内的缓存时间，休市时按交易日历缓存到下一次开盘
     CACHE_TTL = {
         'flash_news': 60,           # 快讯 1分钟
         'sector_rank': 300,         # 板块排行 5分钟
@@ -39,8 +46,27 @@ class FundMasterService:
         'sse_30min': 60,            # 上证30分钟 1分钟
     }
     
+    # 按 A 股交易日历缓存的数据及其休市时的缓存上限（秒，None 表示缓存到下一次开盘）
+    # 快讯、贵金属为 7x24 数据，不在此表中，始终使用固定缓存时间
+    MARKET_HOURS_TTL = {
+        'sector_rank': None,
+        'market_index': 900,        # 含港股、美股指数，A 股休市后仍会变化
+        'a_volume_7days': None,
+        'sse_30min': None,
+    }
+    
+    # 并发请求时各数据源的超时（秒，从同一时刻起算）；超时的请求在后台继续执行，完成后照常写入缓存
+    SOURCE_TIMEOUT = {
+        'market_index': 6,
+        'gold_realtime': 6,
+        'sector_rank': 6,
+        'a_volume_7days': 6,
+        'sse_30min': 6,
+        'intraday': 5,              # 单个指数的腾讯分时
+    }
+    
     def __init__(self):
-        self.session = requests.Session()
+        self.session = get_http_client()
         self.baidu_session = None
         self._init_baidu_session()
     
@@ -75,39 +101,57 @@ class FundMasterService:
             # 降级使用普通 requests
             self.baidu_session = self.session
     
-    def _get_cache(self, key: str):
-        """获取缓存数据"""
-        with self._cache_lock:
-            if key in self._cache:
-                data, expire_time = self._cache[key]
-                if time.time() < expire_time:
-                    return data
-                else:
-                    del self._cache[key]
-        return None
+    def _get_cache(self, key: str, loader):
+        """获取缓存数据；过期时返回旧数据并后台调用 loader 刷新，没有可用数据时同步调用 loader"""
+        return self._cache.get(key, loader)
+    
+    def cache_expiry(self, key: str):
+        """缓存数据的过期时间戳（time.time()），没有缓存时返回 None"""
+        return self._cache.expiry(key)
     
-    def _set_cache(self, key: str, data, ttl_key: str):
-        """设置缓存数据"""
-        with self._cache_lock:
-            ttl = self.CACHE_TTL.get(ttl_key, 60)
-            self._cache[key] = (data, time.time() + ttl)
+    def _set_cache(self, key: str, data, ttl_key: str, complete: bool = True):
+        """设置缓存数据；complete=False（部分数据源失败）时不按交易日历延长缓存"""
+        ttl = self.CACHE_TTL.get(ttl_key, 60)
+        if complete and ttl_key in self.MARKET_HOURS_TTL:
+            ttl = cache_ttl(ttl, self.MARKET_HOURS_TTL[ttl_key])
+        self._cache.set(key, data, ttl)
+    
+    def _fan_out(self, executor, tasks: dict, timeouts: dict, fallback) -> dict:
+        """
+        并发执行互不依赖的数据源请求，返回 {名称: 结果}（顺序与 tasks 一致）
+        超时或异常的数据源使用 fallback(名称, 错误信息) 的结果，不影响其他数据源
+        """
+        start = time.monotonic()
+        futures = {name: executor.submit(fn) for name, fn in tasks.items()}
+        results = {}
+        for name, future in futures.items():
+            remaining = start + timeouts[name] - time.monotonic()
+            try:
+                results[name] = future.result(timeout=max(0, remaining))
+            except FutureTimeoutError:
+                print(f"[市场数据] {name} 请求超时（{timeouts[name]}s），降级为空数据")
+                results[name] = fallback(name, f"{name} 请求超时")
+            except Exception as e:
+                print(f"[市场数据] {name} 请求失败: {e}")
+                results[name] = fallback(name, str(e))
+        return results
     
     # ==================== 7x24 快讯 ====================
-    def get_flash_news(self, count: int = 20) -> dict:
+    def get_flash_news(self, count: int = 20, force: bool = False) -> dict:
         """
         获取7x24小时快讯
         数据源：百度股市通
         
         Args:
             count: 获取快讯数量，默认20条
+            force: 跳过缓存直接请求上游（后台预取与缓存刷新使用）
             
         Returns:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = f'flash_news_{count}'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_flash_news(count, force=True))
         
         try:
             url = f"https://finance.pae.baidu.com/selfselect/expressnews?rn={count}&pn=0&tag=A股&finClientType=pc"
@@ -161,21 +205,21 @@ class FundMasterService:
             return {"success": False, "error": str(e), "data": []}
     
     # ==================== 行业板块排行 ====================
-    def get_sector_rank(self, limit: int = 50) -> dict:
+    def get_sector_rank(self, limit: int = 50, force: bool = False) -> dict:
         """
         获取行业板块排行（按主力净流入排序）
         数据源：东方财富
         
         Args:
             limit: 返回板块数量，默认50
+            force: 跳过缓存直接请求上游（后台预取与缓存刷新使用）
             
         Returns:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = f'sector_rank_{limit}'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_sector_rank(limit, force=True))
         
         try:
             url = "https://push2.eastmoney.com/api/qt/clist/get"
@@ -197,7 +241,7 @@ class FundMasterService:
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10, verify=False)
+            response = self.session.get(url, params=params, headers=headers, timeout=10, verify=False)
             resp_data = response.json()
             
             if resp_data.get("data"):
@@ -239,7 +283,7 @@ class FundMasterService:
             return {"success": False, "error": str(e), "data": []}
     
     # ==================== 市场指数汇总 ====================
-    def get_market_index(self) -> dict:
+    def get_market_index(self, force: bool = False) -> dict:
         """
         获取市场指数汇总（A股主要指数 + 全球指数）
         数据源：东方财富（更稳定）
@@ -248,9 +292,8 @@ class FundMasterService:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = 'market_index'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_market_index(force=True))
         
         result = []
         try:
@@ -290,7 +333,7 @@ class FundMasterService:
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10, verify=False)
+            response = self.session.get(url, params=params, headers=headers, timeout=10, verify=False)
             resp_data = response.json()
             
             if resp_data.get("data") and resp_data["data"].get("diff"):
@@ -340,7 +383,7 @@ class FundMasterService:
             return {"success": False, "error": str(e), "data": result}
     
     # ==================== 实时贵金属价格 ====================
-    def get_gold_realtime(self) -> dict:
+    def get_gold_realtime(self, force: bool = False) -> dict:
         """
         获取实时贵金属价格
         数据源：金投网/集金号
@@ -349,9 +392,8 @@ class FundMasterService:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = 'gold_realtime'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_gold_realtime(force=True))
         
         try:
             headers = {
@@ -366,7 +408,7 @@ class FundMasterService:
                 "_": str(int(time.time() * 1000))
             }
             
-            response = requests.get(url, headers=headers, params=params, timeout=10, verify=False)
+            response = self.session.get(url, headers=headers, params=params, timeout=10, verify=False)
             raw = response.text.replace("var quote_json = ", "")
             data = json.loads(raw)
             
@@ -413,21 +455,21 @@ class FundMasterService:
             return {"success": False, "error": str(e), "data": []}
     
     # ==================== 黄金历史价格 ====================
-    def get_gold_history(self, days: int = 10) -> dict:
+    def get_gold_history(self, days: int = 10, force: bool = False) -> dict:
         """
         获取黄金历史价格
         数据源：金投网/集金号
         
         Args:
             days: 获取天数，默认10天
+            force: 跳过缓存直接请求上游（后台预取与缓存刷新使用）
             
         Returns:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = f'gold_history_{days}'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_gold_history(days, force=True))
         
         try:
             headers = {
@@ -446,12 +488,12 @@ class FundMasterService:
                 "currentPage": "1",
                 "_": int(time.time() * 1000)
             }
-            response = requests.get(url, headers=headers, params=params, timeout=10, verify=False)
+            response = self.session.get(url, headers=headers, params=params, timeout=10, verify=False)
             data1 = json.loads(response.text.replace("var quote_json = ", ""))["data"]
             
             # 周大福金价
             params["code"] = "JO_42660"
-            response = requests.get(url, headers=headers, params=params, timeout=10, verify=False)
+            response = self.session.get(url, headers=headers, params=params, timeout=10, verify=False)
             data2 = json.loads(response.text.replace("var quote_json = ", ""))["data"]
             
             result = []
@@ -485,7 +527,7 @@ class FundMasterService:
             return {"success": False, "error": str(e), "data": []}
     
     # ==================== 近7日A股成交量 ====================
-    def get_a_volume_7days(self) -> dict:
+    def get_a_volume_7days(self, force: bool = False) -> dict:
         """
         获取近7日A股成交量（沪深北三市）
         数据源：百度股市通
@@ -494,9 +536,8 @@ class FundMasterService:
             dict: {'success': bool, 'data': list, 'update_time': str}
         """
         cache_key = 'a_volume_7days'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_a_volume_7days(force=True))
         
         try:
             url = "https://finance.pae.baidu.com/sapi/v1/metrictrend"
@@ -570,7 +611,7 @@ class FundMasterService:
                 "Referer": "https://gu.qq.com/"
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self.session.get(url, params=params, headers=headers, timeout=10)
             data = response.json()
             
             # 解析数据结构: data -> code -> data -> data
@@ -628,7 +669,7 @@ class FundMasterService:
             print(f"Error fetching tencent intraday for {code}: {e}")
             return []
 
-    def get_indices_intraday(self) -> dict:
+    def get_indices_intraday(self, force: bool = False) -> dict:
         """
         获取多指数分时数据（上证、深证、沪深300）
         使用腾讯财经作为数据源
@@ -637,13 +678,17 @@ class FundMasterService:
             dict: {'sh': [], 'sz': [], 'hs300': [], 'update_time': str}
         """
         cache_key = 'indices_intraday'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
-            
-        sh_data = self._get_tencent_intraday("sh000001")
-        sz_data = self._get_tencent_intraday("sz399001")
-        hs300_data = self._get_tencent_intraday("sh000300")
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_indices_intraday(force=True))
+            
+        codes = {"sh": "sh000001", "sz": "sz399001", "hs300": "sh000300"}
+        intraday = self._fan_out(
+            _INTRADAY_EXECUTOR,
+            {key: (lambda code=code: self._get_tencent_intraday(code)) for key, code in codes.items()},
+            {key: self.SOURCE_TIMEOUT['intraday'] for key in codes},
+            lambda name, error: []
+        )
+        sh_data, sz_data, hs300_data = intraday["sh"], intraday["sz"], intraday["hs300"]
         
         data = {
             "success": True,
@@ -654,7 +699,8 @@ class FundMasterService:
             },
             "update_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        self._set_cache(cache_key, data, 'sse_30min') # 复用 sse_30min 的 TTL (1分钟)
+        complete = bool(sh_data and sz_data and hs300_data)
+        self._set_cache(cache_key, data, 'sse_30min', complete) # 复用 sse_30min 的 TTL (交易时段 1分钟)
         return data
 
     def get_sse_30min(self) -> dict:
@@ -675,17 +721,26 @@ class FundMasterService:
     def get_market_overview(self) -> dict:
         """
         获取市场概览（汇总所有关键数据）
+        各数据源并发请求，冷缓存时耗时约等于最慢的单个数据源；
+        超时或失败的数据源返回 {'success': False, 'error': ..., 'data': []}
         
         Returns:
             dict: 包含所有市场数据的汇总
         """
+        sources = {
+            "market_index": self.get_market_index,
+            "gold_realtime": self.get_gold_realtime,
+            "sector_rank": lambda: self.get_sector_rank(limit=20),
+            "a_volume_7days": self.get_a_volume_7days,
+            "sse_30min": self.get_sse_30min,
+        }
+        results = self._fan_out(
+            _SOURCE_EXECUTOR, sources, self.SOURCE_TIMEOUT,
+            lambda name, error: {"success": False, "error": error, "data": []}
+        )
         return {
             "success": True,
-            "market_index": self.get_market_index(),
-            "gold_realtime": self.get_gold_realtime(),
-            "sector_rank": self.get_sector_rank(limit=20),
-            "a_volume_7days": self.get_a_volume_7days(),
-            "sse_30min": self.get_sse_30min(),
+            **results,
             "update_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
 
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+基金数据批量写库
+详情接口与批量抓取共用：一批清洗后的基金数据按表各执行一次
+INSERT ... ON CONFLICT(fund_code) DO UPDATE（executemany），不再逐只逐表 SELECT + ORM 赋值
+- 只写入、不提交，由调用方与检查点等其他写操作在同一事务中提交
+- Core 语句不会触发 onupdate，updated_time 显式写入
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import (FundBasicInfo, FundTrend, FundEstimate, FundPortfolio,
+                    FundExtraData, FundRiskMetrics, FundFetchState)
+from nav_codec import encode_nav_series
+from risk_metrics import RISK_METRIC_FIELDS
+from screening_rankings import RETURN_COLUMNS, parse_return_columns
+
+# (fund_code, 清洗后的基金数据, 风险指标或 None)
+FundPayload = Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]
+
+
+def _json_dumps(data):
+    return json.dumps(data, ensure_ascii=False) if data is not None else None
+
+
+def nav_trend_columns(series) -> Dict[str, Any]:
+    """单位净值走势的存储列：优先二进制编码，无法无损编码时保存 JSON"""
+    blob = encode_nav_series(series or [])
+    if blob is None:
+        return {'net_worth_trend_blob': None, 'net_worth_trend_json': _json_dumps(series)}
+    return {'net_worth_trend_blob': blob, 'net_worth_trend_json': None}
+
+
+def _upsert(db: Session, model, rows: List[Dict[str, Any]], set_overrides=None):
+    """按 fund_code 批量 upsert；rows 的键需一致，除 fund_code 外的列冲突时全部覆盖"""
+    if not rows:
+        return
+    statement = sqlite_insert(model.__table__)
+    updates = {column: statement.excluded[column] for column in rows[0] if column != 'fund_code'}
+    updates.update(set_overrides(statement) if set_overrides else {})
+    db.execute(statement.on_conflict_do_update(index_elements=['fund_code'], set_=updates), rows)
+
+
+def _basic_row(fund_code, data, now):
+    basic_info = data.get('basic_info') or {}
+    # 缺失的收益字段不写入，合并时保留排行榜快速刷新写入的值（见 _merge_basic_returns）
+    performance = {key: value for key, value in (data.get('performance') or {}).items() if value is not None}
+    return {
+        'fund_code': fund_code,
+        'fund_name': basic_info.get('fund_name') or fund_code,
+        'fund_type': basic_info.get('fund_type', ''),
+        'original_rate': basic_info.get('original_rate'),
+        'current_rate': basic_info.get('current_rate'),
+        'min_subscription_amount': basic_info.get('min_subscription_amount'),
+        'is_hb': basic_info.get('is_hb'),
+        'basic_json': _json_dumps(basic_info),
+        'performance_json': _json_dumps(performance),
+        # 可筛选/排序的收益率字段
+        **parse_return_columns(performance),
+        'updated_time': now,
+    }
+
+
+def _merge_basic_returns(statement):
+    """
+    FundBasicInfo 冲突更新时合并而不是覆盖收益数据：
+    详情数据只有近1月/3月/6月/1年收益，排行榜快速刷新写入的近1周、2年、3年、今年来收益与 ranking_date
+    保留在 performance_json 中（json_patch 只覆盖本次包含的键），return_* 列本次为空时保留原值
+    """
+    table = FundBasicInfo.__table__
+    excluded = statement.excluded
+    return {
+        'performance_json': case(
+            (func.json_valid(table.c.performance_json),
+             func.json_patch(table.c.performance_json, excluded.performance_json)),
+            else_=excluded.performance_json,
+        ),
+        **{column: func.coalesce(excluded[column], table.c[column]) for column in RETURN_COLUMNS},
+    }
+
+
+def _trend_row(fund_code, data, now):
+    return {
+        'fund_code': fund_code,
+        **nav_trend_columns(data.get('net_worth_trend', [])),
+        'accumulated_net_worth_json': _json_dumps(data.get('accumulated_net_worth', [])),
+        'position_trend_json': _json_dumps(data.get('position_trend', [])),
+        'total_return_trend_json': _json_dumps(data.get('total_return_trend', [])),
+        'ranking_trend_json': _json_dumps(data.get('ranking_trend', [])),
+        'ranking_percentage_json': _json_dumps(data.get('ranking_percentage', [])),
+        'scale_fluctuation_json': _json_dumps(data.get('scale_fluctuation', {})),
+        # 内容未变化时也刷新时间，详情缓存依赖该时间判断新鲜度
+        'updated_time': now,
+    }
+
+
+def _estimate_row(fund_code, data, now):
+    estimate = data.get('realtime_estimate') or {}
+    return {
+        'fund_code': fund_code,
+        'name': estimate.get('name'),
+        'net_worth': estimate.get('net_worth'),
+        'net_worth_date': estimate.get('net_worth_date'),
+        'estimate_value': estimate.get('estimate_value'),
+        'estimate_change': estimate.get('estimate_change'),
+        'estimate_time': estimate.get('estimate_time'),
+        'updated_time': now,
+    }
+
+
+def _portfolio_row(fund_code, data, now):
+    portfolio = data.get('portfolio') or {}
+    return {
+        'fund_code': fund_code,
+        'stock_codes_json': _json_dumps(portfolio.get('stock_codes', [])),
+        'bond_codes_json': _json_dumps(portfolio.get('bond_codes', [])),
+        'stock_codes_new_json': _json_dumps(portfolio.get('stock_codes_new', [])),
+        'bond_codes_new_json': _json_dumps(portfolio.get('bond_codes_new', [])),
+        'updated_time': now,
+    }
+
+
+def _extra_row(fund_code, data, now):
+    return {
+        'fund_code': fund_code,
+        'holder_structure_json': _json_dumps(data.get('holder_structure', {})),
+        'asset_allocation_json': _json_dumps(data.get('asset_allocation', {})),
+        'performance_evaluation_json': _json_dumps(data.get('performance_evaluation', {})),
+        'fund_managers_json': _json_dumps(data.get('fund_managers', [])),
+        'subscription_redemption_json': _json_dumps(data.get('subscription_redemption', {})),
+        'same_type_funds_json': _json_dumps(data.get('same_type_funds', [])),
+        'updated_time': now,
+    }
+
+
+def _risk_row(fund_code, risk_metrics, now):
+    return {
+        'fund_code': fund_code,
+        **{field: risk_metrics.get(field) for field in RISK_METRIC_FIELDS},
+        'updated_time': now,
+    }
+
+
+def upsert_fund_payloads(db: Session, payloads: Iterable[FundPayload]) -> int:
+    """
+    批量写入基金数据到所有相关表（不提交），返回写入的基金数
+    实时估值与持仓只在数据中包含对应字段时写入（按数据段抓取时可能缺失）
+    """
+    now = datetime.now()
+    rows = {model: [] for model in (FundBasicInfo, FundTrend, FundEstimate, FundPortfolio,
+                                     FundExtraData, FundRiskMetrics)}
+    count = 0
+    for fund_code, data, risk_metrics in payloads:
+        count += 1
+        rows[FundBasicInfo].append(_basic_row(fund_code, data, now))
+        rows[FundTrend].append(_trend_row(fund_code, data, now))
+        rows[FundExtraData].append(_extra_row(fund_code, data, now))
+        if 'realtime_estimate' in data:
+            rows[FundEstimate].append(_estimate_row(fund_code, data, now))
+        if 'portfolio' in data:
+            rows[FundPortfolio].append(_portfolio_row(fund_code, data, now))
+        if risk_metrics:
+            rows[FundRiskMetrics].append(_risk_row(fund_code, risk_metrics, now))
+
+    for model, model_rows in rows.items():
+        _upsert(db, model, model_rows, _merge_basic_returns if model is FundBasicInfo else None)
+    return count
+
+
+def touch_trends(db: Session, fund_codes: Iterable[str], chunk_size: int = 500):
+    """
+    上游内容未变化的基金只刷新 FundTrend.updated_time（不提交）
+    详情缓存按该时间判断新鲜度，不刷新会把刚确认过的数据当作过期而重复请求上游
+    """
+    now = datetime.now()
+    codes = list(fund_codes)
+    for offset in range(0, len(codes), chunk_size):
+        db.execute(update(FundTrend.__table__)
+                   .where(FundTrend.__table__.c.fund_code.in_(codes[offset:offset + chunk_size]))
+                   .values(updated_time=now))
+
+
+def upsert_fetch_states(db: Session, states: Iterable[Tuple[str, Optional[Dict[str, Any]], bool]]):
+    """
+    批量记录上游抓取状态（内容哈希 / ETag / Last-Modified），不提交
+    states: (fund_code, fetch_state, changed)；内容未变化时保留原 changed_time
+    """
+    now = datetime.now()
+    changed_rows = []
+    unchanged_rows = []
+    for fund_code, fetch_state, changed in states:
+        if not fetch_state:
+            continue
+        row = {
+            'fund_code': fund_code,
+            'content_hash': fetch_state.get('content_hash'),
+            'etag': fetch_state.get('etag'),
+            'last_modified': fetch_state.get('last_modified'),
+            'checked_time': now,
+            'changed_time': now,
+        }
+        (changed_rows if changed else unchanged_rows).append(row)
+
+    table = FundFetchState.__table__
+    _upsert(db, FundFetchState, changed_rows)
+    _upsert(db, FundFetchState, unchanged_rows, lambda statement: {
+        'changed_time': func.coalesce(table.c.changed_time, statement.excluded.changed_time)
+    })
+
+
+def upsert_estimates(db: Session, estimates: Dict[str, Dict[str, Any]]) -> int:
+    """批量写入实时估值（fund_code -> realtime_estimate），不提交，返回写入的基金数"""
+    now = datetime.now()
+    rows = [_estimate_row(fund_code, {'realtime_estimate': estimate}, now)
+            for fund_code, estimate in estimates.items()]
+    _upsert(db, FundEstimate, rows)
+    return len(rows)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+上游 HTTP 连接池
+所有上游数据源（天天基金、实时估值、腾讯、东方财富、新浪等）共用：
+- 每个域名一个 requests.Session，长连接复用，避免每次请求重新 TCP/TLS 握手
+- 连接池大小、连接/读取超时、重试策略集中配置
+- 按域名统计请求数与新建连接数，用于观察连接复用率
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# 默认超时：(连接超时, 读取超时) 秒
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# 每个域名的连接池大小，需不小于批量抓取的并发线程数
+DEFAULT_POOL_MAXSIZE = 32
+
+# 默认重试：只重试连接错误和网关类错误；429 交给调用方（如 crawler 限速器）处理
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.3
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class HttpClient:
+    """
+    按域名分配的连接池客户端
+    接口与 requests.get / requests.post 保持一致，可直接替换模块级调用
+    """
+
+    def __init__(self, pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff_factor: float = DEFAULT_BACKOFF_FACTOR):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._sessions: Dict[str, requests.Session] = {}
+        self._request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=1,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize,
+                              max_retries=retry, pool_block=False)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def session_for(self, url: str) -> requests.Session:
+        """获取 url 所属域名的会话（不存在时创建）"""
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = self._new_session()
+                self._request_counts[host] = 0
+            self._request_counts[host] += 1
+        return session
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        return self.session_for(url).request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        return self.request('GET', url, params=params, **kwargs)
+
+    def post(self, url: str, data=None, json=None, **kwargs) -> requests.Response:
+        return self.request('POST', url, data=data, json=json, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        按域名统计连接复用情况
+        requests: 发出的请求数；connections: 新建的 TCP 连接数；
+        reused: 复用已有连接的请求数（含重试）
+        """
+        with self._lock:
+            sessions = dict(self._sessions)
+            request_counts = dict(self._request_counts)
+
+        stats = {}
+        for host, session in sessions.items():
+            new_connections = 0
+            pool_requests = 0
+            adapter = session.get_adapter('https://')
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                new_connections += pool.num_connections
+                pool_requests += pool.num_requests
+            stats[host] = {
+                'requests': request_counts.get(host, 0),
+                'connections': new_connections,
+                'reused': max(0, pool_requests - new_connections),
+                'reuse_rate': round(1 - new_connections / pool_requests, 4) if pool_requests else None,
+            }
+        return stats
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+# 单例模式
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """获取全局连接池客户端单例"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HttpClient()
+    return _http_client
@@ -18,7 +18,10 @@ import random
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from dataclasses import dataclass, field
-import requests
+
+from http_client import get_http_client
+from trading_calendar import cache_ttl
+from swr_cache import SWRCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -115,9 +118,8 @@ class MarketDataService:
     def __init__(self):
         if self._initialized:
             return
-        self._cache = {}
-        self._cache_time = {}
-        self._cache_ttl = 60  # 缓存60秒
+        self._cache = SWRCache('market_data')
+        self._cache_ttl = 60  # 交易时段缓存60秒，休市时缓存到下一次开盘
         self._initialized = True
         self._last_request_time = None
         self._min_interval = 1.0  # 最小请求间隔（秒）
@@ -130,22 +132,17 @@ class MarketDataService:
                 time.sleep(self._min_interval - elapsed)
         self._last_request_time = time.time()
     
-    def _is_cache_valid(self, key: str) -> bool:
-        """检查缓存是否有效"""
-        if key not in self._cache_time:
-            return False
-        return (time.time() - self._cache_time[key]) < self._cache_ttl
-    
-    def _set_cache(self, key: str, data: Any):
-        """设置缓存"""
-        self._cache[key] = data
-        self._cache_time[key] = time.time()
+    def _set_cache(self, key: str, data: Any, complete: bool = True):
+        """
+        设置缓存（过期时间按交易日历计算）
+        complete=False（接口失败、使用兜底数据）时只保留交易时段的缓存时间，休市时不延长到下一次开盘
+        """
+        ttl = cache_ttl(self._cache_ttl) if complete else self._cache_ttl
+        self._cache.set(key, data, ttl)
     
-    def _get_cache(self, key: str) -> Optional[Any]:
-        """获取缓存"""
-        if self._is_cache_valid(key):
-            return self._cache.get(key)
-        return None
+    def _get_cache(self, key: str, loader) -> Any:
+        """获取缓存；过期时返回旧数据并后台调用 loader 刷新，没有可用数据时同步调用 loader"""
+        return self._cache.get(key, loader)
     
     def _call_akshare_with_retry(self, fn, name: str, attempts: int = 2):
         """带重试的 akshare 调用"""
@@ -167,7 +164,7 @@ class MarketDataService:
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
             }
-            resp = requests.get(url, params=params or {}, headers=headers, timeout=8)
+            resp = get_http_client().get(url, params=params or {}, headers=headers, timeout=8)
             if resp.status_code == 200:
                 return resp.json()
             logger.warning(f"[市场数据] EM {url} 返回状态 {resp.status_code}")
@@ -184,16 +181,14 @@ class MarketDataService:
         except (ValueError, TypeError):
             return default
     
-    def get_index_realtime(self) -> List[Dict[str, Any]]:
+    def get_index_realtime(self, force: bool = False) -> List[Dict[str, Any]]:
         """
         获取核心指数实时行情
         使用 akshare 的 stock_zh_index_spot_sina 接口
         """
         cache_key = 'index_realtime'
-        cached = self._get_cache(cache_key)
-        if cached:
-            logger.debug("[市场数据] 使用缓存的指数行情数据")
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_index_realtime(force=True))
         
         if not AKSHARE_AVAILABLE:
             logger.warning("[市场数据] akshare 不可用，返回空数据")
@@ -283,10 +278,11 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取指数行情失败: {e}")
         
+        fetched = bool(indices)
         if not indices:
             indices = self._get_fallback_indices()
         
-        self._set_cache(cache_key, indices)
+        self._set_cache(cache_key, indices, complete=fetched)
         return indices
     
     def _get_fallback_indices(self) -> List[Dict[str, Any]]:
@@ -297,16 +293,15 @@ class MarketDataService:
             {'code': '399006', 'name': '创业板指', 'price': 0, 'change_pct': 0, 'amount': 0, 'amplitude': 0},
         ]
     
-    def get_north_flow(self) -> Dict[str, Any]:
+    def get_north_flow(self, force: bool = False) -> Dict[str, Any]:
         """
         获取北向资金流向数据
         使用 akshare 的沪深港通接口
         注意：部分接口可能不稳定，使用多种备选方案
         """
         cache_key = 'north_flow'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_north_flow(force=True))
         
         result = {
             'total': 0,
@@ -363,18 +358,17 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取北向资金失败: {e}")
         
-        self._set_cache(cache_key, result)
+        self._set_cache(cache_key, result, complete=result['status'] == 'trading')
         return result
     
-    def get_main_flow(self) -> Dict[str, Any]:
+    def get_main_flow(self, force: bool = False) -> Dict[str, Any]:
         """
         获取主力资金流向数据
         使用 akshare 的资金流向接口
         """
         cache_key = 'main_flow'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_main_flow(force=True))
         
         result = {
             'main_net': 0,  # 主力净流入（亿元）
@@ -388,6 +382,7 @@ class MarketDataService:
         if not AKSHARE_AVAILABLE:
             return result
         
+        fetched = False
         try:
             logger.info("[市场数据] 获取主力资金数据...")
             
@@ -412,24 +407,24 @@ class MarketDataService:
                 result['medium'] = round(medium / 1e8, 2)
                 result['small'] = round(small / 1e8, 2)
                 result['main_net'] = round((super_large + large) / 1e8, 2)
+                fetched = True
                 
                 logger.info(f"[市场数据] 主力净流入: {result['main_net']}亿")
                 
         except Exception as e:
             logger.error(f"[市场数据] 获取主力资金失败: {e}")
         
-        self._set_cache(cache_key, result)
+        self._set_cache(cache_key, result, complete=fetched)
         return result
     
-    def get_market_breadth(self) -> Dict[str, Any]:
+    def get_market_breadth(self, force: bool = False) -> Dict[str, Any]:
         """
         获取市场广度数据（涨跌统计）
         使用 akshare 的 A 股实时行情接口
         """
         cache_key = 'market_breadth'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_market_breadth(force=True))
         
         result = {
             'up_count': 0,
@@ -478,18 +473,18 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取市场广度失败: {e}")
         
-        self._set_cache(cache_key, result)
+        counted = result['up_count'] + result['down_count'] + result['flat_count'] > 0
+        self._set_cache(cache_key, result, complete=counted)
         return result
     
-    def get_hot_sectors(self) -> List[Dict[str, Any]]:
+    def get_hot_sectors(self, force: bool = False) -> List[Dict[str, Any]]:
         """
         获取热门板块排行
         使用 akshare 的行业板块接口
         """
         cache_key = 'hot_sectors'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_hot_sectors(force=True))
         
         sectors = []
         
@@ -579,18 +574,17 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取热门板块失败: {e}")
         
-        self._set_cache(cache_key, sectors)
+        self._set_cache(cache_key, sectors, complete=bool(sectors))
         return sectors
     
-    def get_limit_up_stocks(self, limit: int = 10) -> List[Dict[str, Any]]:
+    def get_limit_up_stocks(self, limit: int = 10, force: bool = False) -> List[Dict[str, Any]]:
         """
         获取涨停股票列表
         使用 akshare 的涨停板接口
         """
         cache_key = f'limit_up_stocks_{limit}'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_limit_up_stocks(limit, force=True))
         
         stocks = []
         
@@ -628,18 +622,17 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取涨停股票失败: {e}")
         
-        self._set_cache(cache_key, stocks)
+        self._set_cache(cache_key, stocks, complete=bool(stocks))
         return stocks
     
-    def get_concept_sectors(self, limit: int = 10) -> List[Dict[str, Any]]:
+    def get_concept_sectors(self, limit: int = 10, force: bool = False) -> List[Dict[str, Any]]:
         """
         获取概念板块排行
         使用 akshare 的概念板块接口
         """
         cache_key = f'concept_sectors_{limit}'
-        cached = self._get_cache(cache_key)
-        if cached:
-            return cached
+        if not force:
+            return self._get_cache(cache_key, lambda: self.get_concept_sectors(limit, force=True))
         
         sectors = []
         
@@ -678,7 +671,7 @@ class MarketDataService:
         except Exception as e:
             logger.error(f"[市场数据] 获取概念板块失败: {e}")
         
-        self._set_cache(cache_key, sectors)
+        self._set_cache(cache_key, sectors, complete=bool(sectors))
         return sectors
     
     def get_market_overview(self) -> Dict[str, Any]:
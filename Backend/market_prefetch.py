@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+市场看板数据后台预取
+- 为每个注册的数据源（快讯、板块、指数、金价、成交量、分时）在缓存过期前 PREFETCH_LEAD 秒主动刷新，
+  接口请求只读取已预热的缓存，不再由某个用户承担上游耗时
+- 缓存时间由 FundMasterService 决定（含交易日历），休市期间缓存到下一次开盘，预取随之暂停
+- 刷新失败（没有写入缓存）时按指数退避重试
+- 超过 PREFETCH_IDLE_TIMEOUT 秒没有看板请求时暂停预取，有请求后恢复
+- 首个 /api/market 请求时启动（设置 MARKET_PREFETCH=0 关闭）
+"""
+
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+MARKET_PREFETCH_ENABLED = os.getenv('MARKET_PREFETCH', '1') != '0'
+
+# 缓存过期前多少秒开始刷新
+PREFETCH_LEAD = float(os.getenv('MARKET_PREFETCH_LEAD', '10'))
+
+# 两次刷新同一数据源的最小间隔（秒）
+PREFETCH_MIN_INTERVAL = 5.0
+
+# 刷新失败后的重试间隔（秒）：从 RETRY_BASE 开始翻倍，不超过 RETRY_MAX
+RETRY_BASE = 15.0
+RETRY_MAX = 300.0
+
+# 无看板请求超过该时间（秒）后暂停预取
+PREFETCH_IDLE_TIMEOUT = float(os.getenv('MARKET_PREFETCH_IDLE_TIMEOUT', '1800'))
+
+# 暂停期间检查是否恢复的间隔（秒）
+IDLE_CHECK_INTERVAL = 30.0
+
+# 默认注册的数据源：(名称, 缓存键, 刷新函数)，参数与前端组件、市场概览使用的一致
+DEFAULT_SOURCES = (
+    ('flash_news_15', 'flash_news_15', lambda service: service.get_flash_news(count=15, force=True)),
+    ('flash_news_50', 'flash_news_50', lambda service: service.get_flash_news(count=50, force=True)),
+    ('sector_rank_50', 'sector_rank_50', lambda service: service.get_sector_rank(limit=50, force=True)),
+    ('sector_rank_20', 'sector_rank_20', lambda service: service.get_sector_rank(limit=20, force=True)),
+    ('market_index', 'market_index', lambda service: service.get_market_index(force=True)),
+    ('gold_realtime', 'gold_realtime', lambda service: service.get_gold_realtime(force=True)),
+    ('gold_history_10', 'gold_history_10', lambda service: service.get_gold_history(days=10, force=True)),
+    ('a_volume_7days', 'a_volume_7days', lambda service: service.get_a_volume_7days(force=True)),
+    ('indices_intraday', 'indices_intraday', lambda service: service.get_indices_intraday(force=True)),
+)
+
+
+class MarketPrefetcher:
+    """按缓存过期时间调度的预取线程"""
+
+    def __init__(self, service, lead: float = PREFETCH_LEAD, idle_timeout: float = PREFETCH_IDLE_TIMEOUT,
+                 workers: int = 4, enabled: bool = MARKET_PREFETCH_ENABLED):
+        self.service = service
+        self.lead = lead
+        self.idle_timeout = idle_timeout
+        self.enabled = enabled
+        self._sources: Dict[str, Tuple[str, Callable]] = {}
+        self._failures: Dict[str, int] = {}
+        self._schedule: List[Tuple[float, str]] = []     # (time.time() 下次刷新时间, 名称)
+        self._running_sources = set()
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='market-prefetch')
+        self._thread: Optional[threading.Thread] = None
+        self._last_access = time.time()
+        self.stats = {'refreshes': 0, 'failures': 0, 'skipped_idle': 0}
+
+    def register(self, name: str, cache_key: str, refresh: Callable):
+        """注册数据源：refresh(service) 跳过缓存请求上游并写入 cache_key"""
+        with self._condition:
+            self._sources[name] = (cache_key, refresh)
+            heapq.heappush(self._schedule, (time.time(), name))
+            self._condition.notify()
+
+    def touch(self):
+        """记录一次看板请求；首次调用时启动预取线程"""
+        self._last_access = time.time()
+        if self.enabled and self._thread is None:
+            with self._condition:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='market-prefetch', daemon=True)
+                    self._thread.start()
+
+    def _next_run(self, name: str, now: float) -> float:
+        """刷新完成后的下次刷新时间：缓存过期前 lead 秒；没有缓存（失败）时退避重试"""
+        cache_key, _ = self._sources[name]
+        expiry = self.service.cache_expiry(cache_key)
+        if expiry is None or expiry <= now:
+            failures = self._failures.get(name, 0) + 1
+            self._failures[name] = failures
+            self.stats['failures'] += 1
+            return now + min(RETRY_MAX, RETRY_BASE * 2 ** (failures - 1))
+        self._failures.pop(name, None)
+        return max(now + PREFETCH_MIN_INTERVAL, expiry - self.lead)
+
+    def _refresh(self, name: str):
+        _, refresh = self._sources[name]
+        try:
+            refresh(self.service)
+        except Exception as e:
+            print(f"[市场预取] {name} 刷新失败: {e}")
+        with self._condition:
+            self.stats['refreshes'] += 1
+            self._running_sources.discard(name)
+            heapq.heappush(self._schedule, (self._next_run(name, time.time()), name))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.time()
+                while not self._schedule or self._schedule[0][0] > now:
+                    timeout = self._schedule[0][0] - now if self._schedule else None
+                    self._condition.wait(timeout)
+                    now = time.time()
+                _, name = heapq.heappop(self._schedule)
+                if name in self._running_sources:
+                    continue
+                if now - self._last_access > self.idle_timeout:
+                    # 无人查看时暂停，定期检查是否恢复
+                    self.stats['skipped_idle'] += 1
+                    heapq.heappush(self._schedule, (now + IDLE_CHECK_INTERVAL, name))
+                    continue
+                # 其他请求已刷新、缓存仍在有效期内时按新的过期时间重新排期
+                expiry = self.service.cache_expiry(self._sources[name][0])
+                if expiry is not None and expiry - self.lead > now + PREFETCH_MIN_INTERVAL:
+                    heapq.heappush(self._schedule, (expiry - self.lead, name))
+                    continue
+                self._running_sources.add(name)
+            self._executor.submit(self._refresh, name)
+
+    def get_stats(self):
+        with self._condition:
+            now = time.time()
+            schedule = {name: round(run_at - now, 1) for run_at, name in self._schedule}
+            return {
+                **self.stats,
+                'enabled': self.enabled,
+                'running': self._thread is not None,
+                'idle': now - self._last_access > self.idle_timeout,
+                'next_refresh_in': dict(sorted(schedule.items())),
+                'failing': dict(self._failures),
+            }
+
+
+_market_prefetcher: Optional[MarketPrefetcher] = None
+_market_prefetcher_lock = threading.Lock()
+
+
+def get_market_prefetcher() -> MarketPrefetcher:
+    """获取市场数据预取单例（注册默认数据源）"""
+    global _market_prefetcher
+    if _market_prefetcher is None:
+        with _market_prefetcher_lock:
+            if _market_prefetcher is None:
+                from fund_master_service import get_fund_master_service
+                prefetcher = MarketPrefetcher(get_fund_master_service())
+                for name, cache_key, refresh in DEFAULT_SOURCES:
+                    prefetcher.register(name, cache_key, refresh)
+                _market_prefetcher = prefetcher
+    return _market_prefetcher
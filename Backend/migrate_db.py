@@ -1,8 +1,19 @@
 import sqlite3
 import os
+import time
 import json
-import math
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from db_types import (
+    MIN_COMPRESS_SIZE, CompressedJSONText, compress_text, compression_method, decompress_value,
+    save_zstd_dictionary, train_zstd_dictionary,
+)
+from models import Base
+from nav_codec import encode_nav_series
+from risk_metrics import RISK_METRIC_FIELDS, calculate_risk_metrics, calculate_risk_metrics_from_blob, period_cutoffs
+from screening_rankings import RETURN_COLUMNS, SAME_TYPE_RANKING_SQL, parse_return_columns, ranking_params
 
 # Database path
 DB_PATH = r'c:\Users\Sebastian\Desktop\GoFundBot\MyBot\Data\funds.db'
@@ -59,6 +70,10 @@ def migrate_database():
         else:
              print("fund_screening_rank table already exists.")
 
+        # 3. Check/Add fund_basic_info return_* columns (read by the ranking SQL)
+        print("Checking fund_basic_info return columns...")
+        _ensure_return_columns(cursor)
+
         conn.commit()
         print("Migration completed successfully!")
         
@@ -132,388 +147,401 @@ def clean_dirty_data():
         conn.close()
 
 
-def recalculate_all_risk_metrics():
+# 风险指标写入语句（列顺序与 RISK_METRIC_FIELDS 一致）
+RISK_METRICS_UPSERT_SQL = f"""
+    INSERT OR REPLACE INTO fund_risk_metrics 
+    (fund_code, {', '.join(RISK_METRIC_FIELDS)}, updated_time)
+    VALUES ({', '.join(['?'] * (len(RISK_METRIC_FIELDS) + 2))})
+"""
+
+
+def _compute_risk_chunk(rows, cutoffs):
+    """
+    计算一批基金的风险指标（在子进程中执行：解码与指标计算都不占用主进程）
+    rows: [(fund_code, net_worth_trend_blob, net_worth_trend_json), ...]，有 BLOB 时直接按数组计算
+    返回 (写入行列表, 跳过数, 错误信息列表)
+    """
+    updated_time = datetime.now().isoformat()
+    records = []
+    skipped = 0
+    errors = []
+    for fund_code, trend_blob, trend_json in rows:
+        try:
+            if trend_blob:
+                risk_metrics = calculate_risk_metrics_from_blob(trend_blob, cutoffs=cutoffs)
+            else:
+                net_worth_trend = json.loads(trend_json) if trend_json else []
+                risk_metrics = calculate_risk_metrics(net_worth_trend, cutoffs=cutoffs)
+        except Exception as e:
+            errors.append(f"{fund_code}: {e}")
+            skipped += 1
+            continue
+        if not risk_metrics:
+            skipped += 1
+            continue
+        records.append((fund_code, *(risk_metrics.get(field) for field in RISK_METRIC_FIELDS), updated_time))
+    return records, skipped, errors
+
+
+def recalculate_all_risk_metrics(workers=1, chunk_size=500):
     """
     重新计算所有基金的风险指标
-    基于 fund_trend 表中的净值数据
+    基于 fund_trend 表中的净值数据，按 chunk_size 分批流式读取，不一次性载入全部净值
+    workers > 1 时使用进程池并行解码与计算；结果用 executemany 批量写回，整体一个事务提交
     """
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
         return
     
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
     
     try:
         print("=" * 60)
-        print("开始重新计算风险指标...")
+        print(f"开始重新计算风险指标...（{'进程池 ' + str(workers) + ' 个进程' if executor else '单进程'}，每批 {chunk_size} 只）")
         print("=" * 60)
         
-        # 获取所有有净值数据的基金
-        cursor.execute("""
-            SELECT fund_code, net_worth_trend_json 
+        _ensure_nav_blob_column(read_cursor)
+        total = read_cursor.execute(
+            "SELECT COUNT(*) FROM fund_trend WHERE net_worth_trend_blob IS NOT NULL OR net_worth_trend_json IS NOT NULL"
+        ).fetchone()[0]
+        print(f"共有 {total} 只基金需要计算")
+        
+        # 所有批次共用同一组周期截止日期，保证结果一致
+        cutoffs = period_cutoffs()
+        read_cursor.execute("""
+            SELECT fund_code, net_worth_trend_blob, net_worth_trend_json 
             FROM fund_trend 
-            WHERE net_worth_trend_json IS NOT NULL
+            WHERE net_worth_trend_blob IS NOT NULL OR net_worth_trend_json IS NOT NULL
         """)
-        funds = cursor.fetchall()
-        
-        print(f"共有 {len(funds)} 只基金需要计算")
         
+        def read_chunks():
+            while True:
+                rows = read_cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        
+        def compute_results():
+            if executor is None:
+                for rows in read_chunks():
+                    yield len(rows), _compute_risk_chunk(rows, cutoffs)
+                return
+            # 最多保留 workers * 2 个在途批次，避免读取速度超过计算速度时占满内存
+            pending = deque()
+            for rows in read_chunks():
+                pending.append((len(rows), executor.submit(_compute_risk_chunk, rows, cutoffs)))
+                if len(pending) >= workers * 2:
+                    count, future = pending.popleft()
+                    yield count, future.result()
+            while pending:
+                count, future = pending.popleft()
+                yield count, future.result()
+        
+        processed = 0
         success_count = 0
         skip_count = 0
-        
-        for i, (fund_code, trend_json) in enumerate(funds, 1):
-            if i % 100 == 0:
-                print(f"进度: {i}/{len(funds)} ({i*100//len(funds)}%)")
-            
-            try:
-                net_worth_trend = json.loads(trend_json) if trend_json else []
-                if not net_worth_trend or len(net_worth_trend) < 30:
-                    skip_count += 1
-                    continue
-                
-                # 计算风险指标
-                risk_metrics = _calculate_risk_metrics(net_worth_trend)
-                if not risk_metrics:
-                    skip_count += 1
-                    continue
-                
-                # 更新数据库
-                cursor.execute("""
-                    INSERT OR REPLACE INTO fund_risk_metrics 
-                    (fund_code, max_drawdown_3m, max_drawdown_6m, max_drawdown_1y, max_drawdown_3y, max_drawdown_all,
-                     sharpe_ratio_1y, sharpe_ratio_3y, volatility_1y, volatility_3y,
-                     annual_return_1y, annual_return_3y, calmar_ratio_1y, calmar_ratio_3y, updated_time)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    fund_code,
-                    risk_metrics.get('max_drawdown_3m'),
-                    risk_metrics.get('max_drawdown_6m'),
-                    risk_metrics.get('max_drawdown_1y'),
-                    risk_metrics.get('max_drawdown_3y'),
-                    risk_metrics.get('max_drawdown_all'),
-                    risk_metrics.get('sharpe_ratio_1y'),
-                    risk_metrics.get('sharpe_ratio_3y'),
-                    risk_metrics.get('volatility_1y'),
-                    risk_metrics.get('volatility_3y'),
-                    risk_metrics.get('annual_return_1y'),
-                    risk_metrics.get('annual_return_3y'),
-                    risk_metrics.get('calmar_ratio_1y'),
-                    risk_metrics.get('calmar_ratio_3y'),
-                    datetime.now().isoformat()
-                ))
-                success_count += 1
-                
-            except Exception as e:
-                print(f"Error processing {fund_code}: {e}")
-                skip_count += 1
+        start_time = time.perf_counter()
+        
+        for count, (records, skipped, errors) in compute_results():
+            if records:
+                write_cursor.executemany(RISK_METRICS_UPSERT_SQL, records)
+            for error in errors:
+                print(f"Error processing {error}")
+            processed += count
+            success_count += len(records)
+            skip_count += skipped
+            elapsed = time.perf_counter() - start_time
+            print(f"进度: {processed}/{total} ({processed*100//max(total, 1)}%)，"
+                  f"{processed / elapsed if elapsed else 0:.0f} 只/秒")
         
         conn.commit()
+        elapsed = time.perf_counter() - start_time
         print("=" * 60)
         print(f"风险指标计算完成！成功: {success_count}, 跳过: {skip_count}")
+        print(f"耗时 {elapsed:.2f} 秒，吞吐 {processed / elapsed if elapsed else 0:.0f} 只/秒")
         
     except Exception as e:
         print(f"Error during recalculation: {str(e)}")
         conn.rollback()
     finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
         conn.close()
 
 
-def recalculate_all_rankings():
+def _ensure_nav_blob_column(cursor):
+    """旧数据库补充 fund_trend.net_worth_trend_blob 列"""
+    cursor.execute("PRAGMA table_info(fund_trend)")
+    if 'net_worth_trend_blob' not in [row[1] for row in cursor.fetchall()]:
+        print("Adding column net_worth_trend_blob to fund_trend...")
+        cursor.execute("ALTER TABLE fund_trend ADD COLUMN net_worth_trend_blob BLOB")
+
+
+def _ensure_return_columns(cursor, backfill=False):
     """
-    重新计算所有基金的同类型排名百分位和4433法则
+    旧数据库补充 fund_basic_info 的阶段收益列（同类排名 SQL 直接读取）及其索引，
+    新增列时（或 backfill=True）从 performance_json 回填，与 database.migrate_db 一致
+    """
+    cursor.execute("PRAGMA table_info(fund_basic_info)")
+    columns = [row[1] for row in cursor.fetchall()]
+    missing = [column for column in RETURN_COLUMNS if column not in columns]
+    for column in missing:
+        print(f"Adding column {column} to fund_basic_info...")
+        cursor.execute(f"ALTER TABLE fund_basic_info ADD COLUMN {column} FLOAT")
+    if missing or backfill:
+        cursor.execute("SELECT id, performance_json FROM fund_basic_info WHERE performance_json IS NOT NULL")
+        params = []
+        for row_id, performance_json in cursor.fetchall():
+            try:
+                performance = json.loads(performance_json) if performance_json else {}
+            except (json.JSONDecodeError, TypeError):
+                performance = {}
+            returns = parse_return_columns(performance)
+            params.append((*returns.values(), row_id))
+        assignments = ', '.join(f"{column} = ?" for column in RETURN_COLUMNS)
+        cursor.executemany(f"UPDATE fund_basic_info SET {assignments} WHERE id = ?", params)
+        print(f"Backfilled return columns for {len(params)} funds")
+    for column in RETURN_COLUMNS:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_fund_basic_type_{column} ON fund_basic_info (fund_type, {column})")
+
+
+def pack_nav_trends(chunk_size=500, vacuum=False):
+    """
+    离线迁移：将 fund_trend.net_worth_trend_json 转为列式二进制 BLOB（见 nav_codec.py），并清空原 JSON
+    每批单独提交，中断后重新执行只处理尚未转换的行；无法无损编码的行保留 JSON
+    vacuum=True 时最后执行 VACUUM 回收空间（需要与数据库同等大小的临时磁盘空间）
     """
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
         return
     
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
     
     try:
         print("=" * 60)
-        print("开始重新计算同类型排名...")
+        print("开始转换净值走势为二进制编码...")
         print("=" * 60)
         
-        # 获取所有基金类型
-        cursor.execute("""
-            SELECT DISTINCT fund_type FROM fund_basic_info 
-            WHERE fund_type IS NOT NULL AND fund_type != ''
-        """)
-        fund_types = [row[0] for row in cursor.fetchall()]
-        
-        print(f"发现 {len(fund_types)} 种基金类型")
-        
-        for fund_type in fund_types:
-            # 获取该类型的所有基金
-            cursor.execute("""
-                SELECT fund_code, performance_json 
-                FROM fund_basic_info 
-                WHERE fund_type = ? AND performance_json IS NOT NULL
-            """, (fund_type,))
-            funds = cursor.fetchall()
-            
-            if len(funds) < 2:
-                continue
-            
-            print(f"处理 {fund_type}: {len(funds)} 只基金")
-            
-            # 解析业绩数据
-            fund_performances = []
-            for fund_code, perf_json in funds:
+        _ensure_nav_blob_column(read_cursor)
+        conn.commit()
+        size_before = os.path.getsize(DB_PATH)
+        
+        # 先取出待转换的 id，避免边读边写同一张表
+        ids = [row[0] for row in read_cursor.execute(
+            "SELECT id FROM fund_trend WHERE net_worth_trend_blob IS NULL AND net_worth_trend_json IS NOT NULL"
+        ).fetchall()]
+        print(f"共有 {len(ids)} 条净值走势需要转换")
+        
+        packed = 0
+        kept = 0
+        json_bytes = 0
+        blob_bytes = 0
+        start_time = time.perf_counter()
+        for offset in range(0, len(ids), chunk_size):
+            batch_ids = ids[offset:offset + chunk_size]
+            placeholders = ','.join('?' * len(batch_ids))
+            rows = read_cursor.execute(
+                f"SELECT id, net_worth_trend_json FROM fund_trend WHERE id IN ({placeholders})", batch_ids
+            ).fetchall()
+            updates = []
+            for row_id, trend_json in rows:
                 try:
-                    perf = json.loads(perf_json) if perf_json else {}
-                    fund_performances.append({
-                        'fund_code': fund_code,
-                        'return_1m': perf.get('1_month_return'),
-                        'return_3m': perf.get('3_month_return'),
-                        'return_6m': perf.get('6_month_return'),
-                        'return_1y': perf.get('1_year_return'),
-                        'return_2y': perf.get('2_year_return'),
-                        'return_3y': perf.get('3_year_return'),
-                    })
-                except:
-                    pass
-            
-            # 计算排名
-            periods = [
-                ('return_1m', 'rank_pct_1m'),
-                ('return_3m', 'rank_pct_3m'),
-                ('return_6m', 'rank_pct_6m'),
-                ('return_1y', 'rank_pct_1y'),
-                ('return_2y', 'rank_pct_2y'),
-                ('return_3y', 'rank_pct_3y'),
-            ]
-            
-            fund_ranks = {fp['fund_code']: {} for fp in fund_performances}
-            
-            for return_field, rank_field in periods:
-                # 排除无效数据（None, 0, "0.00" 等）
-                def is_valid_return(val):
-                    if val is None:
-                        return False
-                    try:
-                        num_val = float(val)
-                        if abs(num_val) < 0.01:  # 接近0视为缺失数据
-                            return False
-                        return True
-                    except:
-                        return False
-                
-                funds_with_data = [(fp['fund_code'], float(fp[return_field])) for fp in fund_performances 
-                                   if is_valid_return(fp[return_field])]
-                
-                if len(funds_with_data) < 2:
+                    blob = encode_nav_series(json.loads(trend_json))
+                except (json.JSONDecodeError, TypeError):
+                    blob = None
+                if blob is None:
+                    kept += 1
                     continue
-                
-                # 按收益率降序排序
-                funds_with_data.sort(key=lambda x: x[1], reverse=True)
-                total = len(funds_with_data)
-                
-                # 计算排名百分位
-                for rank_idx, (fc, _) in enumerate(funds_with_data, 1):
-                    rank_pct = round((rank_idx / total) * 100, 2)
-                    fund_ranks[fc][rank_field] = rank_pct
-            
-            # 更新数据库
-            for fund_code, ranks in fund_ranks.items():
-                # 计算4433法则
-                pass_4433 = _check_4433_rule(
-                    ranks.get('rank_pct_1y'),
-                    ranks.get('rank_pct_2y'),
-                    ranks.get('rank_pct_3y'),
-                    None,
-                    ranks.get('rank_pct_6m'),
-                    ranks.get('rank_pct_3m')
+                json_bytes += len(trend_json.encode('utf-8'))
+                blob_bytes += len(blob)
+                updates.append((blob, row_id))
+            if updates:
+                write_cursor.executemany(
+                    "UPDATE fund_trend SET net_worth_trend_blob = ?, net_worth_trend_json = NULL WHERE id = ?",
+                    updates
                 )
-                
-                cursor.execute("""
-                    INSERT OR REPLACE INTO fund_screening_rank 
-                    (fund_code, rank_pct_1m, rank_pct_3m, rank_pct_6m, rank_pct_1y, rank_pct_2y, rank_pct_3y, pass_4433, updated_time)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    fund_code,
-                    ranks.get('rank_pct_1m'),
-                    ranks.get('rank_pct_3m'),
-                    ranks.get('rank_pct_6m'),
-                    ranks.get('rank_pct_1y'),
-                    ranks.get('rank_pct_2y'),
-                    ranks.get('rank_pct_3y'),
-                    1 if pass_4433 else 0,
-                    datetime.now().isoformat()
-                ))
-        
-        conn.commit()
-        
-        # 统计结果
-        cursor.execute("SELECT COUNT(*) FROM fund_screening_rank WHERE pass_4433 = 1")
-        pass_4433_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM fund_screening_rank")
-        total_count = cursor.fetchone()[0]
+            conn.commit()
+            packed += len(updates)
+            done = offset + len(batch_ids)
+            elapsed = time.perf_counter() - start_time
+            print(f"进度: {done}/{len(ids)} ({done*100//max(len(ids), 1)}%)，{done / elapsed if elapsed else 0:.0f} 条/秒")
         
         print("=" * 60)
-        print(f"排名计算完成！共 {total_count} 只基金，{pass_4433_count} 只通过4433法则")
+        print(f"转换完成！已转换: {packed}, 保留 JSON: {kept}")
+        if json_bytes:
+            print(f"净值走势数据: {json_bytes / 1024 / 1024:.1f} MB -> {blob_bytes / 1024 / 1024:.1f} MB "
+                  f"({blob_bytes * 100 / json_bytes:.1f}%)")
+        
+        if vacuum:
+            print("执行 VACUUM 回收空间...")
+            conn.execute("VACUUM")
+        print(f"数据库文件: {size_before / 1024 / 1024:.1f} MB -> {os.path.getsize(DB_PATH) / 1024 / 1024:.1f} MB")
         
     except Exception as e:
-        print(f"Error during ranking calculation: {str(e)}")
+        print(f"Error during packing: {str(e)}")
         conn.rollback()
     finally:
         conn.close()
 
 
-def _calculate_risk_metrics(net_worth_trend):
-    """计算基金风险指标（独立版本，用于批量计算）"""
-    if not net_worth_trend or len(net_worth_trend) < 30:
-        return None
-    
-    # 按日期排序
-    sorted_data = sorted(net_worth_trend, key=lambda x: x.get('date', ''))
-    
-    dates = []
-    values = []
-    for item in sorted_data:
-        if item.get('net_worth') is not None:
-            dates.append(item.get('date'))
-            values.append(float(item.get('net_worth')))
-    
-    # 过滤首日异常数据
-    if len(values) >= 2:
-        v0 = values[0]
-        v1 = values[1]
-        if v0 > 0 and abs((v1 - v0) / v0) > 0.5:
-            values.pop(0)
-            dates.pop(0)
-    
-    if len(values) < 30:
-        return None
-    
-    now = datetime.now()
-    
-    def get_period_data(months):
-        if months == 'all':
-            return values, dates
-        cutoff_date = (now - timedelta(days=months * 30)).strftime('%Y-%m-%d')
-        period_values = []
-        period_dates = []
-        for i, d in enumerate(dates):
-            if d >= cutoff_date:
-                period_values.append(values[i])
-                period_dates.append(d)
-        return period_values, period_dates
-    
-    def calc_max_drawdown(period_values):
-        if len(period_values) < 2:
-            return None
-        peak = period_values[0]
-        max_dd = 0
-        for value in period_values:
-            if value > peak:
-                peak = value
-            drawdown = (peak - value) / peak * 100
-            if drawdown > max_dd:
-                max_dd = drawdown
-        return round(max_dd, 2)
-    
-    def calc_daily_returns(period_values):
-        if len(period_values) < 2:
-            return []
-        returns = []
-        for i in range(1, len(period_values)):
-            if period_values[i-1] != 0:
-                ret = (period_values[i] - period_values[i-1]) / period_values[i-1]
-                returns.append(ret)
-        return returns
-    
-    def calc_annual_return(period_values, trading_days):
-        if len(period_values) < 2 or period_values[0] == 0 or trading_days <= 0:
-            return None
-        total_return = (period_values[-1] - period_values[0]) / period_values[0]
-        annual_return = ((1 + total_return) ** (252 / trading_days) - 1) * 100
-        return round(annual_return, 2)
-    
-    def calc_volatility(daily_returns):
-        if len(daily_returns) < 10:
-            return None
-        mean_return = sum(daily_returns) / len(daily_returns)
-        variance = sum((r - mean_return) ** 2 for r in daily_returns) / len(daily_returns)
-        daily_vol = math.sqrt(variance)
-        annual_vol = daily_vol * math.sqrt(252) * 100
-        return round(annual_vol, 2)
-    
-    def calc_sharpe_ratio(annual_return, volatility, risk_free_rate=2.0):
-        if volatility is None or volatility == 0 or annual_return is None:
-            return None
-        sharpe = (annual_return - risk_free_rate) / volatility
-        return round(sharpe, 2)
-    
-    result = {}
-    
-    # 计算不同时间段的最大回撤
-    for period, months in [('3m', 3), ('6m', 6), ('1y', 12), ('3y', 36), ('all', 'all')]:
-        period_values, _ = get_period_data(months)
-        result[f'max_drawdown_{period}'] = calc_max_drawdown(period_values)
+def _compressed_json_columns():
+    """models 中声明为 CompressedJSONText 的 (表名, 列名)"""
+    return [
+        (table.name, column.name)
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, CompressedJSONText)
+    ]
+
+
+def compress_json_columns(chunk_size=500, recompress=False, vacuum=False):
+    """
+    离线迁移：将 FundTrend / FundExtraData 的大 JSON 文本列按当前压缩配置（见 db_types.py）转为压缩 BLOB
+    默认只处理仍为 TEXT 的行，每批单独提交，中断后重新执行即可继续
+    recompress=True 时已压缩的行也解压后重新压缩（切换为 zstd 或更新共享字典后使用）
+    vacuum=True 时最后执行 VACUUM 回收空间
+    """
+    if not os.path.exists(DB_PATH):
+        print(f"Database not found at {DB_PATH}")
+        return
     
-    # 计算1年和3年的指标（需要足够的数据）
-    min_trading_days = {'1y': 200, '3y': 600}
+    conn = sqlite3.connect(DB_PATH)
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
     
-    for period, months in [('1y', 12), ('3y', 36)]:
-        period_values, period_dates = get_period_data(months)
-        trading_days = len(period_values)
-        
-        min_days = min_trading_days.get(period, 30)
-        if trading_days < min_days:
-            result[f'annual_return_{period}'] = None
-            result[f'volatility_{period}'] = None
-            result[f'sharpe_ratio_{period}'] = None
-            result[f'calmar_ratio_{period}'] = None
-            continue
+    try:
+        print("=" * 60)
+        print(f"开始压缩 JSON 大字段（{compression_method()}）...")
+        print("=" * 60)
         
-        daily_returns = calc_daily_returns(period_values)
-        annual_return = calc_annual_return(period_values, trading_days)
-        volatility = calc_volatility(daily_returns)
-        sharpe = calc_sharpe_ratio(annual_return, volatility)
-        
-        # 检查异常值
-        if volatility is not None and volatility > 500:
-            result[f'annual_return_{period}'] = None
-            result[f'volatility_{period}'] = None
-            result[f'sharpe_ratio_{period}'] = None
-            result[f'calmar_ratio_{period}'] = None
-            continue
+        size_before = os.path.getsize(DB_PATH)
+        raw_bytes = 0
+        stored_bytes = 0
+        start_time = time.perf_counter()
+        for table, column in _compressed_json_columns():
+            # 短文本不压缩，按字节长度过滤掉，避免每次重跑都扫描
+            condition = (f"{column} IS NOT NULL" if recompress
+                         else f"typeof({column}) = 'text' AND length(CAST({column} AS BLOB)) >= {MIN_COMPRESS_SIZE}")
+            ids = [row[0] for row in read_cursor.execute(f"SELECT id FROM {table} WHERE {condition}").fetchall()]
+            if not ids:
+                continue
+            
+            changed = 0
+            for offset in range(0, len(ids), chunk_size):
+                batch_ids = ids[offset:offset + chunk_size]
+                placeholders = ','.join('?' * len(batch_ids))
+                rows = read_cursor.execute(
+                    f"SELECT id, {column} FROM {table} WHERE id IN ({placeholders})", batch_ids
+                ).fetchall()
+                updates = []
+                for row_id, value in rows:
+                    text_value = decompress_value(value)
+                    stored = compress_text(text_value)
+                    raw_bytes += len(text_value.encode('utf-8'))
+                    stored_bytes += len(stored) if isinstance(stored, bytes) else len(stored.encode('utf-8'))
+                    if stored != value:
+                        updates.append((stored, row_id))
+                if updates:
+                    write_cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+                conn.commit()
+                changed += len(updates)
+            print(f"{table}.{column}: 处理 {len(ids)} 行，改写 {changed} 行")
         
-        result[f'annual_return_{period}'] = annual_return
-        result[f'volatility_{period}'] = volatility
-        result[f'sharpe_ratio_{period}'] = sharpe
+        print("=" * 60)
+        print(f"压缩完成！耗时 {time.perf_counter() - start_time:.1f} 秒")
+        if raw_bytes:
+            print(f"JSON 数据: {raw_bytes / 1024 / 1024:.1f} MB -> {stored_bytes / 1024 / 1024:.1f} MB "
+                  f"({stored_bytes * 100 / raw_bytes:.1f}%)")
         
-        max_dd = result.get(f'max_drawdown_{period}')
-        if annual_return is not None and max_dd is not None and max_dd > 0:
-            result[f'calmar_ratio_{period}'] = round(annual_return / max_dd, 2)
-        else:
-            result[f'calmar_ratio_{period}'] = None
-    
-    return result
+        if vacuum:
+            print("执行 VACUUM 回收空间...")
+            conn.execute("VACUUM")
+        print(f"数据库文件: {size_before / 1024 / 1024:.1f} MB -> {os.path.getsize(DB_PATH) / 1024 / 1024:.1f} MB")
+        
+    except Exception as e:
+        print(f"Error during compression: {str(e)}")
+        conn.rollback()
+    finally:
+        conn.close()
 
 
-def _check_4433_rule(rank_1y, rank_2y, rank_3y, rank_5y, rank_6m, rank_3m):
-    """检查是否符合4433法则"""
-    if rank_1y is None or rank_1y > 25:
-        return False
-    
-    long_term_available = [r for r in [rank_2y, rank_3y] if r is not None]
-    if long_term_available:
-        for rank in long_term_available:
-            if rank > 25:
-                return False
+def train_json_dictionary(samples_per_column=500):
+    """
+    从各压缩列抽样训练 zstd 共享字典，写入 JSON_ZSTD_DICT 指定的路径（需要安装 zstandard）
+    已有字典归档保留（见 db_types.save_zstd_dictionary），旧字典压缩的数据仍可读取
+    """
+    if not os.path.exists(DB_PATH):
+        print(f"Database not found at {DB_PATH}")
+        return
     
-    if rank_5y is not None and rank_5y > 25:
-        return False
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    try:
+        samples = []
+        for table, column in _compressed_json_columns():
+            cursor.execute(
+                f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY RANDOM() LIMIT ?",
+                (samples_per_column,)
+            )
+            samples.extend(decompress_value(row[0]) for row in cursor.fetchall())
+        print(f"共抽取 {len(samples)} 个样本")
+        
+        dictionary = train_zstd_dictionary(samples)
+        path = save_zstd_dictionary(dictionary)
+        print(f"字典已写入 {path}（{len(dictionary) / 1024:.1f} KB），旧字典已归档")
+        print("设置 JSON_COMPRESSION=zstd 后执行 compress-json recompress 使存量数据使用新字典")
+    except Exception as e:
+        print(f"Error training dictionary: {str(e)}")
+    finally:
+        conn.close()
+
+
+def recalculate_all_rankings():
+    """
+    重新计算所有基金的同类型排名百分位和4433法则
+    """
+    if not os.path.exists(DB_PATH):
+        print(f"Database not found at {DB_PATH}")
+        return
     
-    if rank_6m is None or rank_6m > 33.33:
-        return False
-    if rank_3m is None or rank_3m > 33.33:
-        return False
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
     
-    return True
+    try:
+        print("=" * 60)
+        print("开始重新计算同类型排名...")
+        print("=" * 60)
+        
+        # 排名 SQL 读取 return_* 列，尚未被新版应用打开过的数据库先补列并回填
+        _ensure_return_columns(cursor)
+        
+        # 窗口函数一次性完成全部类型的排名、4433判断与写入（与 app.py 共用同一条 SQL）
+        start_time = time.perf_counter()
+        cursor.execute(SAME_TYPE_RANKING_SQL, ranking_params())
+        print(f"已更新 {cursor.execute('SELECT changes()').fetchone()[0]} 只基金的排名，"
+              f"耗时 {time.perf_counter() - start_time:.2f} 秒")
+        
+        conn.commit()
+        
+        # 统计结果
+        cursor.execute("SELECT COUNT(*) FROM fund_screening_rank WHERE pass_4433 = 1")
+        pass_4433_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM fund_screening_rank")
+        total_count = cursor.fetchone()[0]
+        
+        print("=" * 60)
+        print(f"排名计算完成！共 {total_count} 只基金，{pass_4433_count} 只通过4433法则")
+        
+    except Exception as e:
+        print(f"Error during ranking calculation: {str(e)}")
+        conn.rollback()
+    finally:
+        conn.close()
 
 
 def print_data_stats():
@@ -656,8 +684,8 @@ def update_fund_types_from_cache():
         conn.close()
 
 
-def migrate_add_return_1y():
-    """添加 return_1y 字段到 fund_basic_info 表并更新现有数据"""
+def migrate_add_return_columns():
+    """添加 fund_basic_info 的阶段收益列（return_1m ~ return_3y）并从 performance_json 重新回填"""
     if not os.path.exists(DB_PATH):
         print(f"Database not found at {DB_PATH}")
         return
@@ -667,44 +695,12 @@ def migrate_add_return_1y():
     
     try:
         print("=" * 60)
-        print("添加 return_1y 字段并更新数据...")
+        print("添加阶段收益字段并更新数据...")
         print("=" * 60)
         
-        # 检查字段是否已存在
-        cursor.execute("PRAGMA table_info(fund_basic_info)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'return_1y' not in columns:
-            print("添加 return_1y 字段...")
-            cursor.execute("ALTER TABLE fund_basic_info ADD COLUMN return_1y FLOAT")
-        else:
-            print("return_1y 字段已存在")
-        
-        # 从 performance_json 中提取 1_year_return 并更新 return_1y
-        print("更新 return_1y 数据...")
-        cursor.execute("SELECT fund_code, performance_json FROM fund_basic_info WHERE performance_json IS NOT NULL")
-        rows = cursor.fetchall()
-        
-        updated = 0
-        for fund_code, perf_json in rows:
-            try:
-                perf = json.loads(perf_json) if perf_json else {}
-                return_1y = perf.get('1_year_return')
-                if return_1y is not None:
-                    try:
-                        return_1y_float = float(return_1y)
-                        cursor.execute(
-                            "UPDATE fund_basic_info SET return_1y = ? WHERE fund_code = ?",
-                            (return_1y_float, fund_code)
-                        )
-                        updated += 1
-                    except (ValueError, TypeError):
-                        pass
-            except json.JSONDecodeError:
-                pass
+        _ensure_return_columns(cursor, backfill=True)
         
         conn.commit()
-        print(f"已更新 {updated} 条记录的 return_1y 字段")
         print("迁移完成！")
         
     except Exception as e:
@@ -725,8 +721,19 @@ if __name__ == '__main__':
             clean_dirty_data()
         elif command == 'recalc-risk':
             recalculate_all_risk_metrics()
+        elif command == 'recalc-risk-parallel':
+            # 进程池并行重算，默认进程数为 CPU 核数
+            workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+            recalculate_all_risk_metrics(workers=workers)
         elif command == 'recalc-rank':
             recalculate_all_rankings()
+        elif command == 'pack-nav':
+            # 净值走势转为二进制编码；追加 vacuum 参数时回收磁盘空间
+            pack_nav_trends(vacuum='vacuum' in sys.argv[2:])
+        elif command == 'compress-json':
+            compress_json_columns(recompress='recompress' in sys.argv[2:], vacuum='vacuum' in sys.argv[2:])
+        elif command == 'train-zstd-dict':
+            train_json_dictionary()
         elif command == 'update-types':
             update_fund_types_from_cache()
         elif command == 'stats':
@@ -747,29 +754,37 @@ if __name__ == '__main__':
             recalculate_all_rankings()
             print_data_stats()
         elif command == 'add-return':
-            # 添加 return_1y 字段
-            migrate_add_return_1y()
+            # 添加阶段收益字段并回填
+            migrate_add_return_columns()
         else:
             print(f"未知命令: {command}")
             print("可用命令:")
             print("  migrate      - 执行数据库迁移")
             print("  clean        - 清理脏数据")
             print("  recalc-risk  - 重新计算风险指标")
+            print("  recalc-risk-parallel [进程数] - 多进程并行重新计算风险指标")
             print("  recalc-rank  - 重新计算排名")
+            print("  pack-nav [vacuum] - 净值走势转为二进制编码（可选回收空间）")
+            print("  compress-json [recompress] [vacuum] - 压缩走势/扩展数据 JSON 大字段")
+            print("  train-zstd-dict - 抽样训练 zstd 共享字典")
             print("  update-types - 从缓存更新基金类型")
             print("  stats        - 查看数据统计")
             print("  all          - 执行完整修复流程")
             print("  fix-rank     - 修复排名（更新类型+重算排名）")
-            print("  add-return   - 添加return_1y字段用于排序")
+            print("  add-return   - 添加并回填阶段收益字段（排名/排序使用）")
     else:
         # 默认执行迁移
         migrate_database()
         print("\n提示: 可使用以下命令执行其他操作:")
         print("  python migrate_db.py clean       - 清理脏数据")
         print("  python migrate_db.py recalc-risk - 重新计算风险指标")
+        print("  python migrate_db.py recalc-risk-parallel [进程数] - 多进程并行重算风险指标")
         print("  python migrate_db.py recalc-rank - 重新计算排名")
+        print("  python migrate_db.py pack-nav [vacuum] - 净值走势转为二进制编码")
+        print("  python migrate_db.py compress-json [recompress] [vacuum] - 压缩 JSON 大字段")
+        print("  python migrate_db.py train-zstd-dict - 训练 zstd 共享字典")
         print("  python migrate_db.py update-types- 从缓存更新基金类型")
         print("  python migrate_db.py stats       - 查看数据统计")
         print("  python migrate_db.py all         - 执行完整修复流程")
         print("  python migrate_db.py fix-rank    - 修复排名数据")
-        print("  python migrate_db.py add-return  - 添加return_1y字段")
+        print("  python migrate_db.py add-return  - 添加并回填阶段收益字段")
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, Float, Text, DateTime, Integer
+from sqlalchemy import Column, String, Float, Text, DateTime, Integer, Index, UniqueConstraint, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
+from db_types import CompressedJSONText
+
 Base = declarative_base()
 
 """
@@ -28,6 +30,11 @@ Base = declarative_base()
    - FundWatchlist: 自选基金
    - FundWatchlistGroup: 自选分组
 
+5. 任务数据表
+   - ScreeningJob: 筛选数据批量更新任务（断点续传）
+   - ScreeningJobItem: 任务明细（逐只基金的完成状态与失败原因）
+   - FundFetchState: 上游数据抓取状态（内容哈希、ETag），未变化时跳过清洗与写库
+
 使用方式：
 - 基金详情：FundBasicInfo + FundTrend + FundExtraData + FundRiskMetrics
 - 基金对比：同上
@@ -52,29 +59,47 @@ class FundBasicInfo(Base):
     current_rate = Column(Float)                     # 当前费率
     min_subscription_amount = Column(String(50))     # 最低申购金额
     is_hb = Column(String(10))                       # 是否货币基金
+    # 阶段收益率（%），由 performance_json 同步写入，供筛选/排名/排序直接读取
+    return_1m = Column(Float)                        # 近1月收益率
+    return_3m = Column(Float)                        # 近3月收益率
+    return_6m = Column(Float)                        # 近6月收益率
     return_1y = Column(Float)                        # 近1年收益率（用于排序）
+    return_2y = Column(Float)                        # 近2年收益率
+    return_3y = Column(Float)                        # 近3年收益率
     basic_json = Column(Text)                        # 完整基本信息JSON
     performance_json = Column(Text)                  # 业绩数据JSON (收益率)
     created_time = Column(DateTime, default=datetime.now)
     updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # 同类排名按类型分区、按收益排序；筛选页按类型过滤后按收益排序
+        Index('ix_fund_basic_type_return_1m', 'fund_type', 'return_1m'),
+        Index('ix_fund_basic_type_return_3m', 'fund_type', 'return_3m'),
+        Index('ix_fund_basic_type_return_6m', 'fund_type', 'return_6m'),
+        Index('ix_fund_basic_type_return_1y', 'fund_type', 'return_1y'),
+        Index('ix_fund_basic_type_return_2y', 'fund_type', 'return_2y'),
+        Index('ix_fund_basic_type_return_3y', 'fund_type', 'return_3y'),
+    )
+
 
 class FundTrend(Base):
     """
     基金走势数据表
     数据来源: pingzhongdata.js API
+    *_json 大字段透明压缩存储（见 db_types.py）
     """
     __tablename__ = 'fund_trend'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     fund_code = Column(String(6), unique=True, nullable=False, index=True)
-    net_worth_trend_json = Column(Text)              # 单位净值走势
-    accumulated_net_worth_json = Column(Text)        # 累计净值走势
-    position_trend_json = Column(Text)               # 仓位变动趋势
-    total_return_trend_json = Column(Text)           # 总收益率走势
-    ranking_trend_json = Column(Text)                # 同类排名走势
-    ranking_percentage_json = Column(Text)           # 排名百分位走势
-    scale_fluctuation_json = Column(Text)            # 规模变动数据
+    net_worth_trend_json = Column(Text)              # 单位净值走势（旧格式 JSON，已编码为 BLOB 的行置空）
+    net_worth_trend_blob = Column(LargeBinary)       # 单位净值走势（列式二进制编码，见 nav_codec.py）
+    accumulated_net_worth_json = Column(CompressedJSONText)    # 累计净值走势
+    position_trend_json = Column(CompressedJSONText)           # 仓位变动趋势
+    total_return_trend_json = Column(CompressedJSONText)       # 总收益率走势
+    ranking_trend_json = Column(CompressedJSONText)            # 同类排名走势
+    ranking_percentage_json = Column(CompressedJSONText)       # 排名百分位走势
+    scale_fluctuation_json = Column(CompressedJSONText)        # 规模变动数据
     updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
@@ -116,17 +141,18 @@ class FundExtraData(Base):
     """
     基金扩展数据表
     数据来源: pingzhongdata.js API
+    *_json 大字段透明压缩存储（见 db_types.py）
     """
     __tablename__ = 'fund_extra_data'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     fund_code = Column(String(6), unique=True, nullable=False, index=True)
-    holder_structure_json = Column(Text)         # 持有人结构
-    asset_allocation_json = Column(Text)         # 资产配置
-    performance_evaluation_json = Column(Text)   # 业绩评价
-    fund_managers_json = Column(Text)            # 基金经理信息
-    subscription_redemption_json = Column(Text)  # 申购赎回状态
-    same_type_funds_json = Column(Text)          # 同类型基金
+    holder_structure_json = Column(CompressedJSONText)         # 持有人结构
+    asset_allocation_json = Column(CompressedJSONText)         # 资产配置
+    performance_evaluation_json = Column(CompressedJSONText)   # 业绩评价
+    fund_managers_json = Column(CompressedJSONText)            # 基金经理信息
+    subscription_redemption_json = Column(CompressedJSONText)  # 申购赎回状态
+    same_type_funds_json = Column(CompressedJSONText)          # 同类型基金
     updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
@@ -195,6 +221,67 @@ class FundScreeningRank(Base):
     updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+# ==================== 任务数据表 ====================
+
+class ScreeningJob(Base):
+    """
+    筛选数据批量更新任务表
+    记录任务参数、游标位置与计数，进程重启或手动停止后可从断点继续
+    """
+    __tablename__ = 'screening_job'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String(20), default='running', index=True)  # running / stopped / interrupted / completed / failed
+    fund_types_json = Column(Text)                   # 任务参数：基金类型列表
+    fund_limit = Column(Integer)                     # 任务参数：数量限制
+    total = Column(Integer, default=0)               # 任务基金总数
+    cursor = Column(Integer, default=0)              # 已落库的最大任务位置（检查点）
+    success_count = Column(Integer, default=0)
+    fail_count = Column(Integer, default=0)
+    message = Column(String(200))
+    created_time = Column(DateTime, default=datetime.now)
+    updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_time = Column(DateTime)
+
+
+class ScreeningJobItem(Base):
+    """
+    筛选更新任务明细表
+    每只基金一行：pending 待处理 / success 已完成 / failed 失败（附失败原因）
+    """
+    __tablename__ = 'screening_job_item'
+    __table_args__ = (
+        UniqueConstraint('job_id', 'fund_code', name='uq_screening_job_item_job_fund'),
+        Index('ix_screening_job_item_job_status', 'job_id', 'status', 'position'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)       # 在任务中的顺序
+    fund_code = Column(String(6), nullable=False)
+    status = Column(String(10), default='pending')
+    error = Column(String(200))                      # 最近一次失败原因
+    attempts = Column(Integer, default=0)            # 尝试次数
+    updated_time = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class FundFetchState(Base):
+    """
+    上游数据抓取状态表
+    记录每只基金 pingzhongdata 的内容哈希与 ETag / Last-Modified，
+    再次抓取时内容未变化则跳过清洗、写库与风险指标计算
+    """
+    __tablename__ = 'fund_fetch_state'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fund_code = Column(String(6), unique=True, nullable=False, index=True)
+    content_hash = Column(String(64))                # 内容哈希（sha256，忽略生成时间注释）
+    etag = Column(String(200))                       # 上游返回的 ETag
+    last_modified = Column(String(100))              # 上游返回的 Last-Modified
+    checked_time = Column(DateTime, default=datetime.now)   # 最近一次抓取时间
+    changed_time = Column(DateTime, default=datetime.now)   # 最近一次内容变化时间
+
+
 # ==================== 用户数据表 ====================
 
 class FundWatchlistGroup(Base):
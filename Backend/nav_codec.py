@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+净值走势二进制编码
+将 [{'date': 'YYYY-MM-DD', 'net_worth': 1.0, 'equity_return': 0.68, 'dividend': ''}, ...]
+编码为列式 BLOB，替代重复键名的 JSON：
+- 日期：int32 天数（1970-01-01 起），差分编码（首项为绝对天数）
+- 单位净值：float64；日涨幅：float32（可无损还原到 4 位小数时）否则 float64；None 以 NaN 表示
+- 分红：绝大多数为空字符串，只稀疏保存非空项 {下标: 文本}
+- 负载可选 zlib 压缩；未压缩时数值数组直接 numpy.frombuffer 零拷贝读取
+
+BLOB 布局（小端）:
+    头部 16 字节: magic 'NAV1' | version u8 | flags u8 | reserved u16 | count u32 | dividend_len u32
+    负载: net_worth f64[count] | equity_return f32/f64[count] | day_delta i32[count] | dividend JSON
+无法无损表示的序列（非标准日期、额外字段、非数值净值等）编码返回 None，由调用方继续保存 JSON
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+MAGIC = b'NAV1'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+
+FLAG_ZLIB = 0x01
+FLAG_EQUITY_F32 = 0x02
+
+DEFAULT_COMPRESS = True
+ZLIB_LEVEL = 6
+
+# float32 日涨幅还原时保留的小数位（上游数据为 2 位小数）
+EQUITY_DECIMALS = 4
+
+NAV_KEYS = frozenset(('date', 'net_worth', 'equity_return', 'dividend'))
+
+# 无分红时的 JSON 文本
+EMPTY_DIVIDEND = '""'
+
+
+class NavArrays(NamedTuple):
+    """解码后的列式净值数据；net_worth / equity_return 在未压缩时是 BLOB 的只读视图"""
+    days: np.ndarray            # int32，1970-01-01 起的天数
+    net_worth: np.ndarray       # float64，缺失为 NaN
+    equity_return: np.ndarray   # float32 或 float64，缺失为 NaN
+    dividends: Dict[int, Any]   # 下标 -> 分红文本（仅非空项）
+
+    def date_strings(self) -> np.ndarray:
+        """日期数组（'YYYY-MM-DD' 字符串），可直接用于 searchsorted 与字符串比较"""
+        return np.datetime_as_string(self.days.astype('datetime64[D]'), unit='D')
+
+
+def is_nav_blob(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+def _is_number_column(values) -> bool:
+    """整列均为数值或 None（按出现过的类型判断，避免逐项 isinstance）"""
+    return all(
+        value_type is type(None) or (issubclass(value_type, (int, float)) and not issubclass(value_type, bool))
+        for value_type in set(map(type, values))
+    )
+
+
+def encode_nav_series(series: List[Dict[str, Any]], compress: bool = DEFAULT_COMPRESS) -> Optional[bytes]:
+    """编码净值走势；无法无损表示时返回 None"""
+    if not isinstance(series, list) or not all(isinstance(item, dict) and item.keys() == NAV_KEYS for item in series):
+        return None
+    dates = [item['date'] for item in series]
+    net_worth = [item['net_worth'] for item in series]
+    equity = [item['equity_return'] for item in series]
+    if not all(isinstance(date, str) and len(date) == 10 for date in dates):
+        return None
+    if not _is_number_column(net_worth) or not _is_number_column(equity):
+        return None
+    dividends = {index: item['dividend'] for index, item in enumerate(series) if item['dividend'] != ''}
+
+    try:
+        day_values = np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        return None
+    if len(dates) and not np.array_equal(np.datetime_as_string(day_values, unit='D'), np.array(dates)):
+        return None
+    days = day_values.astype(np.int64)
+    if len(days) and (days.min() < np.iinfo(np.int32).min or days.max() > np.iinfo(np.int32).max):
+        return None
+    day_deltas = np.diff(days, prepend=0).astype('<i4')
+
+    nav_array = np.array(net_worth, dtype='<f8')
+    equity_array = np.array(equity, dtype='<f8')
+    flags = 0
+    equity_f32 = equity_array.astype('<f4')
+    restored = np.round(equity_f32.astype('<f8'), EQUITY_DECIMALS)
+    if np.array_equal(restored, equity_array, equal_nan=True):
+        equity_array = equity_f32
+        flags |= FLAG_EQUITY_F32
+
+    dividend_bytes = json.dumps(dividends, ensure_ascii=False, separators=(',', ':')).encode('utf-8') if dividends else b''
+    payload = b''.join((nav_array.tobytes(), equity_array.tobytes(), day_deltas.tobytes(), dividend_bytes))
+    if compress:
+        payload = zlib.compress(payload, ZLIB_LEVEL)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, 0, len(series), len(dividend_bytes)) + payload
+
+
+def decode_nav_arrays(blob) -> NavArrays:
+    """解码为列式数组（不构造逐点字典），适合指标计算与回测"""
+    buffer = memoryview(blob)
+    magic, version, flags, _, count, dividend_len = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a NAV series blob')
+    payload = buffer[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+
+    equity_dtype = np.dtype('<f4') if flags & FLAG_EQUITY_F32 else np.dtype('<f8')
+    offset = 0
+    net_worth = np.frombuffer(payload, dtype='<f8', count=count, offset=offset)
+    offset += 8 * count
+    equity_return = np.frombuffer(payload, dtype=equity_dtype, count=count, offset=offset)
+    offset += equity_dtype.itemsize * count
+    day_deltas = np.frombuffer(payload, dtype='<i4', count=count, offset=offset)
+    offset += 4 * count
+    days = np.cumsum(day_deltas, dtype=np.int32)
+
+    dividends = {}
+    if dividend_len:
+        raw = json.loads(bytes(payload[offset:offset + dividend_len]).decode('utf-8'))
+        dividends = {int(index): value for index, value in raw.items()}
+    return NavArrays(days, net_worth, equity_return, dividends)
+
+
+def _to_list(values: np.ndarray, decimals: Optional[int] = None) -> list:
+    values = values.astype(np.float64)
+    missing = np.isnan(values)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    result = values.tolist()
+    if missing.any():
+        for index in np.flatnonzero(missing).tolist():
+            result[index] = None
+    return result
+
+
+def decode_nav_series(blob) -> List[Dict[str, Any]]:
+    """解码为与原 JSON 相同结构的逐点字典列表（用于接口返回）"""
+    arrays = decode_nav_arrays(blob)
+    dates = arrays.date_strings().tolist()
+    net_worth = _to_list(arrays.net_worth)
+    equity_decimals = EQUITY_DECIMALS if arrays.equity_return.dtype.itemsize == 4 else None
+    equity_return = _to_list(arrays.equity_return, equity_decimals)
+    dividends = arrays.dividends
+    return [
+        {'date': date, 'net_worth': nav, 'equity_return': equity, 'dividend': dividends.get(index, '')}
+        for index, (date, nav, equity) in enumerate(zip(dates, net_worth, equity_return))
+    ]
+
+
+def _json_numbers(values: np.ndarray, decimals: Optional[int] = None) -> Optional[list]:
+    """数值数组 -> JSON 数字文本列表（与 json.dumps(float) 一致），含无穷值时返回 None"""
+    values = values.astype(np.float64)
+    if np.isinf(values).any():
+        return None
+    missing = np.isnan(values)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    result = list(map(float.__repr__, values.tolist()))
+    if missing.any():
+        for index in np.flatnonzero(missing).tolist():
+            result[index] = 'null'
+    return result
+
+
+def decode_nav_json(blob) -> str:
+    """
+    直接解码为 JSON 文本，结果与 json.dumps(decode_nav_series(blob), ensure_ascii=False) 相同
+    不构造逐点字典，用于接口响应
+    """
+    arrays = decode_nav_arrays(blob)
+    equity_decimals = EQUITY_DECIMALS if arrays.equity_return.dtype.itemsize == 4 else None
+    net_worth = _json_numbers(arrays.net_worth)
+    equity_return = _json_numbers(arrays.equity_return, equity_decimals)
+    if net_worth is None or equity_return is None:
+        return json.dumps(decode_nav_series(blob), ensure_ascii=False)
+    dates = arrays.date_strings().tolist()
+    dividends = {index: json.dumps(value, ensure_ascii=False) for index, value in arrays.dividends.items()}
+    items = [
+        f'{{"date": "{date}", "net_worth": {nav}, "equity_return": {equity}, "dividend": {dividends.get(index, EMPTY_DIVIDEND)}}}'
+        for index, (date, nav, equity) in enumerate(zip(dates, net_worth, equity_return))
+    ]
+    return '[' + ', '.join(items) + ']'
+
+
+def benchmark(sample: List[Dict[str, Any]], rounds: int = 200) -> Dict[str, Any]:
+    """对比 JSON 与二进制编码的体积和读取耗时"""
+    import time
+
+    json_text = json.dumps(sample, ensure_ascii=False)
+    raw_blob = encode_nav_series(sample, compress=False)
+    zlib_blob = encode_nav_series(sample, compress=True)
+
+    def timeit(fn):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - start) / rounds * 1e6
+
+    return {
+        'points': len(sample),
+        'json_bytes': len(json_text.encode('utf-8')),
+        'blob_bytes': len(raw_blob),
+        'blob_zlib_bytes': len(zlib_blob),
+        'json_loads_us': round(timeit(lambda: json.loads(json_text)), 1),
+        'arrays_us': round(timeit(lambda: decode_nav_arrays(raw_blob)), 1),
+        'arrays_zlib_us': round(timeit(lambda: decode_nav_arrays(zlib_blob)), 1),
+        'series_zlib_us': round(timeit(lambda: decode_nav_series(zlib_blob)), 1),
+        'series_dumps_us': round(timeit(lambda: json.dumps(decode_nav_series(zlib_blob), ensure_ascii=False)), 1),
+        'json_zlib_us': round(timeit(lambda: decode_nav_json(zlib_blob)), 1),
+        'identical': decode_nav_series(zlib_blob) == sample and decode_nav_series(raw_blob) == sample,
+        'json_identical': decode_nav_json(zlib_blob) == json.dumps(decode_nav_series(zlib_blob), ensure_ascii=False),
+    }
+
+
+if __name__ == '__main__':
+    from datetime import date, timedelta
+
+    rng = np.random.default_rng(1)
+    start = date(2015, 1, 5)
+    sample = []
+    nav = 1.0
+    for i in range(2500):
+        change = round(float(rng.normal(0.03, 1.2)), 2)
+        nav = round(nav * (1 + change / 100), 4)
+        sample.append({
+            'date': (start + timedelta(days=i * 7 // 5)).isoformat(),
+            'net_worth': nav,
+            'equity_return': change,
+            'dividend': '每份派现金0.0500元' if i % 250 == 249 else '',
+        })
+    result = benchmark(sample)
+    print(f"净值点: {result['points']}")
+    print(f"JSON: {result['json_bytes']} 字节, json.loads {result['json_loads_us']} µs")
+    print(f"BLOB: {result['blob_bytes']} 字节, 读取数组 {result['arrays_us']} µs")
+    print(f"BLOB(zlib): {result['blob_zlib_bytes']} 字节, 读取数组 {result['arrays_zlib_us']} µs, "
+          f"还原字典列表 {result['series_zlib_us']} µs")
+    print(f"直接生成 JSON 文本 {result['json_zlib_us']} µs（还原字典列表再 json.dumps {result['series_dumps_us']} µs）")
+    print(f"还原一致: {result['identical']}, JSON 文本一致: {result['json_identical']}")
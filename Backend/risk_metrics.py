@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+基金风险指标计算（NumPy 向量化）
+app.py 与 migrate_db.py 共用，指标口径与原逐点循环版本完全一致：
+- 净值序列只排序、转换一次，日期按字符串有序数组保存，各周期起点用 searchsorted 一次定位
+- 日收益率对全序列计算一次，各周期直接切片复用
+- 批量接口共享同一组周期截止日期，适合全库重算
+- BLOB 输入（calculate_risk_metrics_from_blob）日期保持为整数天数，不构造逐点字典与日期字符串，全库重算走此路径
+与旧版实现的一致性校验与基准测试见 bench_risk_metrics.py
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+from nav_codec import NavArrays, decode_nav_arrays
+
+# 计算风险指标所需的最少净值点数
+MIN_POINTS = 30
+
+# 最大回撤的统计周期（月数，None 表示全部）
+DRAWDOWN_PERIODS = (('3m', 3), ('6m', 6), ('1y', 12), ('3y', 36), ('all', None))
+
+# 年化收益率/波动率/夏普/卡玛的统计周期，以及各周期要求的最少交易日
+# 数据不足的周期不计算（返回 None），避免年化放大产生误导性数据
+RETURN_PERIODS = (('1y', 12, 200), ('3y', 36, 600))
+
+# 年化波动率超过该值视为数据异常，放弃该周期的计算结果
+MAX_VOLATILITY = 500
+
+RISK_FREE_RATE = 2.0
+TRADING_DAYS_PER_YEAR = 252
+
+RISK_METRIC_FIELDS = (
+    'max_drawdown_3m', 'max_drawdown_6m', 'max_drawdown_1y', 'max_drawdown_3y', 'max_drawdown_all',
+    'sharpe_ratio_1y', 'sharpe_ratio_3y', 'volatility_1y', 'volatility_3y',
+    'annual_return_1y', 'annual_return_3y', 'calmar_ratio_1y', 'calmar_ratio_3y',
+)
+
+
+def period_cutoffs(now: Optional[datetime] = None) -> Dict[str, Optional[str]]:
+    """各周期的起始日期（'YYYY-MM-DD'，按 30 天/月折算），批量计算时只需生成一次"""
+    now = now or datetime.now()
+    months_by_period = dict((period, months) for period, months in DRAWDOWN_PERIODS)
+    months_by_period.update((period, months) for period, months, _ in RETURN_PERIODS)
+    return {
+        period: None if months is None else (now - timedelta(days=months * 30)).strftime('%Y-%m-%d')
+        for period, months in months_by_period.items()
+    }
+
+
+def prepare_series(net_worth_trend) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    将净值走势 [{'date': '2024-01-01', 'net_worth': 1.0}, ...] 转为 (日期数组, 净值数组)
+    按日期排序、去掉空净值，并过滤首日异常数据（如面值 1.0 与实际净值 100+ 差异巨大）
+    数据不足 MIN_POINTS 个点时返回 None
+    """
+    if not net_worth_trend or len(net_worth_trend) < MIN_POINTS:
+        return None
+
+    # 稳定排序，与 sorted(key=date) 的结果顺序一致；空净值转为 NaN 后剔除
+    dates = np.array([item.get('date', '') for item in net_worth_trend])
+    values = np.array([item.get('net_worth') for item in net_worth_trend], dtype=np.float64)
+    order = np.argsort(dates, kind='stable')
+    order = order[~np.isnan(values[order])]
+    return _finish_series(dates[order], values[order])
+
+
+def prepare_nav_arrays(arrays: NavArrays) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    从 nav_codec 解码出的列式数据准备序列，不经过逐点字典；口径与 prepare_series 一致
+    日期保持为整数天数（不生成日期字符串），compute_metrics 按天数定位周期起点
+    """
+    if len(arrays.net_worth) < MIN_POINTS:
+        return None
+    days = arrays.days
+    if len(days) > 1 and np.any(days[1:] < days[:-1]):
+        order = np.argsort(days, kind='stable')
+    else:
+        order = np.arange(len(days))
+    order = order[~np.isnan(arrays.net_worth[order])]
+    dates = arrays.days[order]
+    values = arrays.net_worth[order].astype(np.float64)
+    return _finish_series(dates, values)
+
+
+def _finish_series(dates: np.ndarray, values: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    # 首日异常数据会导致波动率和回撤计算极其离谱
+    if len(values) >= 2:
+        v0, v1 = float(values[0]), float(values[1])
+        if v0 > 0 and abs((v1 - v0) / v0) > 0.5:
+            dates = dates[1:]
+            values = values[1:]
+
+    if len(values) < MIN_POINTS:
+        return None
+    return dates, values
+
+
+def _max_drawdown(values: np.ndarray) -> Optional[float]:
+    if len(values) < 2:
+        return None
+    peaks = np.maximum.accumulate(values)
+    max_dd = float(((peaks - values) / peaks * 100).max())
+    return round(max(max_dd, 0), 2)
+
+
+def _volatility(daily_returns: np.ndarray) -> Optional[float]:
+    if len(daily_returns) < 10:
+        return None
+    mean_return = daily_returns.sum() / len(daily_returns)
+    variance = float(((daily_returns - mean_return) ** 2).sum() / len(daily_returns))
+    return round(math.sqrt(variance) * math.sqrt(TRADING_DAYS_PER_YEAR) * 100, 2)
+
+
+def _annual_return(start_value: float, end_value: float, trading_days: int) -> Optional[float]:
+    if trading_days < 2 or start_value == 0:
+        return None
+    total_return = (end_value - start_value) / start_value
+    return round(((1 + total_return) ** (TRADING_DAYS_PER_YEAR / trading_days) - 1) * 100, 2)
+
+
+def compute_metrics(dates: np.ndarray, values: np.ndarray,
+                    cutoffs: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Optional[float]]:
+    """
+    基于已排序的日期/净值数组一次性计算全部周期的指标
+    dates 为 'YYYY-MM-DD' 字符串数组或 1970-01-01 起的整数天数数组
+    cutoffs 由 period_cutoffs() 生成，批量计算时复用
+    """
+    cutoffs = cutoffs or period_cutoffs()
+    n = len(values)
+    periods = list(cutoffs.keys())
+    bounded = [period for period in periods if cutoffs[period] is not None]
+    starts = dict.fromkeys(periods, 0)
+    if bounded:
+        keys = [cutoffs[period] for period in bounded]
+        if np.issubdtype(dates.dtype, np.integer):
+            keys = np.array(keys, dtype='datetime64[D]').astype(np.int64)
+        positions = np.searchsorted(dates, keys, side='left')
+        starts.update(zip(bounded, (int(pos) for pos in positions)))
+
+    result: Dict[str, Optional[float]] = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for period, _ in DRAWDOWN_PERIODS:
+            result[f'max_drawdown_{period}'] = _max_drawdown(values[starts[period]:])
+
+        # 日收益率对全序列只算一次：returns[i] 对应 values[i] -> values[i + 1]，前一日净值为 0 的点剔除
+        prev_values = values[:-1]
+        valid = prev_values != 0
+        returns = (values[1:] - prev_values) / np.where(valid, prev_values, 1.0)
+
+        for period, _, min_days in RETURN_PERIODS:
+            start = starts[period]
+            trading_days = n - start
+            annual_return = volatility = sharpe = calmar = None
+            if trading_days >= min_days:
+                annual_return = _annual_return(float(values[start]), float(values[-1]), trading_days)
+                volatility = _volatility(returns[start:][valid[start:]])
+                if volatility is not None and volatility > MAX_VOLATILITY:
+                    annual_return = volatility = None
+                else:
+                    if volatility and annual_return is not None:
+                        sharpe = round((annual_return - RISK_FREE_RATE) / volatility, 2)
+                    max_dd = result.get(f'max_drawdown_{period}')
+                    if annual_return is not None and max_dd is not None and max_dd > 0:
+                        calmar = round(annual_return / max_dd, 2)
+            result[f'annual_return_{period}'] = annual_return
+            result[f'volatility_{period}'] = volatility
+            result[f'sharpe_ratio_{period}'] = sharpe
+            result[f'calmar_ratio_{period}'] = calmar
+
+    return result
+
+
+def calculate_risk_metrics(net_worth_trend, now: Optional[datetime] = None,
+                           cutoffs: Optional[Dict[str, Optional[str]]] = None) -> Optional[Dict[str, Optional[float]]]:
+    """
+    计算基金风险指标：最大回撤、夏普比率、年化波动率、年化收益率、卡玛比率
+    net_worth_trend: [{'date': '2024-01-01', 'net_worth': 1.0}, ...]
+    数据不足时返回 None
+    """
+    series = prepare_series(net_worth_trend)
+    if series is None:
+        return None
+    return compute_metrics(series[0], series[1], cutoffs or period_cutoffs(now))
+
+
+def calculate_risk_metrics_from_blob(blob, now: Optional[datetime] = None,
+                                     cutoffs: Optional[Dict[str, Optional[str]]] = None) -> Optional[Dict[str, Optional[float]]]:
+    """直接基于净值走势 BLOB（nav_codec 编码）计算风险指标"""
+    series = prepare_nav_arrays(decode_nav_arrays(blob))
+    if series is None:
+        return None
+    return compute_metrics(series[0], series[1], cutoffs or period_cutoffs(now))
+
+
+def calculate_risk_metrics_batch(trends: Union[Dict[str, Any], Iterable[Tuple[str, Any]]],
+                                 now: Optional[datetime] = None) -> Dict[str, Optional[Dict[str, Optional[float]]]]:
+    """
+    批量计算风险指标
+    trends: {fund_code: net_worth_trend} 或 [(fund_code, net_worth_trend), ...]
+    返回 {fund_code: 指标字典或 None}；单只基金数据异常不影响其他基金
+    """
+    cutoffs = period_cutoffs(now)
+    items = trends.items() if isinstance(trends, dict) else trends
+    results = {}
+    for fund_code, trend in items:
+        try:
+            results[fund_code] = calculate_risk_metrics(trend, cutoffs=cutoffs)
+        except Exception as e:
+            print(f"[风险指标] {fund_code} 计算失败: {e}")
+            results[fund_code] = None
+    return results
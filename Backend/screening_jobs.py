@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+筛选数据批量更新任务持久化
+任务参数、检查点游标与逐只基金的完成状态都写入数据库：
+- 进程重启后，未结束的任务标记为 interrupted，可从断点继续
+- 手动停止后再次启动同参数任务，只处理尚未完成的基金
+- 支持只重试失败的基金
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.orm import Session
+
+from models import ScreeningJob, ScreeningJobItem
+
+# 可以继续执行的任务状态
+RESUMABLE_STATUSES = ('stopped', 'interrupted', 'failed')
+
+
+def recover_interrupted_jobs(db: Session) -> int:
+    """服务启动时调用：将上次进程遗留的 running 任务标记为 interrupted"""
+    count = db.query(ScreeningJob).filter(ScreeningJob.status == 'running').update(
+        {'status': 'interrupted', 'message': '服务重启，任务中断，可从断点继续'},
+        synchronize_session=False
+    )
+    db.commit()
+    return count
+
+
+def create_job(db: Session, fund_codes: List[str], fund_types=None, limit=None) -> ScreeningJob:
+    """创建新任务并写入全部待处理明细"""
+    job = ScreeningJob(
+        status='running',
+        fund_types_json=json.dumps(sorted(fund_types or []), ensure_ascii=False),
+        fund_limit=limit,
+        total=len(fund_codes),
+        message='任务已创建'
+    )
+    db.add(job)
+    db.flush()
+
+    # 去重并保持原有顺序
+    seen = set()
+    rows = []
+    for fund_code in fund_codes:
+        if not fund_code or fund_code in seen:
+            continue
+        seen.add(fund_code)
+        rows.append({'job_id': job.id, 'position': len(rows), 'fund_code': fund_code, 'status': 'pending'})
+    job.total = len(rows)
+    if rows:
+        db.execute(insert(ScreeningJobItem), rows)
+    db.commit()
+    return job
+
+
+def find_resumable_job(db: Session, fund_types=None, limit=None) -> Optional[ScreeningJob]:
+    """查找参数相同、尚有待处理基金的最近一次未完成任务"""
+    job = db.query(ScreeningJob).filter(
+        ScreeningJob.status.in_(RESUMABLE_STATUSES)
+    ).order_by(ScreeningJob.id.desc()).first()
+    if not job:
+        return None
+    if job.fund_types_json != json.dumps(sorted(fund_types or []), ensure_ascii=False) or job.fund_limit != limit:
+        return None
+    if count_items(db, job.id, 'pending') == 0:
+        return None
+    return job
+
+
+def get_latest_job(db: Session) -> Optional[ScreeningJob]:
+    return db.query(ScreeningJob).order_by(ScreeningJob.id.desc()).first()
+
+
+def reset_failed_items(db: Session, job: ScreeningJob) -> int:
+    """将任务中失败的基金重置为待处理，用于只重试失败项"""
+    count = db.query(ScreeningJobItem).filter(
+        ScreeningJobItem.job_id == job.id,
+        ScreeningJobItem.status == 'failed'
+    ).update({'status': 'pending'}, synchronize_session=False)
+    job.fail_count = max(0, (job.fail_count or 0) - count)
+    db.commit()
+    return count
+
+
+def start_job(db: Session, job: ScreeningJob, message: str = '任务运行中'):
+    job.status = 'running'
+    job.message = message
+    job.finished_time = None
+    db.commit()
+
+
+def get_pending_items(db: Session, job_id: int) -> List[Tuple[int, int, str]]:
+    """按任务顺序返回待处理明细 [(item_id, position, fund_code), ...]"""
+    return db.query(
+        ScreeningJobItem.id, ScreeningJobItem.position, ScreeningJobItem.fund_code
+    ).filter(
+        ScreeningJobItem.job_id == job_id,
+        ScreeningJobItem.status == 'pending'
+    ).order_by(ScreeningJobItem.position).all()
+
+
+def count_items(db: Session, job_id: int, status: str) -> int:
+    return db.query(func.count(ScreeningJobItem.id)).filter(
+        ScreeningJobItem.job_id == job_id,
+        ScreeningJobItem.status == status
+    ).scalar() or 0
+
+
+def record_results(db: Session, job: ScreeningJob, results, item_index: Dict[str, Tuple[int, int]]):
+    """
+    记录一批抓取结果（不提交，由调用方与基金数据在同一事务中提交）
+    item_index: fund_code -> (item_id, position)
+    """
+    now = datetime.now()
+    rows = []
+    cursor = job.cursor or 0
+    for result in results:
+        item_id, position = item_index[result.fund_code]
+        rows.append({
+            'b_id': item_id,
+            'b_status': 'success' if result.ok else 'failed',
+            'b_error': None if result.ok else (result.error or '')[:200],
+            'b_time': now,
+        })
+        cursor = max(cursor, position + 1)
+        if result.ok:
+            job.success_count = (job.success_count or 0) + 1
+        else:
+            job.fail_count = (job.fail_count or 0) + 1
+
+    if rows:
+        table = ScreeningJobItem.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam('b_id')).values(
+                status=bindparam('b_status'),
+                error=bindparam('b_error'),
+                attempts=table.c.attempts + 1,
+                updated_time=bindparam('b_time'),
+            ),
+            rows
+        )
+    job.cursor = cursor
+    job.updated_time = now
+
+
+def finish_job(db: Session, job: ScreeningJob, status: str, message: str):
+    job.status = status
+    job.message = message[:200]
+    job.finished_time = datetime.now()
+    db.commit()
+
+
+def job_summary(db: Session, job: Optional[ScreeningJob]) -> Optional[dict]:
+    """任务概要（用于状态接口）"""
+    if not job:
+        return None
+    pending = count_items(db, job.id, 'pending')
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'fund_types': json.loads(job.fund_types_json) if job.fund_types_json else [],
+        'limit': job.fund_limit,
+        'total': job.total,
+        'cursor': job.cursor,
+        'success_count': job.success_count,
+        'fail_count': job.fail_count,
+        'pending_count': pending,
+        'resumable': job.status in RESUMABLE_STATUSES and pending > 0,
+        'message': job.message,
+        'created_time': job.created_time.isoformat() if job.created_time else None,
+        'finished_time': job.finished_time.isoformat() if job.finished_time else None,
+    }
+
+
+def get_failed_items(db: Session, job_id: int, limit: int = 200) -> List[dict]:
+    items = db.query(ScreeningJobItem).filter(
+        ScreeningJobItem.job_id == job_id,
+        ScreeningJobItem.status == 'failed'
+    ).order_by(ScreeningJobItem.position).limit(limit).all()
+    return [{
+        'fund_code': item.fund_code,
+        'error': item.error,
+        'attempts': item.attempts,
+        'updated_time': item.updated_time.isoformat() if item.updated_time else None,
+    } for item in items]
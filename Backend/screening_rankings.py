@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+同类型排名与4433法则（集合式 SQL 计算）
+一条语句完成：按基金类型分区的窗口函数排名 → 4433 判断 → 批量 upsert 到 fund_screening_rank
+收益率直接读取 fund_basic_info 的 return_* 列（带 (fund_type, return_*) 索引），不再逐行解析 performance_json
+app.py（SQLAlchemy）与 migrate_db.py（sqlite3）共用同一条 SQL，参数均为 :now
+需要 SQLite >= 3.25（窗口函数）
+"""
+
+from datetime import datetime
+
+# 排名周期 -> performance_json 中的收益率字段
+RANK_PERIODS = (
+    ('1m', '1_month_return'),
+    ('3m', '3_month_return'),
+    ('6m', '6_month_return'),
+    ('1y', '1_year_return'),
+    ('2y', '2_year_return'),
+    ('3y', '3_year_return'),
+)
+
+# 收益率绝对值小于该值视为缺失数据（通常是成立时间不足，而非真实的0%收益）
+MIN_VALID_RETURN = 0.01
+
+# 4433法则阈值：长期（1年/2年/3年）前1/4，短期（6个月/3个月）前1/3
+LONG_TERM_THRESHOLD = 25
+SHORT_TERM_THRESHOLD = 33.33
+
+
+# FundBasicInfo 上的收益率列 -> performance_json 中的收益率字段
+RETURN_COLUMNS = {f'return_{period}': json_key for period, json_key in RANK_PERIODS}
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_return_columns(performance) -> dict:
+    """从业绩数据中取出各阶段收益率，返回 {'return_1m': float|None, ...}，写库时与 performance_json 一起更新"""
+    if not isinstance(performance, dict):
+        performance = {}
+    return {column: _to_float(performance.get(json_key)) for column, json_key in RETURN_COLUMNS.items()}
+
+
+def _return_expr(period: str) -> str:
+    """收益率为空或接近 0 的视为缺失（NULL）"""
+    column = f'return_{period}'
+    return f"CASE WHEN ABS({column}) >= {MIN_VALID_RETURN} THEN {column} END"
+
+
+def _window_exprs(period: str) -> str:
+    """名次与有效基金数；NULL 在降序中排在最后，不占用有效名次"""
+    column = f'ret_{period}'
+    return (f"ROW_NUMBER() OVER (PARTITION BY fund_type ORDER BY {column} DESC, id) AS rn_{period}, "
+            f"COUNT({column}) OVER by_type AS cnt_{period}")
+
+
+def _rank_expr(period: str) -> str:
+    """
+    同类排名百分位 = 名次 / 有效基金数 * 100（收益高排名靠前，值越小越好）
+    有效基金不足 2 只的周期不排名
+    """
+    return (f"CASE WHEN ret_{period} IS NOT NULL AND cnt_{period} >= 2 "
+            f"THEN ROUND(CAST(rn_{period} AS REAL) / cnt_{period} * 100, 2) END")
+
+
+def build_ranking_sql() -> str:
+    returns = ',\n            '.join(f"{_return_expr(period)} AS ret_{period}" for period, _ in RANK_PERIODS)
+    windows = ',\n            '.join(_window_exprs(period) for period, _ in RANK_PERIODS)
+    ranks = ',\n            '.join(f"{_rank_expr(period)} AS rank_pct_{period}" for period, _ in RANK_PERIODS)
+    rank_columns = ', '.join(f'rank_pct_{period}' for period, _ in RANK_PERIODS)
+    ret_columns = ', '.join(f'ret_{period}' for period, _ in RANK_PERIODS)
+    updates = ',\n        '.join(
+        # 本次未能排名的周期保留原值，与逐只更新时只写入有排名字段的行为一致
+        f"rank_pct_{period} = COALESCE(excluded.rank_pct_{period}, fund_screening_rank.rank_pct_{period})"
+        for period, _ in RANK_PERIODS
+    )
+    # 窗口函数先在 windowed 中各算一次，再由 ranked 组合成百分位，避免同一窗口在表达式中重复求值
+    return f"""
+    WITH perf AS (
+        SELECT id, fund_code, fund_type,
+            {returns}
+        FROM fund_basic_info
+        WHERE fund_type IS NOT NULL AND fund_type != '' AND performance_json IS NOT NULL
+    ),
+    windowed AS (
+        SELECT fund_code, {ret_columns},
+            COUNT(*) OVER by_type AS type_total,
+            {windows}
+        FROM perf
+        WINDOW by_type AS (PARTITION BY fund_type)
+    ),
+    ranked AS (
+        SELECT fund_code,
+            {ranks}
+        FROM windowed
+        WHERE type_total >= 2
+    )
+    INSERT INTO fund_screening_rank (fund_code, {rank_columns}, pass_4433, updated_time)
+    SELECT fund_code, {rank_columns},
+        CASE WHEN rank_pct_1y <= {LONG_TERM_THRESHOLD}
+              AND (rank_pct_2y IS NULL OR rank_pct_2y <= {LONG_TERM_THRESHOLD})
+              AND (rank_pct_3y IS NULL OR rank_pct_3y <= {LONG_TERM_THRESHOLD})
+              AND rank_pct_6m <= {SHORT_TERM_THRESHOLD}
+              AND rank_pct_3m <= {SHORT_TERM_THRESHOLD}
+        THEN 1 ELSE 0 END,
+        :now
+    FROM ranked
+    WHERE true
+    ON CONFLICT(fund_code) DO UPDATE SET
+        {updates},
+        pass_4433 = excluded.pass_4433,
+        updated_time = excluded.updated_time
+    """
+
+
+SAME_TYPE_RANKING_SQL = build_ranking_sql()
+
+
+def ranking_params() -> dict:
+    """SQL 参数；时间格式与 SQLAlchemy 的 SQLite DateTime 存储格式一致"""
+    return {'now': datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')}
@@ -169,11 +169,11 @@ class BochaSearchProvider(BaseSearchProvider):
     
     def _do_search(self, query: str, api_key: str, max_results: int) -> SearchResponse:
         try:
-            import requests
+            from http_client import get_http_client
             url = "https://api.bocha.cn/v1/web-search"
             headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
             payload = {"query": query, "freshness": "oneMonth", "summary": True, "count": min(max_results, 10)}
-            response = requests.post(url, headers=headers, json=payload, timeout=10)
+            response = get_http_client().post(url, headers=headers, json=payload, timeout=10)
             if response.status_code != 200:
                 return SearchResponse(query, [], self.name, False, f"HTTP {response.status_code}")
             
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+并发请求合并（singleflight）
+同一个 key 同时只执行一次，其余并发调用者等待并共享同一个结果（或异常），
+用于避免多个页面/用户同时打开同一只基金时重复请求上游与重复写库
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """进程内的在途请求表"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _namespace(key: Hashable) -> str:
+        # key 为元组时第一项作为统计分类，如 ('detail', '000001')
+        return str(key[0]) if isinstance(key, tuple) and key else 'default'
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """执行 fn(*args, **kwargs)；若同一 key 已在执行中，则等待其结果"""
+        namespace = self._namespace(key)
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {'calls': 0, 'executions': 0, 'deduplicated': 0})
+            stats['calls'] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                stats['executions'] += 1
+            else:
+                stats['deduplicated'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_namespace = {name: dict(stats) for name, stats in self._stats.items()}
+            in_flight = len(self._calls)
+        return {
+            'in_flight': in_flight,
+            'deduplicated': sum(s['deduplicated'] for s in by_namespace.values()),
+            'by_namespace': by_namespace,
+        }
+
+
+# 单例模式
+_singleflight = SingleFlight()
+
+
+def get_singleflight() -> SingleFlight:
+    """获取进程内共享的 singleflight 实例"""
+    return _singleflight
@@ -1,9 +1,10 @@
-import requests
 import json
 import threading
 import time
 import os
 
+from http_client import get_http_client
+
 class StockService:
     _instance = None
     _lock = threading.Lock()
@@ -79,7 +80,7 @@ class StockService:
     def _fetch_hk_stocks(self):
         url = "https://api.biyingapi.com/hk/list/all/biyinglicence"
         try:
-            response = requests.get(url, timeout=30)
+            response = get_http_client().get(url, timeout=30)
             if response.status_code == 200:
                 data = response.json()
                 for item in data:
@@ -98,7 +99,7 @@ class StockService:
     def _fetch_ashare_stocks(self):
         url = "https://api.mairuiapi.com/hslt/list/LICENCE-66D8-9F96-0C7F0FBCD073"
         try:
-            response = requests.get(url, timeout=30)
+            response = get_http_client().get(url, timeout=30)
             if response.status_code == 200:
                 data = response.json()
                 for item in data:
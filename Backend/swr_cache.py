@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据内存缓存（stale-while-revalidate）
+- 有效期内直接返回缓存（hit）
+- 过期后 CACHE_MAX_STALE 秒内继续返回旧数据（stale），同时在后台刷新：同一 key 同时只有一个刷新任务
+- 没有缓存或旧数据超过 CACHE_MAX_STALE 时由调用方同步加载（miss），
+  同一 key 的并发加载经 singleflight 合并，只请求一次上游
+- 刷新失败（loader 没有写入新缓存）时旧数据继续使用，REFRESH_RETRY_INTERVAL 秒后再尝试
+loader 负责请求上游并通过 set() 写入缓存（缓存时间由调用方按数据源与交易日历决定），返回本次结果
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from singleflight import get_singleflight
+
+# 过期数据最多继续使用的时间（秒）
+CACHE_MAX_STALE = float(os.getenv('MARKET_CACHE_MAX_STALE', '300'))
+
+# 后台刷新失败后，再次尝试前的等待时间（秒）
+REFRESH_RETRY_INTERVAL = 10.0
+
+# 后台刷新线程数（所有缓存共用）
+REFRESH_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# 已创建的缓存（运行指标使用）
+_caches: Dict[str, 'SWRCache'] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+    return _executor
+
+
+class SWRCache:
+    """带过期时间的内存缓存，过期后在限定时间内先返回旧数据再后台刷新"""
+
+    def __init__(self, name: str, max_stale: float = CACHE_MAX_STALE):
+        self.name = name
+        self.max_stale = max_stale
+        self._entries: Dict[Hashable, Tuple[Any, float]] = {}   # key -> (数据, 过期时间戳)
+        self._refreshing: Set[Hashable] = set()
+        self._retry_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'refresh_failures': 0}
+        _caches[name] = self
+
+    def set(self, key: Hashable, data: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+            self._retry_at.pop(key, None)
+
+    def expiry(self, key: Hashable) -> Optional[float]:
+        """缓存的过期时间戳（time.time()），没有缓存时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """读取缓存；过期时返回旧数据并后台刷新，没有可用数据时调用 loader 同步加载"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                data, expire_time = entry
+                if now < expire_time:
+                    self.stats['hits'] += 1
+                    return data
+                if now < expire_time + self.max_stale:
+                    self.stats['stale'] += 1
+                    if key not in self._refreshing and now >= self._retry_at.get(key, 0):
+                        self._refreshing.add(key)
+                        _get_executor().submit(self._refresh, key, loader, expire_time)
+                    return data
+                del self._entries[key]
+            self.stats['misses'] += 1
+        return get_singleflight().do((self.name, key), loader)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], expire_time: float):
+        try:
+            get_singleflight().do((self.name, key), loader)
+        except Exception as e:
+            print(f"[缓存] {self.name}/{key} 后台刷新失败: {e}")
+        with self._lock:
+            self._refreshing.discard(key)
+            self.stats['refreshes'] += 1
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= expire_time:
+                self.stats['refresh_failures'] += 1
+                self._retry_at[key] = time.time() + REFRESH_RETRY_INTERVAL
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._retry_at.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            lookups = self.stats['hits'] + self.stats['stale'] + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self._entries),
+                'expired_entries': sum(1 for _, expire_time in self._entries.values() if expire_time <= now),
+                'refreshing': len(self._refreshing),
+                'hit_rate': round((self.stats['hits'] + self.stats['stale']) / lookups, 4) if lookups else None,
+                'max_stale': self.max_stale,
+            }
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """所有行情缓存的运行指标"""
+    return {name: cache.get_stats() for name, cache in _caches.items()}
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+沪深交易所交易日历与交易时段
+- 交易日：周一至周五，除去交易所公布的节假日休市（本地节假日表，可用 TRADING_HOLIDAYS_FILE 补充）
+- 交易时段：集合竞价 9:15-9:30，连续竞价 9:30-11:30 / 13:00-15:00，午间休市 11:30-13:00
+- 行情缓存时间由交易时段推导：交易时段内使用数据源自身的缓存时间，
+  休市（午休、收盘后、周末与节假日）时缓存到下一次开盘，数据在此期间不会变化
+  收盘后保留 SETTLE_MINUTES 分钟按交易时段处理，等待收盘数据落定
+"""
+
+import json
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional, Set
+
+# 连续竞价时段
+SESSIONS = ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0)))
+
+# 开盘集合竞价开始时间（行情自此开始变化）
+CALL_AUCTION_START = time(9, 15)
+
+# 每个时段结束后仍按交易时段处理的分钟数（收盘价、成交额等统计落定）
+SETTLE_MINUTES = 5
+
+# 交易所休市日（仅工作日；周末本身休市，调休上班的周六、周日交易所也不开市）
+# 来源：上交所、深交所年度休市安排公告
+HOLIDAYS = {
+    2025: (
+        '2025-01-01',
+        '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31', '2025-02-03', '2025-02-04',
+        '2025-04-04',
+        '2025-05-01', '2025-05-02', '2025-05-05',
+        '2025-06-02',
+        '2025-10-01', '2025-10-02', '2025-10-03', '2025-10-06', '2025-10-07', '2025-10-08',
+    ),
+    2026: (
+        '2026-01-01', '2026-01-02',
+        '2026-02-16', '2026-02-17', '2026-02-18', '2026-02-19', '2026-02-20', '2026-02-23',
+        '2026-04-06',
+        '2026-05-01', '2026-05-04', '2026-05-05',
+        '2026-06-19',
+        '2026-09-25',
+        '2026-10-01', '2026-10-02', '2026-10-05', '2026-10-06', '2026-10-07',
+    ),
+}
+
+# 补充休市日文件：JSON 数组 ["2027-01-01", ...]，用于新年度公告发布后无需改代码
+TRADING_HOLIDAYS_FILE = os.getenv('TRADING_HOLIDAYS_FILE')
+
+_holidays: Optional[Set[date]] = None
+_known_years: Set[int] = set()
+_warned_years: Set[int] = set()
+_lock = threading.Lock()
+
+
+def _parse_dates(values: Iterable[str]) -> Set[date]:
+    return {date.fromisoformat(value) for value in values}
+
+
+def _load_holidays() -> Set[date]:
+    global _holidays
+    if _holidays is None:
+        with _lock:
+            if _holidays is None:
+                holidays = set()
+                for year, days in HOLIDAYS.items():
+                    holidays |= _parse_dates(days)
+                    _known_years.add(year)
+                if TRADING_HOLIDAYS_FILE and os.path.exists(TRADING_HOLIDAYS_FILE):
+                    try:
+                        with open(TRADING_HOLIDAYS_FILE, 'r', encoding='utf-8') as f:
+                            extra = _parse_dates(json.load(f))
+                        holidays |= extra
+                        _known_years.update(day.year for day in extra)
+                    except Exception as e:
+                        print(f"读取休市日文件失败 {TRADING_HOLIDAYS_FILE}: {e}")
+                _holidays = holidays
+    return _holidays
+
+
+def is_trading_day(day: date) -> bool:
+    """是否为交易日；节假日表未覆盖的年份只按周末判断"""
+    if day.weekday() >= 5:
+        return False
+    holidays = _load_holidays()
+    if day.year not in _known_years and day.year not in _warned_years:
+        _warned_years.add(day.year)
+        print(f"交易日历未包含 {day.year} 年休市安排，仅按周末判断（可通过 TRADING_HOLIDAYS_FILE 补充）")
+    return day not in holidays
+
+
+def market_phase(now: Optional[datetime] = None) -> str:
+    """
+    当前所处阶段：
+    pre_open 集合竞价 / morning 上午连续竞价 / lunch_break 午间休市 / afternoon 下午连续竞价 / closed 休市
+    """
+    now = now or datetime.now()
+    if not is_trading_day(now.date()):
+        return 'closed'
+    current = now.time()
+    (morning_start, morning_end), (afternoon_start, afternoon_end) = SESSIONS
+    if CALL_AUCTION_START <= current < morning_start:
+        return 'pre_open'
+    if morning_start <= current < morning_end:
+        return 'morning'
+    if morning_end <= current < afternoon_start:
+        return 'lunch_break'
+    if afternoon_start <= current < afternoon_end:
+        return 'afternoon'
+    return 'closed'
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    """是否处于连续竞价时段（基金实时估值只在此期间更新）"""
+    return market_phase(now) in ('morning', 'afternoon')
+
+
+def _live_windows(day: date):
+    """当天行情会变化的时间窗口：[集合竞价/时段开始, 时段结束 + SETTLE_MINUTES)"""
+    settle = timedelta(minutes=SETTLE_MINUTES)
+    for index, (start, end) in enumerate(SESSIONS):
+        window_start = datetime.combine(day, CALL_AUCTION_START if index == 0 else start)
+        yield window_start, datetime.combine(day, end) + settle
+
+
+def is_market_live(now: Optional[datetime] = None) -> bool:
+    """行情是否可能变化（交易时段及其后的落定时间）"""
+    now = now or datetime.now()
+    return next_live_start(now) == now
+
+
+def next_live_start(now: Optional[datetime] = None) -> datetime:
+    """下一次行情开始变化的时间；当前已在交易时段内时返回 now"""
+    now = now or datetime.now()
+    day = now.date()
+    # 最长的休市（春节 + 周末）不超过两周
+    for _ in range(31):
+        if is_trading_day(day):
+            for window_start, window_end in _live_windows(day):
+                if now < window_end:
+                    return max(now, window_start)
+        day += timedelta(days=1)
+    return now + timedelta(days=1)
+
+
+def expires_at(fetched_at: datetime, live_ttl: float, max_ttl: Optional[float] = None) -> datetime:
+    """
+    在 fetched_at 获取的数据的过期时间
+    交易时段内为 live_ttl 秒后；休市时到下一次开盘为止（不少于 live_ttl，max_ttl 为上限）
+    """
+    live_expiry = fetched_at + timedelta(seconds=live_ttl)
+    if is_market_live(fetched_at):
+        return live_expiry
+    expiry = max(next_live_start(fetched_at), live_expiry)
+    if max_ttl is not None:
+        expiry = min(expiry, fetched_at + timedelta(seconds=max(max_ttl, live_ttl)))
+    return expiry
+
+
+def cache_ttl(live_ttl: float, max_ttl: Optional[float] = None, now: Optional[datetime] = None) -> float:
+    """此刻写入的缓存应保留的秒数（见 expires_at）"""
+    now = now or datetime.now()
+    return (expires_at(now, live_ttl, max_ttl) - now).total_seconds()
+
+
+if __name__ == '__main__':
+    current = datetime.now()
+    print(f"当前: {current:%Y-%m-%d %H:%M:%S} 阶段: {market_phase(current)} 交易日: {is_trading_day(current.date())}")
+    print(f"下一次开盘: {next_live_start(current):%Y-%m-%d %H:%M}")
+    for ttl in (60, 300):
+        print(f"缓存 {ttl}s 的数据此刻写入后保留 {cache_ttl(ttl):.0f}s")
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+自选列表读取与响应快照
+- 自选基金与实时估值一条 LEFT JOIN 查询读取（替代逐只查询估值的 N+1）
+- 数据版本由一条聚合查询得到（自选/分组的数量与最近更新时间、自选基金估值的最近更新时间），
+  版本即 ETag：轮询时版本未变化直接返回 304，不再查询明细与序列化
+- 可选的进程内快照缓存最近一个版本的响应体，版本未变化时不同客户端共享同一份序列化结果
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import FundEstimate, FundWatchlist, FundWatchlistGroup
+
+# 设置 WATCHLIST_SNAPSHOT=0 关闭进程内响应快照（ETag / 304 不受影响）
+WATCHLIST_SNAPSHOT_ENABLED = os.getenv('WATCHLIST_SNAPSHOT', '1') != '0'
+
+WATCHLIST_VERSION_SQL = text("""
+    SELECT
+        (SELECT count(*) || ':' || ifnull(max(updated_time), '') FROM fund_watchlist),
+        (SELECT count(*) || ':' || ifnull(max(updated_time), '') FROM fund_watchlist_group),
+        (SELECT ifnull(max(e.updated_time), '') FROM fund_estimate e
+            JOIN fund_watchlist w ON w.fund_code = e.fund_code)
+""")
+
+
+def watchlist_etag(db: Session) -> str:
+    """当前自选数据版本对应的 ETag（任一自选、分组或自选基金估值变化时改变）"""
+    version = db.execute(WATCHLIST_VERSION_SQL).fetchone()
+    return hashlib.sha1('|'.join(version).encode('utf-8')).hexdigest()
+
+
+def build_watchlist_body(db: Session) -> str:
+    """查询分组与自选基金（含估值）并序列化为响应 JSON"""
+    groups = db.query(
+        FundWatchlistGroup.id, FundWatchlistGroup.name, FundWatchlistGroup.sort_order
+    ).order_by(FundWatchlistGroup.sort_order).all()
+
+    rows = db.query(
+        FundWatchlist.fund_code, FundWatchlist.fund_name, FundWatchlist.fund_type,
+        FundWatchlist.group_id, FundWatchlist.sort_order, FundWatchlist.created_time,
+        FundEstimate.net_worth, FundEstimate.net_worth_date, FundEstimate.estimate_value,
+        FundEstimate.estimate_change, FundEstimate.estimate_time
+    ).outerjoin(
+        FundEstimate, FundEstimate.fund_code == FundWatchlist.fund_code
+    ).order_by(FundWatchlist.sort_order).all()
+
+    groups_data = [{'id': group.id, 'name': group.name, 'sort_order': group.sort_order} for group in groups]
+    funds_data = [
+        {
+            'fund_code': row.fund_code,
+            'fund_name': row.fund_name,
+            'fund_type': row.fund_type,
+            'group_id': row.group_id,
+            'sort_order': row.sort_order,
+            'created_time': row.created_time.isoformat() if row.created_time else None,
+            'net_worth': row.net_worth,
+            'net_worth_date': row.net_worth_date,
+            'estimate_value': row.estimate_value,
+            'estimate_change': row.estimate_change,
+            'estimate_time': row.estimate_time,
+        }
+        for row in rows
+    ]
+    return json.dumps({'groups': groups_data, 'data': funds_data}, ensure_ascii=False)
+
+
+class WatchlistSnapshot:
+    """最近一个版本的自选列表响应（ETag -> 响应体）"""
+
+    def __init__(self, enabled: bool = WATCHLIST_SNAPSHOT_ENABLED):
+        self.enabled = enabled
+        self._entry: Optional[Tuple[str, str]] = None
+        self._lock = threading.Lock()
+        self.stats = {'not_modified': 0, 'snapshot_hits': 0, 'builds': 0}
+
+    def record(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_body(self, db: Session, etag: str) -> str:
+        """返回该版本的响应体；快照版本一致时直接复用"""
+        if self.enabled:
+            with self._lock:
+                entry = self._entry
+            if entry and entry[0] == etag:
+                self.record('snapshot_hits')
+                return entry[1]
+        body = build_watchlist_body(db)
+        self.record('builds')
+        if self.enabled:
+            with self._lock:
+                self._entry = (etag, body)
+        return body
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'enabled': self.enabled}
@@ -155,6 +155,11 @@ export const screeningAPI = {
     return api.post('/screening/update', options)
   },
   
+  // 快速刷新收益（排行榜批量获取，不抓取净值历史）
+  fastRefresh(options = {}) {
+    return api.post('/screening/fast-refresh', options)
+  },
+  
   // 停止更新
   stopUpdate() {
     return api.post('/screening/stop')
@@ -247,4 +252,78 @@ export const marketAPI = {
   }
 }
 
+// ==================== 实时估值推送（SSE） ====================
+// 服务端统一轮询上游并推送有变化的估值；同一页面的各组件共用一条 EventSource 连接，
+// 各组件订阅的基金代码合并后提交给服务端，代码变化时重新建立连接（服务端会先推送已有估值）
+const estimateListeners = new Map()  // id -> { codes: Set, watchlist: boolean, onEstimates }
+let estimateListenerId = 0
+let estimateSource = null
+let estimateSourceQuery = ''
+let estimateSyncTimer = null
+
+const buildEstimateQuery = () => {
+  const codes = new Set()
+  let watchlist = false
+  estimateListeners.forEach(listener => {
+    listener.codes.forEach(code => codes.add(code))
+    watchlist = watchlist || listener.watchlist
+  })
+  if (codes.size === 0 && !watchlist) return ''
+  const params = new URLSearchParams()
+  if (codes.size) params.set('codes', [...codes].sort().join(','))
+  if (watchlist) params.set('watchlist', '1')
+  return params.toString()
+}
+
+const syncEstimateStream = () => {
+  estimateSyncTimer = null
+  const query = buildEstimateQuery()
+  if (query === estimateSourceQuery) return
+  if (estimateSource) {
+    estimateSource.close()
+    estimateSource = null
+  }
+  estimateSourceQuery = query
+  if (!query) return
+
+  estimateSource = new EventSource(`${API_BASE_URL}/estimates/stream?${query}`)
+  estimateSource.onmessage = event => {
+    let payload
+    try {
+      payload = JSON.parse(event.data)
+    } catch (e) {
+      return
+    }
+    if (payload.type !== 'estimates') return
+    estimateListeners.forEach(listener => listener.onEstimates(payload.estimates, payload.time))
+  }
+}
+
+// 同一时刻的多次订阅变化合并为一次重连
+const scheduleEstimateSync = () => {
+  if (!estimateSyncTimer) estimateSyncTimer = setTimeout(syncEstimateStream, 50)
+}
+
+export const estimateStreamAPI = {
+  // 订阅估值推送：onEstimates({ fund_code: 估值 }, 推送时间)
+  // 返回 { update(codes), close() }，组件关注的基金变化或卸载时调用
+  subscribe({ codes = [], watchlist = false } = {}, onEstimates) {
+    const id = ++estimateListenerId
+    estimateListeners.set(id, { codes: new Set(codes), watchlist, onEstimates })
+    scheduleEstimateSync()
+    return {
+      update(nextCodes) {
+        const listener = estimateListeners.get(id)
+        if (!listener) return
+        listener.codes = new Set(nextCodes)
+        scheduleEstimateSync()
+      },
+      close() {
+        estimateListeners.delete(id)
+        scheduleEstimateSync()
+      }
+    }
+  }
+}
+
 export default api
\ No newline at end of file